@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import typing_extensions as te
+
+from debian_repo_scrape.fetch import FetchScheduler, scheduler_scope
+from debian_repo_scrape.instrumentation import Observer, RequestEvent, observe
+from debian_repo_scrape.scrape import Repository, scrape_flat_repo, scrape_repo
+from debian_repo_scrape.utils import response_cache_scope
+from debian_repo_scrape.verify import VerificationModes
+
+log = logging.getLogger(__name__)
+
+_SIZE_SUFFIXES = {"": 1, "k": 2**10, "m": 2**20, "g": 2**30}
+
+
+@dataclass(frozen=True)
+class RepoSpec:
+    """A repository of a batch and how it is scraped"""
+
+    url: str
+    key: str | None = None
+    """Path of the public key file, not needed without verification"""
+    mode: VerificationModes | str | te.Literal[False] = VerificationModes.STRICT
+    flat: bool = False
+    name: str = ""
+    """Names the snapshot file, derived from the url if empty"""
+    in_release_first: bool = False
+    sources: bool = False
+
+    @property
+    def slug(self) -> str:
+        name = self.name or re.sub(r"^\w+://", "", self.url)
+        return re.sub(r"[^\w.-]+", "_", name.strip("/")).strip("_")
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    spec: RepoSpec
+    repository: Repository | None
+    error: Exception | None
+    requests: int
+    bytes: int
+    """Transferred bytes, responses answered from the cache don't count"""
+    wall_time: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def throughput(self) -> float:
+        """Transferred bytes per second"""
+        return self.bytes / self.wall_time if self.wall_time else 0.0
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {
+            "name": self.spec.slug,
+            "url": self.spec.url,
+            "ok": self.ok,
+            "error": None if self.error is None else repr(self.error),
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "wall_time": self.wall_time,
+            "repository": None
+            if self.repository is None
+            else dataclasses.asdict(self.repository),
+        }
+
+    def __str__(self) -> str:
+        packages = len(self.repository.packages) if self.repository else 0
+        return (
+            f"{self.spec.slug:<40} {'ok' if self.ok else 'FAILED':<6}"
+            f" {packages:>8} packages {self.requests:>6} requests"
+            f" {self.bytes / 2**20:>9.1f} MiB {self.wall_time:>8.2f} s"
+            f" {self.throughput / 2**20:>8.2f} MiB/s"
+        )
+
+
+def load_manifest(path: str) -> list[RepoSpec]:
+    """
+    Read the repositories of a batch from a JSON file, a list of objects with
+    the fields of RepoSpec or an object with such a list under "repositories".
+    Key paths are relative to the manifest.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest["repositories"]
+    base = os.path.dirname(os.path.abspath(path))
+    specs: list[RepoSpec] = []
+    for entry in manifest:
+        if entry.get("key"):
+            entry = {**entry, "key": os.path.join(base, entry["key"])}
+        specs.append(RepoSpec(**entry))
+    return specs
+
+
+class _RepoMeter(Observer):
+    """Counts the requests of every repository of a batch by url prefix"""
+
+    def __init__(self, urls: t.Iterable[str]) -> None:
+        # the longest prefix wins for repositories below other repositories
+        self._prefixes = sorted({url.strip("/") for url in urls}, key=len)[::-1]
+        self._lock = threading.Lock()
+        self.requests: dict[str, int] = {}
+        self.bytes: dict[str, int] = {}
+
+    def on_request(self, event: RequestEvent):
+        if event.cache_hit:
+            return
+        prefix = next(
+            (
+                p
+                for p in self._prefixes
+                if event.url == p or event.url.startswith(f"{p}/")
+            ),
+            None,
+        )
+        if prefix is None:
+            return
+        with self._lock:
+            self.requests[prefix] = self.requests.get(prefix, 0) + 1
+            self.bytes[prefix] = self.bytes.get(prefix, 0) + event.bytes
+
+
+def _write_snapshot(result: BatchResult, output_dir: str):
+    path = os.path.join(output_dir, f"{result.spec.slug}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(result.to_dict(), f, default=str)
+    os.replace(tmp_path, path)
+
+
+def _scrape(spec: RepoSpec) -> Repository:
+    key = spec.key or b""
+    if spec.flat:
+        return scrape_flat_repo(
+            spec.url, key, verify=spec.mode, in_release_first=spec.in_release_first
+        )
+    return scrape_repo(
+        spec.url,
+        key,
+        verify=spec.mode,
+        in_release_first=spec.in_release_first,
+        sources=spec.sources,
+    )
+
+
+def scrape_batch(
+    specs: t.Sequence[RepoSpec],
+    workers: int = 4,
+    total_concurrency: int = 16,
+    host_concurrency: int = 4,
+    bandwidth: float | None = None,
+    output_dir: str | None = None,
+    on_result: t.Callable[[BatchResult], t.Any] | None = None,
+) -> list[BatchResult]:
+    """
+    Scrape many repositories, workers of them at a time. All requests share
+    one scheduler: at most total_concurrency requests run at once, shared
+    fairly between the hosts, at most host_concurrency of them to one host,
+    and bandwidth limits the transferred bytes per second.
+
+    Every result is written to output_dir as <name>.json and passed to
+    on_result as soon as its repository is done. A failing repository does
+    not stop the batch, its result has the error.
+    The scheduler and the cached responses of the batch are dropped when it
+    is done.
+    """
+    meter = _RepoMeter(spec.url for spec in specs)
+    scheduler = FetchScheduler(
+        max_concurrency=host_concurrency,
+        total_concurrency=total_concurrency,
+        bandwidth=bandwidth,
+    )
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    def run(spec: RepoSpec) -> BatchResult:
+        prefix = spec.url.strip("/")
+        start = time.perf_counter()
+        repository: Repository | None = None
+        error: Exception | None = None
+        try:
+            repository = _scrape(spec)
+        except Exception as e:
+            log.warning(f"Scraping {spec.url} failed: {e!r}")
+            error = e
+        result = BatchResult(
+            spec=spec,
+            repository=repository,
+            error=error,
+            requests=meter.requests.get(prefix, 0),
+            bytes=meter.bytes.get(prefix, 0),
+            wall_time=time.perf_counter() - start,
+        )
+        if output_dir is not None:
+            _write_snapshot(result, output_dir)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    with scheduler_scope(scheduler), observe(meter), response_cache_scope():
+        with ThreadPoolExecutor(workers) as executor:
+            return list(executor.map(run, specs))
+
+
+def _summary(results: list[BatchResult]) -> str:
+    total_bytes = sum(result.bytes for result in results)
+    failed = sum(not result.ok for result in results)
+    return (
+        f"{len(results)} repositories, {failed} failed,"
+        f" {total_bytes / 2**20:.1f} MiB transferred"
+    )
+
+
+def format_report(results: t.Iterable[BatchResult]) -> str:
+    """One line with the throughput of every repository and a summary"""
+    results = list(results)
+    return "\n".join([*(str(result) for result in results), _summary(results)])
+
+
+def _size(value: str) -> float:
+    match = re.match(r"^(\d+(?:\.\d+)?)([kmg]?)$", value.strip().lower())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid size {value!r}")
+    return float(match.group(1)) * _SIZE_SUFFIXES[match.group(2)]
+
+
+def main(argv: t.Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m debian_repo_scrape.batch",
+        description="Scrape the repositories of a manifest concurrently",
+    )
+    parser.add_argument("manifest", help="JSON file with the repositories")
+    parser.add_argument("-o", "--output", help="directory for the results")
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=16,
+        help="requests at once to all hosts together",
+    )
+    parser.add_argument(
+        "--host-concurrency", type=int, default=4, help="requests at once to a host"
+    )
+    parser.add_argument(
+        "--bandwidth", type=_size, help="bytes per second, e.g. 500k or 10M"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    results = scrape_batch(
+        load_manifest(args.manifest),
+        workers=args.workers,
+        total_concurrency=args.max_concurrency,
+        host_concurrency=args.host_concurrency,
+        bandwidth=args.bandwidth,
+        output_dir=args.output,
+        on_result=lambda result: print(result, flush=True),
+    )
+    print(_summary(results))
+    return 0 if all(result.ok for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import array
+import heapq
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import typing as t
+from urllib.parse import urljoin
+
+from debian_repo_scrape.instrumentation import phase
+from debian_repo_scrape.parsing import iter_decompressed
+from debian_repo_scrape.utils import (
+    _iter_file_abs,
+    _iter_verified,
+    _release_indexes,
+    _suite_path,
+    get_release_file,
+)
+
+log = logging.getLogger(__name__)
+
+# magic, entries, offsets offset, locations offset
+_HEADER = struct.Struct("<8sQQQ")
+_MAGIC = b"DRSCIDX1"
+_OFFSET = struct.Struct("<Q")
+# the first lines of old Contents files explain the format and end with this line
+_HEADER_END_RE = re.compile(rb"^FILE\s+LOCATION$")
+_HEADER_MAX_LINES = 100
+
+
+def _parse_contents_line(line: bytes) -> tuple[bytes, bytes] | None:
+    line = line.rstrip()
+    separator = max(line.rfind(b" "), line.rfind(b"\t"))
+    if separator == -1:
+        return None
+    path = line[:separator].rstrip()
+    if path.startswith(b"./"):
+        path = path[2:]
+    return path.lstrip(b"/"), line[separator + 1 :]  # noqa: E203
+
+
+def _iter_lines(chunks: t.Iterable[bytes]) -> t.Iterator[bytes]:
+    rest = b""
+    for chunk in chunks:
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+
+def iter_contents(
+    chunks: t.Iterable[bytes], compression: str = ""
+) -> t.Iterator[tuple[bytes, bytes]]:
+    """
+    Stream (path, locations) from the chunks of a Contents file. locations are
+    comma separated qualified package names like b"admin/sudo,net/ssh".
+    """
+    # lines are held back until it is clear whether the file starts with a header
+    pending: list[bytes] | None = []
+    for line in _iter_lines(iter_decompressed(chunks, compression)):
+        if pending is None:
+            lines = [line]
+        elif _HEADER_END_RE.match(line.rstrip()):
+            pending = None
+            continue
+        else:
+            pending.append(line)
+            if len(pending) < _HEADER_MAX_LINES:
+                continue
+            lines, pending = pending, None
+        for line in lines:
+            entry = _parse_contents_line(line)
+            if entry is not None:
+                yield entry
+    for line in pending or ():
+        entry = _parse_contents_line(line)
+        if entry is not None:
+            yield entry
+
+
+class ContentsIndex:
+    """
+    A sorted, memory-mapped index from file paths to the packages that ship
+    them. Build it with ContentsIndexBuilder or build_contents_index.
+    """
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = os.fspath(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._entries, self._offsets, locations = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{self.path} is not a Contents index")
+        self._locations = self._mmap[locations:].decode().split("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return self._entries
+
+    def _offset(self, i: int) -> int:
+        return _OFFSET.unpack_from(self._mmap, self._offsets + i * _OFFSET.size)[0]
+
+    def _path(self, i: int) -> bytes:
+        start = self._offset(i)
+        return self._mmap[start : self._mmap.find(b"\0", start)]  # noqa: E203
+
+    def _entry(self, i: int) -> tuple[str, list[str]]:
+        start, end = self._offset(i), self._offset(i + 1)
+        separator = self._mmap.find(b"\0", start)
+        ids = struct.unpack_from(
+            f"<{(end - separator - 1) // 4}I", self._mmap, separator + 1
+        )
+        locations: list[str] = []
+        for id_ in ids:
+            for location in self._locations[id_].split(","):
+                if location not in locations:
+                    locations.append(location)
+        return self._mmap[start:separator].decode(), locations
+
+    def _lower_bound(self, path: bytes) -> int:
+        low, high = 0, self._entries
+        while low < high:
+            mid = (low + high) // 2
+            if self._path(mid) < path:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def locations(self, path: str) -> list[str]:
+        """Qualified names like "admin/sudo" of the packages that ship path"""
+        key = path.lstrip("/").encode()
+        i = self._lower_bound(key)
+        if i == self._entries or self._path(i) != key:
+            return []
+        return self._entry(i)[1]
+
+    def lookup(self, path: str) -> list[str]:
+        """Names of the packages that ship path"""
+        names = [location.rsplit("/", 1)[-1] for location in self.locations(path)]
+        return sorted(set(names), key=names.index)
+
+    def __contains__(self, path: object) -> bool:
+        return isinstance(path, str) and bool(self.locations(path))
+
+    def search(self, prefix: str) -> t.Iterator[tuple[str, list[str]]]:
+        """(path, locations) of all paths that start with prefix"""
+        key = prefix.lstrip("/").encode()
+        for i in range(self._lower_bound(key), self._entries):
+            if not self._path(i).startswith(key):
+                break
+            yield self._entry(i)
+
+
+class ContentsIndexBuilder:
+    """
+    Builds a ContentsIndex without holding all entries in memory.
+    Entries are sorted in runs of run_size that are merged on finish.
+    """
+
+    def __init__(self, path: str | os.PathLike, run_size: int = 500_000) -> None:
+        self.path = os.fspath(path)
+        self.run_size = run_size
+        self._locations: dict[bytes, int] = {}
+        self._run: list[bytes] = []
+        self._runs: list[t.IO[bytes]] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._run = []
+
+    def add(self, path: bytes, locations: bytes):
+        id_ = self._locations.setdefault(locations, len(self._locations))
+        self._run.append(b"%s\0%d\n" % (path, id_))
+        if len(self._run) >= self.run_size:
+            self._flush()
+
+    def add_all(self, entries: t.Iterable[tuple[bytes, bytes]]):
+        for path, locations in entries:
+            self.add(path, locations)
+
+    def _flush(self):
+        self._run.sort()
+        run = tempfile.TemporaryFile()
+        run.writelines(self._run)
+        run.seek(0)
+        self._runs.append(run)
+        self._run = []
+
+    def _merged(self) -> t.Iterator[tuple[bytes, list[int]]]:
+        if self._run or not self._runs:
+            self._flush()
+        current: bytes | None = None
+        ids: list[int] = []
+        for line in heapq.merge(*self._runs):
+            path, _, id_ = line.rstrip(b"\n").partition(b"\0")
+            if path != current:
+                if current is not None:
+                    yield current, ids
+                current, ids = path, []
+            if int(id_) not in ids:
+                ids.append(int(id_))
+        if current is not None:
+            yield current, ids
+
+    def finish(self) -> ContentsIndex:
+        """Write the index file and open it"""
+        offsets = array.array("Q")
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, 0, 0, 0))
+                position = _HEADER.size
+                for path, ids in self._merged():
+                    offsets.append(position)
+                    record = path + b"\0" + struct.pack(f"<{len(ids)}I", *ids)
+                    f.write(record)
+                    position += len(record)
+                offsets.append(position)
+                padding = -position % _OFFSET.size
+                f.write(b"\0" * padding)
+                offsets_offset = position + padding
+                if sys.byteorder == "big":
+                    offsets.byteswap()  # pragma: no cover
+                offsets.tofile(f)
+                locations_offset = offsets_offset + len(offsets) * _OFFSET.size
+                f.write(b"\n".join(self._locations))
+                f.seek(0)
+                f.write(
+                    _HEADER.pack(
+                        _MAGIC, len(offsets) - 1, offsets_offset, locations_offset
+                    )
+                )
+            os.replace(tmp_path, self.path)
+        finally:
+            self.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return ContentsIndex(self.path)
+
+
+def build_contents_index(
+    repo_url: str,
+    suite: str,
+    architecture: str,
+    path: str | os.PathLike,
+    include_all: bool = True,
+    in_release_first: bool = False,
+    run_size: int = 500_000,
+) -> ContentsIndex:
+    """
+    Stream the Contents files of a suite and architecture, including
+    Contents-all unless include_all is False, into an index at path.
+    The files are checked against the sizes and hash sums in the Release file.
+    """
+    release_file = get_release_file(repo_url, suite, in_release_first=in_release_first)
+    base_url = urljoin(repo_url.rstrip("/") + "/", _suite_path(suite))
+    release_url = urljoin(base_url, "Release")
+    architectures = {architecture, "all"} if include_all else {architecture}
+    files = _release_indexes(
+        release_file,
+        r"(?:.*/)?Contents-(?:%s)(\.\w+)?$" % "|".join(map(re.escape, architectures)),
+    )
+    if not files:
+        log.warning(f"No Contents files for {architecture} in {suite}")
+
+    with ContentsIndexBuilder(path, run_size) as builder:
+        for name, hashsums in sorted(files.items()):
+            url = urljoin(base_url, name)
+            compression = os.path.splitext(name)[1]
+            with phase("contents", suite=suite, url=url):
+                builder.add_all(
+                    iter_contents(
+                        _iter_verified(_iter_file_abs(url), hashsums, url, release_url),
+                        compression,
+                    )
+                )
+        return builder.finish()
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import dataclasses
+import itertools
+import json
+import os
+import typing as t
+from dataclasses import dataclass
+from enum import Enum
+
+from debian_repo_scrape.scrape import FlatSuite, Package, Repository
+
+_Key = t.Tuple[str, str, str, str]
+"""suite, component, package name and architecture"""
+
+
+class ChangeTypes(str, Enum):
+    ADDED = "added"
+    REMOVED = "removed"
+    UPDATED = "updated"
+
+
+@dataclass(frozen=True)
+class PackageChange:
+    type: ChangeTypes
+    suite: str
+    component: str
+    package: Package
+    """The added or updated package, for removals the removed one"""
+    previous: Package | None = None
+    """The package before an update"""
+
+
+def _same_package(old: Package, new: Package) -> bool:
+    # the date of every package changes with the Release file
+    return old == dataclasses.replace(new, date=old.date)
+
+
+def _diff_versions(
+    old: dict[str, Package], new: dict[str, Package]
+) -> t.Iterator[tuple[ChangeTypes, Package, Package | None]]:
+    """Compare the versions of one package, a single replaced version is an update"""
+    for version, package in new.items():
+        previous = old.get(version)
+        if previous is not None and not _same_package(previous, package):
+            yield ChangeTypes.UPDATED, package, previous
+    added = [package for version, package in new.items() if version not in old]
+    removed = [package for version, package in old.items() if version not in new]
+    if len(added) == 1 and len(removed) == 1:
+        yield ChangeTypes.UPDATED, added[0], removed[0]
+        return
+    for package in added:
+        yield ChangeTypes.ADDED, package, None
+    for package in removed:
+        yield ChangeTypes.REMOVED, package, None
+
+
+def _by_name(
+    packages: t.Iterable[Package],
+) -> dict[tuple[str, str], dict[str, Package]]:
+    index: dict[tuple[str, str], dict[str, Package]] = {}
+    for package in packages:
+        index.setdefault((package.name, package.architecture), {})[
+            package.version
+        ] = package
+    return index
+
+
+def diff_packages(
+    old: t.Iterable[Package], new: t.Iterable[Package]
+) -> t.Iterator[tuple[ChangeTypes, Package, Package | None]]:
+    """
+    Compare two lists of packages by name and architecture in linear time.
+    Yields (type, package, previous package) tuples.
+    """
+    old_index, new_index = _by_name(old), _by_name(new)
+    for key, new_versions in new_index.items():
+        yield from _diff_versions(old_index.get(key, {}), new_versions)
+    for key, old_versions in old_index.items():
+        if key not in new_index:
+            yield from _diff_versions(old_versions, {})
+
+
+def _components(
+    repository: Repository,
+) -> t.Iterator[tuple[str, str, list[Package]]]:
+    for suite in repository.suites:
+        if isinstance(suite, FlatSuite):
+            yield suite.name, "", [suite.package]
+            continue
+        for component in suite.components:
+            yield suite.name, component.name, component.packages
+
+
+def diff_repositories(old: Repository, new: Repository) -> t.Iterator[PackageChange]:
+    """
+    Yield the package changes between two snapshots of a repository.
+    Packages are matched by suite, component, name and architecture, every
+    component is compared in linear time.
+    """
+    old_components = {
+        (suite, component): packages for suite, component, packages in _components(old)
+    }
+    new_keys: set[tuple[str, str]] = set()
+    for suite, component, packages in _components(new):
+        new_keys.add((suite, component))
+        for change, package, previous in diff_packages(
+            old_components.get((suite, component), []), packages
+        ):
+            yield PackageChange(change, suite, component, package, previous)
+    for (suite, component), packages in old_components.items():
+        if (suite, component) not in new_keys:
+            for change, package, previous in diff_packages(packages, []):
+                yield PackageChange(change, suite, component, package, previous)
+
+
+def save_snapshot(repository: Repository, path: str | os.PathLike):
+    """
+    Write the packages of a repository to a snapshot file for diff_snapshots,
+    one JSON object per line, sorted by suite, component, name and architecture
+    """
+    records = sorted(
+        (
+            (
+                (suite, component, package.name, package.architecture, package.version),
+                package,
+            )
+            for suite, component, packages in _components(repository)
+            for package in packages
+        ),
+        key=lambda record: record[0],
+    )
+    tmp_path = f"{os.fspath(path)}.tmp"
+    with open(tmp_path, "w") as f:
+        for (suite, component, *_), package in records:
+            record = {"suite": suite, "component": component}
+            record.update(dataclasses.asdict(package))
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, path)
+
+
+def iter_snapshot(path: str | os.PathLike) -> t.Iterator[tuple[_Key, Package]]:
+    """Stream the packages of a snapshot file with their keys"""
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            suite, component = record.pop("suite"), record.pop("component")
+            package = Package(**record)
+            yield (suite, component, package.name, package.architecture), package
+
+
+def _groups(
+    records: t.Iterable[tuple[_Key, Package]], path: str | os.PathLike
+) -> t.Iterator[tuple[_Key, dict[str, Package]]]:
+    last: _Key | None = None
+    for key, group in itertools.groupby(records, key=lambda record: record[0]):
+        if last is not None and key <= last:
+            raise ValueError(f"{os.fspath(path)} is not a sorted snapshot")
+        last = key
+        yield key, {package.version: package for _, package in group}
+
+
+def diff_snapshots(
+    old_path: str | os.PathLike, new_path: str | os.PathLike
+) -> t.Iterator[PackageChange]:
+    """
+    Stream the changes between two snapshot files written by save_snapshot.
+    Both files are read once in parallel, so memory does not grow with the
+    size of the repository.
+    """
+    old_groups = _groups(iter_snapshot(old_path), old_path)
+    new_groups = _groups(iter_snapshot(new_path), new_path)
+    old = next(old_groups, None)
+    new = next(new_groups, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            assert old is not None
+            key, changes = old[0], _diff_versions(old[1], {})
+            old = next(old_groups, None)
+        elif old is None or new[0] < old[0]:
+            key, changes = new[0], _diff_versions({}, new[1])
+            new = next(new_groups, None)
+        else:
+            key, changes = new[0], _diff_versions(old[1], new[1])
+            old = next(old_groups, None)
+            new = next(new_groups, None)
+        for change, package, previous in changes:
+            yield PackageChange(change, key[0], key[1], package, previous)
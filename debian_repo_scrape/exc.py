@@ -18,7 +18,11 @@ class FileError(IntegrityError):
 
 class FileRequestError(FileError):
     def __init__(
-        self, file: str, status_code: str, file_mentioned_by: str | None = None, *args
+        self,
+        file: str,
+        status_code: str | int,
+        file_mentioned_by: str | None = None,
+        *args,
     ) -> None:
         self.status_code = status_code
         super().__init__(file, file_mentioned_by, *args)
@@ -51,3 +55,17 @@ class SHA1Invalid(HashInvalid):
 
 class SHA256Invalid(HashInvalid):
     hash_type = "SHA256"
+
+
+class SizeInvalid(HashInvalid):
+    hash_type = "Size"
+
+
+class SignatureInvalid(FileError):
+    def __init__(self, file: str, reason: str = "", *args) -> None:
+        self.reason = reason
+        super().__init__(file, None, *args)
+
+    def __str__(self) -> str:
+        reason = f": {self.reason}" if self.reason else ""
+        return f"Signature of {self.file} could not be verified{reason}"
@@ -0,0 +1,452 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import functools
+import logging
+import os
+import random
+import threading
+import time
+import typing as t
+import weakref
+from email.utils import parsedate_to_datetime
+from urllib.parse import unquote, urlsplit
+from urllib.request import url2pathname
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from debian_repo_scrape.instrumentation import phase
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+OVERLOAD_STATUS_CODES = frozenset((429, 503))
+
+
+def local_path(url: str) -> str | None:
+    """Return the local path of a file:// url or None for other urls"""
+    parts = urlsplit(url)
+    if parts.scheme != "file":
+        return None
+    return url2pathname(unquote(parts.path))
+
+
+class FileAdapter(BaseAdapter):
+    """
+    Transport adapter for file:// urls. Directories are answered with an
+    empty body and files that don't exist with status code 404.
+    """
+
+    def send(
+        self,
+        request: requests.PreparedRequest,
+        stream: bool = False,
+        timeout: float | tuple[float, float] | tuple[float, None] | None = None,
+        verify: bool | str = True,
+        cert: bytes | str | tuple[bytes | str, bytes | str] | None = None,
+        proxies: t.Mapping[str, str] | None = None,
+    ) -> requests.Response:
+        path = local_path(request.url or "")
+        resp = requests.Response()
+        resp.url = request.url or ""
+        resp.request = request
+        resp._content = b""
+        try:
+            if path is None:
+                raise FileNotFoundError
+            if os.path.isdir(path):
+                resp.headers["Content-Type"] = "inode/directory"
+            else:
+                with open(path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if request.method != "HEAD":
+                        resp._content = f.read()
+                resp.headers["Content-Type"] = "application/octet-stream"
+                resp.headers["Content-Length"] = str(size)
+            resp.status_code = 200
+        except FileNotFoundError:
+            resp.status_code = 404
+        except PermissionError:
+            resp.status_code = 403
+        return resp
+
+    def close(self):
+        pass
+
+
+class TokenBucket:
+    """Allows rate requests per second on average with bursts of up to burst"""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Bandwidth:
+    """
+    Allows rate bytes per second on average with bursts of up to burst bytes.
+    Transfers are charged once their size is known, requests wait until the
+    debt is paid off.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def consume(self, size: int):
+        with self._lock:
+            self._refill()
+            self._tokens -= size
+
+    def wait(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 0:
+                    return
+                wait = -self._tokens / self.rate
+            time.sleep(wait)
+
+
+class FairShare:
+    """
+    Limits the concurrent requests to all hosts together. Free slots are
+    handed to the waiting hosts in turn, so that a host with many queued
+    requests can't starve the others.
+    """
+
+    def __init__(self, slots: int) -> None:
+        self.slots = slots
+        self._in_flight = 0
+        # hosts with waiting requests, the first one gets the next slot
+        self._waiting: t.OrderedDict[str, int] = collections.OrderedDict()
+        self._condition = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self, host: str):
+        with self._condition:
+            self._waiting[host] = self._waiting.get(host, 0) + 1
+            while self._in_flight >= self.slots or next(iter(self._waiting)) != host:
+                self._condition.wait()
+            self._in_flight += 1
+            self._waiting[host] -= 1
+            if self._waiting[host]:
+                self._waiting.move_to_end(host)
+            else:
+                del self._waiting[host]
+            self._condition.notify_all()
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit of a host that grows additively while responses are
+    fast and shrinks multiplicatively on overload responses, errors or
+    when latency rises well above its baseline
+    """
+
+    def __init__(
+        self,
+        initial: int = 2,
+        maximum: int = 8,
+        minimum: int = 1,
+        latency_tolerance: float = 2.0,
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(max(minimum, min(initial, maximum)))
+        self._in_flight = 0
+        self._baseline: float | None = None
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, latency: float | None = None, overloaded: bool = False):
+        """
+        Give back a slot. Pass the latency of a successful request, or
+        overloaded for failed ones.
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if overloaded:
+                self._limit = max(self.minimum, self._limit / 2)
+            elif latency is not None:
+                if self._baseline is None or latency < self._baseline:
+                    self._baseline = latency
+                else:
+                    # let the baseline follow slow, lasting latency changes
+                    self._baseline = 0.95 * self._baseline + 0.05 * latency
+                if latency > self._baseline * self.latency_tolerance:
+                    self._limit = max(self.minimum, self._limit * 0.9)
+                else:
+                    self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+
+class FetchScheduler:
+    """
+    Sends GET and HEAD requests with per-host adaptive concurrency limits,
+    optional per-host rate limiting, timeouts and retries with jittered
+    exponential backoff on connection errors and retryable status codes.
+
+    total_concurrency limits the requests to all hosts together and shares
+    them fairly between the hosts, bandwidth limits the transferred bytes
+    per second of all requests.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        initial_concurrency: int = 2,
+        rate: float | None = None,
+        burst: int = 1,
+        timeout: float | tuple[float, float] = (10.0, 60.0),
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        session: requests.Session | None = None,
+        total_concurrency: int | None = None,
+        bandwidth: float | None = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = initial_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=max_concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.mount("file://", FileAdapter())
+        self.session = session
+        self._share = FairShare(total_concurrency) if total_concurrency else None
+        self._bandwidth = Bandwidth(bandwidth) if bandwidth else None
+        self._limits: dict[str, AdaptiveLimit] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def limit(self, host: str) -> AdaptiveLimit:
+        with self._lock:
+            limit = self._limits.get(host)
+            if limit is None:
+                limit = self._limits[host] = AdaptiveLimit(
+                    self.initial_concurrency, self.max_concurrency
+                )
+            return limit
+
+    def _bucket(self, host: str) -> TokenBucket | None:
+        if self.rate is None:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def throttle(self, size: int):
+        """
+        Charge the bytes of a streamed response against the bandwidth and
+        wait while it is exceeded
+        """
+        if self._bandwidth is not None:
+            self._bandwidth.consume(size)
+            self._bandwidth.wait()
+
+    def _delay(self, attempt: int, resp: requests.Response | None) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                seconds = float(retry_after)
+            except ValueError:
+                try:
+                    seconds = (
+                        parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    )
+                except (TypeError, ValueError):
+                    seconds = 0
+            delay = max(delay, min(self.max_backoff, seconds))
+        return delay
+
+    def _release(self, limit: AdaptiveLimit, latency: float, overloaded: bool):
+        if self._share is not None:
+            self._share.release()
+        limit.release(latency, overloaded=overloaded)
+
+    def request(self, method: str, url: str, **kwargs: t.Any) -> requests.Response:
+        """
+        Send an idempotent request. After the last retry the last response
+        is returned or the last connection error is raised.
+
+        Streamed responses keep their slots until they are closed or read
+        completely.
+        """
+        if url.startswith("file:"):
+            # the local disk needs neither protection nor retries
+            return self.session.request(method, url, **kwargs)
+
+        host = urlsplit(url).netloc
+        limit = self.limit(host)
+        bucket = self._bucket(host)
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("allow_redirects", True)
+
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            limit.acquire()
+            if self._share is not None:
+                self._share.acquire(host)
+            if self._bandwidth is not None:
+                self._bandwidth.wait()
+            resp: requests.Response | None = None
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self._share is not None:
+                    self._share.release()
+                limit.release(overloaded=True)
+                if attempt >= self.retries:
+                    raise
+                log.info(f"Retrying {method} {url} after {type(e).__name__}: {e}")
+            else:
+                retry = resp.status_code in RETRY_STATUS_CODES
+                release = functools.partial(
+                    self._release,
+                    limit,
+                    resp.elapsed.total_seconds(),
+                    resp.status_code in OVERLOAD_STATUS_CODES,
+                )
+                if kwargs.get("stream") and (not retry or attempt >= self.retries):
+                    # the body is still being transferred
+                    _release_when_done(resp, release)
+                    return resp
+                release()
+                if self._bandwidth is not None and not kwargs.get("stream"):
+                    self._bandwidth.consume(len(resp.content))
+                if not retry or attempt >= self.retries:
+                    return resp
+                log.info(f"Retrying {method} {url} after status {resp.status_code}")
+                resp.close()
+
+            delay = self._delay(attempt, resp)
+            with phase("backoff", url=url, attempt=attempt + 1, delay=delay):
+                time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs: t.Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs: t.Any) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+
+def _release_when_done(resp: requests.Response, release: t.Callable[[], None]):
+    """Call release once the streamed response is closed or read completely"""
+    lock = threading.Lock()
+    done = False
+
+    def release_once():
+        nonlocal done
+        with lock:
+            if done:
+                return
+            done = True
+        release()
+
+    close, iter_content = resp.close, resp.iter_content
+
+    def closing():
+        try:
+            close()
+        finally:
+            release_once()
+
+    def iter_content_releasing(*args: t.Any, **kwargs: t.Any) -> t.Iterator[t.Any]:
+        yield from iter_content(*args, **kwargs)
+        release_once()
+
+    resp.close = closing  # type: ignore
+    resp.iter_content = iter_content_releasing  # type: ignore
+    # responses that are dropped without closing them don't keep their slots
+    weakref.finalize(resp, release_once)
+
+
+_scheduler: FetchScheduler | None = None
+
+
+def get_scheduler() -> FetchScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FetchScheduler()
+    return _scheduler
+
+
+def set_scheduler(scheduler: FetchScheduler | None):
+    """Set the scheduler for all requests, None restores a default one"""
+    global _scheduler
+    _scheduler = scheduler
+
+
+@contextlib.contextmanager
+def scheduler_scope(scheduler: FetchScheduler) -> t.Iterator[FetchScheduler]:
+    """Use scheduler for all requests until the scope is left"""
+    global _scheduler
+    previous = _scheduler
+    _scheduler = scheduler
+    try:
+        yield scheduler
+    finally:
+        _scheduler = previous
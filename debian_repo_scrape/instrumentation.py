@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import contextlib
+import functools
+import re
+import sys
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+
+@dataclass(frozen=True)
+class RequestEvent:
+    url: str
+    url_class: str
+    status_code: int
+    bytes: int
+    latency: float
+    cache_hit: bool
+    method: str = "GET"
+
+
+@dataclass(frozen=True)
+class PhaseEvent:
+    name: str
+    start: float
+    duration: float
+    attributes: dict[str, t.Any] = field(default_factory=dict)
+    thread_id: int = 0
+
+
+class Observer:
+    """
+    Base class for observers of requests and phases.
+
+    Overwrite the methods you are interested in and register the observer
+    with add_observer or the observe context manager.
+    """
+
+    def on_request(self, event: RequestEvent):
+        pass
+
+    def on_phase_start(self, name: str, attributes: dict[str, t.Any]):
+        pass
+
+    def on_phase(self, event: PhaseEvent):
+        pass
+
+
+_O = t.TypeVar("_O", bound=Observer)
+
+_observers: list[Observer] = []
+_observers_lock = threading.Lock()
+
+
+def add_observer(observer: Observer):
+    global _observers
+    with _observers_lock:
+        _observers = [*_observers, observer]
+
+
+def remove_observer(observer: Observer):
+    global _observers
+    with _observers_lock:
+        _observers = [o for o in _observers if o is not observer]
+
+
+@contextlib.contextmanager
+def observe(observer: _O) -> t.Iterator[_O]:
+    """Register an observer for the duration of a with block"""
+    add_observer(observer)
+    try:
+        yield observer
+    finally:
+        remove_observer(observer)
+
+
+def observed() -> bool:
+    return bool(_observers)
+
+
+def classify_url(url: str) -> str:
+    path = urlsplit(url).path
+    name = path.rstrip("/").rsplit("/", 1)[-1]
+    if "/by-hash/" in path:
+        return "by-hash"
+    if name in ("Release", "InRelease"):
+        return "release"
+    if name == "Release.gpg":
+        return "signature"
+    if re.match(r"Packages(\..+)?$", name):
+        return "packages"
+    if re.match(r"Sources(\..+)?$", name):
+        return "sources"
+    if name.startswith("Contents-"):
+        return "contents"
+    if re.match(r".+\.[ud]?deb$", name):
+        return "deb"
+    if path.endswith("/") or "." not in name:
+        return "listing"
+    return "other"
+
+
+def emit_request(
+    url: str,
+    status_code: int,
+    size: int,
+    latency: float,
+    cache_hit: bool,
+    method: str = "GET",
+):
+    observers = _observers
+    if not observers:
+        return
+    event = RequestEvent(
+        url=url,
+        url_class=classify_url(url),
+        status_code=status_code,
+        bytes=size,
+        latency=latency,
+        cache_hit=cache_hit,
+        method=method,
+    )
+    for observer in observers:
+        observer.on_request(event)
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+    def set_attributes(self, **attributes: t.Any):
+        pass
+
+
+class _Phase:
+    __slots__ = ("name", "attributes", "_start")
+
+    def __init__(self, name: str, attributes: dict[str, t.Any]) -> None:
+        self.name = name
+        self.attributes = attributes
+        self._start = 0.0
+
+    def __enter__(self):
+        for observer in _observers:
+            observer.on_phase_start(self.name, self.attributes)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        event = PhaseEvent(
+            name=self.name,
+            start=self._start,
+            duration=time.perf_counter() - self._start,
+            attributes=self.attributes,
+            thread_id=threading.get_ident(),
+        )
+        for observer in _observers:
+            observer.on_phase(event)
+
+    def set_attributes(self, **attributes: t.Any):
+        """Attach attributes that are only known once the phase is running"""
+        self.attributes.update(attributes)
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def phase(name: str, **attributes: t.Any) -> _Phase | _NullPhase:
+    """
+    Time a block of work and report it to all observers.
+    Does nothing if no observer is registered.
+    """
+    if not _observers:
+        return _NULL_PHASE
+    return _Phase(name, attributes)
+
+
+_F = t.TypeVar("_F", bound=t.Callable[..., t.Any])
+
+
+def timed(name: str) -> t.Callable[[_F], _F]:
+    """Decorator that runs the whole function as a phase"""
+
+    def decorator(func: _F) -> _F:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return t.cast(_F, wrapper)
+
+    return decorator
+
+
+@dataclass
+class _RequestStats:
+    requests: int = 0
+    cache_hits: int = 0
+    bytes: int = 0
+    latency: float = 0.0
+    status_codes: dict[int, int] = field(default_factory=dict)
+
+
+@dataclass
+class _PhaseStats:
+    runs: int = 0
+    duration: float = 0.0
+
+
+class MetricsAggregator(Observer):
+    """
+    Observer that aggregates requests by URL class and phase timings.
+
+    Bytes and latency are only counted for requests that were not answered
+    from the response cache.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests: dict[str, _RequestStats] = {}
+        self.phases: dict[str, _PhaseStats] = {}
+
+    def on_request(self, event: RequestEvent):
+        with self._lock:
+            stats = self.requests.setdefault(event.url_class, _RequestStats())
+            stats.requests += 1
+            if event.cache_hit:
+                stats.cache_hits += 1
+                return
+            stats.bytes += event.bytes
+            stats.latency += event.latency
+            stats.status_codes[event.status_code] = (
+                stats.status_codes.get(event.status_code, 0) + 1
+            )
+
+    def on_phase(self, event: PhaseEvent):
+        with self._lock:
+            stats = self.phases.setdefault(event.name, _PhaseStats())
+            stats.runs += 1
+            stats.duration += event.duration
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.phases = {}
+
+    def summary(self) -> str:
+        lines = [
+            f"{'URL class':<12}{'requests':>10}{'cached':>10}{'bytes':>14}"
+            f"{'seconds':>12}"
+        ]
+        for url_class, stats in sorted(self.requests.items()):
+            lines.append(
+                f"{url_class:<12}{stats.requests:>10}{stats.cache_hits:>10}"
+                f"{stats.bytes:>14}{stats.latency:>12.3f}"
+            )
+        lines.append("")
+        lines.append(f"{'Phase':<22}{'runs':>10}{'seconds':>12}")
+        for name, phase_stats in sorted(self.phases.items()):
+            lines.append(
+                f"{name:<22}{phase_stats.runs:>10}{phase_stats.duration:>12.3f}"
+            )
+        return "\n".join(lines)
+
+    def print_summary(self, file: t.TextIO | None = None):
+        print(self.summary(), file=file or sys.stdout)
+
+    def to_prometheus(self, prefix: str = "debian_repo_scrape") -> str:
+        """Export the aggregated metrics in the prometheus text format"""
+
+        def metric(name: str, type_: str, help_: str, samples: list[str]):
+            return [
+                f"# HELP {prefix}_{name} {help_}",
+                f"# TYPE {prefix}_{name} {type_}",
+                *(f"{prefix}_{name}{sample}" for sample in samples),
+            ]
+
+        requests = sorted(self.requests.items())
+        phases = sorted(self.phases.items())
+        lines = [
+            *metric(
+                "requests_total",
+                "counter",
+                "Requests by URL class and cache result",
+                [
+                    f'{{url_class="{c}",cache="{cache}"}} {count}'
+                    for c, s in requests
+                    for cache, count in (
+                        ("hit", s.cache_hits),
+                        ("miss", s.requests - s.cache_hits),
+                    )
+                ],
+            ),
+            *metric(
+                "responses_total",
+                "counter",
+                "Uncached responses by URL class and status code",
+                [
+                    f'{{url_class="{c}",status_code="{code}"}} {count}'
+                    for c, s in requests
+                    for code, count in sorted(s.status_codes.items())
+                ],
+            ),
+            *metric(
+                "response_bytes_total",
+                "counter",
+                "Transferred response body bytes by URL class",
+                [f'{{url_class="{c}"}} {s.bytes}' for c, s in requests],
+            ),
+            *metric(
+                "request_seconds_total",
+                "counter",
+                "Time spent waiting for responses by URL class",
+                [f'{{url_class="{c}"}} {s.latency}' for c, s in requests],
+            ),
+            *metric(
+                "phase_runs_total",
+                "counter",
+                "Number of times a phase ran",
+                [f'{{phase="{n}"}} {s.runs}' for n, s in phases],
+            ),
+            *metric(
+                "phase_seconds_total",
+                "counter",
+                "Time spent in a phase",
+                [f'{{phase="{n}"}} {s.duration}' for n, s in phases],
+            ),
+        ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import functools
+import logging
+import operator
+import typing as t
+from io import BufferedReader
+
+from debian_repo_scrape.exc import SignatureInvalid
+
+if t.TYPE_CHECKING:
+    # pgpy and cryptography are slow to import, they are only needed for keys
+    from pgpy import PGPKey
+
+log = logging.getLogger(__name__)
+
+KeyInput = t.Union[str, BufferedReader, bytes, "Keyring"]
+
+_ARMOR_HEADER = "-----BEGIN PGP PUBLIC KEY BLOCK-----"
+
+
+class Keyring:
+    """
+    A set of public keys that are parsed once and can be reused
+    for verifying the signatures of many release files.
+    Valid signatures by expired keys are accepted with a warning,
+    unless reject_expired is set.
+    """
+
+    def __init__(
+        self, keys: t.Iterable[PGPKey] = (), reject_expired: bool = False
+    ) -> None:
+        self.reject_expired = reject_expired
+        self._keys: list[PGPKey] = []
+        self._key_ids: dict[str, PGPKey] = {}
+        for key in keys:
+            self._add_key(key)
+
+    @classmethod
+    def from_key_input(
+        cls, *key_inputs: KeyInput, reject_expired: bool = False
+    ) -> Keyring:
+        """Create a keyring from key files, opened key files or key blobs"""
+        if (
+            len(key_inputs) == 1
+            and isinstance(key_inputs[0], Keyring)
+            and (key_inputs[0].reject_expired or not reject_expired)
+        ):
+            return key_inputs[0]
+        keyring = cls(reject_expired=reject_expired)
+        for key_input in key_inputs:
+            keyring.add(key_input)
+        return keyring
+
+    def add(self, key_input: KeyInput):
+        from pgpy import PGPKey
+
+        if isinstance(key_input, Keyring):
+            for key in key_input.keys:
+                self._add_key(key)
+            self.reject_expired = self.reject_expired or key_input.reject_expired
+            return
+        if isinstance(key_input, BufferedReader):
+            blob = key_input.read()
+        elif isinstance(key_input, str):
+            with open(key_input, "rb") as f:
+                blob = f.read()
+        elif isinstance(key_input, bytes):
+            blob = key_input
+        else:
+            raise TypeError(
+                f"{type(key_input)} is not a valid type for public key input"
+            )
+
+        text = blob.decode("ascii", errors="replace")
+        if text.count(_ARMOR_HEADER) > 1:
+            blocks = [_ARMOR_HEADER + b for b in text.split(_ARMOR_HEADER)[1:]]
+            for block in blocks:
+                key, _ = PGPKey.from_blob(block)
+                self._add_key(key)
+        else:
+            key, _ = PGPKey.from_blob(blob)
+            self._add_key(key)
+
+    def _add_key(self, key: PGPKey):
+        self._keys.append(key)
+        self._key_ids[key.fingerprint.keyid] = key
+        for subkey_id in key.subkeys:
+            self._key_ids[subkey_id] = key
+
+    @property
+    def keys(self) -> list[PGPKey]:
+        return list(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __getstate__(self) -> dict[str, t.Any]:
+        # pgpy keys can't be pickled, so they are passed on in armored form
+        return {
+            "keys": [str(key) for key in self._keys],
+            "reject_expired": self.reject_expired,
+        }
+
+    def __setstate__(self, state: dict[str, t.Any]):
+        from pgpy import PGPKey
+
+        self.__init__(  # type: ignore
+            (PGPKey.from_blob(blob)[0] for blob in state["keys"]),
+            state["reject_expired"],
+        )
+
+    def _find_key(self, signers: t.Iterable[str], file: str) -> PGPKey:
+        for signer in signers:
+            key = self._key_ids.get(signer)
+            if key is not None:
+                return key
+        raise SignatureInvalid(file, f"no key for signer {', '.join(signers)}")
+
+    def verify(self, data: bytes, signature: bytes | None = None, file: str = ""):
+        """
+        Verify a detached signature of data or, without a signature, the
+        clearsigned message data. Raises SignatureInvalid if the
+        signature is bad or made by an unknown key.
+
+        Valid signatures by expired keys only raise SignatureInvalid
+        with reject_expired.
+        """
+        from pgpy import PGPMessage, PGPSignature
+        from pgpy.constants import SecurityIssues
+        from pgpy.errors import PGPError
+
+        try:
+            if signature is None:
+                message = PGPMessage.from_blob(data)
+                key = self._find_key(message.signers, file)
+                result = key.verify(message)
+            else:
+                sig = PGPSignature.from_blob(signature)
+                key = self._find_key([sig.signer], file)
+                result = key.verify(data, sig)
+        except (PGPError, ValueError) as e:
+            raise SignatureInvalid(file, str(e))
+
+        if result:
+            return
+
+        issues = functools.reduce(
+            operator.or_,
+            (subject.issues for subject in result.bad_signatures),
+            SecurityIssues(0),
+        )
+        if issues == SecurityIssues.Expired:
+            if not all(map(_check_signature, result.bad_signatures)):
+                raise SignatureInvalid(file, SecurityIssues.WrongSig.name)
+            if not self.reject_expired:
+                log.warning(f"Signature of {file} was made by an expired key")
+                return
+        raise SignatureInvalid(file, issues.name or str(issues))
+
+
+def _check_signature(subject) -> bool:
+    # pgpy doesn't check the signatures of expired keys at all, this uses
+    # the internals of PGPy 0.6 which pyproject.toml pins
+    from cryptography.hazmat.primitives import hashes
+
+    signature = subject.signature
+    return (
+        subject.by._key.verify(
+            signature.hashdata(subject.subject),
+            signature.__sig__,
+            getattr(hashes, signature.hash_algorithm.name)(),
+        )
+        is True
+    )
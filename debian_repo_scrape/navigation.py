@@ -1,21 +1,28 @@
 from __future__ import annotations
 
+import os
 import typing as t
 from abc import ABCMeta, abstractmethod
-from urllib.parse import urljoin
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
 
-import bs4.element
-from bs4 import BeautifulSoup
-from debian.deb822 import Packages, Release
+from debian_repo_scrape.fetch import local_path
+from debian_repo_scrape.instrumentation import phase
+from debian_repo_scrape.parsing import _iter_packages, parse_release
+from debian_repo_scrape.utils import _get_response, _suite_path, probe_suites
 
-from debian_repo_scrape.utils import _get_response
+if t.TYPE_CHECKING:
+    # bs4 is imported once a listing has to be parsed
+    import bs4.element
 
 
 class BaseNavigator(metaclass=ABCMeta):
     """
     Base navigator for navigating within a repository
 
-    Overwrite _parse_directions in a subclass for implementing your own behavior
+    Overwrite _parse_directions in a subclass for implementing your own behavior.
+    The listing of every url navigated to is requested right away, navigators
+    that don't parse listings overwrite _refresh_soup to skip that.
     """
 
     def __init__(self, base_url: str) -> None:
@@ -23,7 +30,7 @@ class BaseNavigator(metaclass=ABCMeta):
             base_url += "/"
         self.base_url = base_url
         self._current_url = base_url
-        self._last_response = _get_response(base_url)
+        self._last_response = None
         self._soup = None
         self._checkpoints: list[str] = []
         self._refresh_soup()
@@ -31,7 +38,7 @@ class BaseNavigator(metaclass=ABCMeta):
     def reset(self):
         """Get back to the base url"""
         self._current_url = self.base_url
-        self._last_response = _get_response(self.base_url)
+        self._last_response = None
         self._refresh_soup()
         return self
 
@@ -59,9 +66,10 @@ class BaseNavigator(metaclass=ABCMeta):
         else:
             new_url = urljoin(curr_url, item)
 
-        self._last_response = _get_response(new_url)
-        self._current_url = new_url
-        self._refresh_soup()
+        with phase("navigate", url=new_url):
+            self._last_response = None
+            self._current_url = new_url
+            self._refresh_soup()
         return self
 
     def __getitem__(self, item: str):
@@ -77,6 +85,8 @@ class BaseNavigator(metaclass=ABCMeta):
         if resp.status_code == 200 and "text/html" in resp.headers.get(
             "Content-Type", ""
         ):
+            from bs4 import BeautifulSoup
+
             self._soup = BeautifulSoup(resp.text, features="html.parser")
         elif resp.status_code != 200 and ".." in self.directions:
             self.navigate("..")
@@ -121,6 +131,9 @@ class BaseNavigator(metaclass=ABCMeta):
 
     @property
     def last_response(self):
+        """The response for the current url, requested once it is needed"""
+        if self._last_response is None:
+            self._last_response = _get_response(self.current_url)
         return self._last_response
 
     @property
@@ -203,7 +216,7 @@ class PredefinedSuitesNavigator(BaseNavigator):
             resp = _get_response(suite_release_url)
             if resp.status_code != 200:
                 continue  # pragma: no cover
-            release_file = Release(resp.content.split(b"\n"))
+            release_file = parse_release(resp.content)
             for file in release_file["SHA256"]:
                 filename: str = file["name"]
                 self._paths.append(
@@ -214,12 +227,19 @@ class PredefinedSuitesNavigator(BaseNavigator):
                     resp = _get_response(packages_url)
                     if resp.status_code != 200:
                         continue  # pragma: no cover
-                    packages_file = Packages(resp.content.split(b"\n"))
-                    if "Filename" in packages_file:
-                        self._paths.append(packages_file["Filename"])
+                    for packages_file in _iter_packages(resp.content):
+                        if "Filename" in packages_file:
+                            self._paths.append(packages_file["Filename"])
 
         super().__init__(base_url)
 
+    def _refresh_soup(self):
+        # directories only exist as prefixes of the paths, they aren't fetched
+        if self.url_diff.strip("/") in self._paths:
+            super()._refresh_soup()
+        else:
+            self._soup = None
+
     def _parse_directions(self) -> t.Iterable[str]:
 
         directions = [
@@ -236,6 +256,36 @@ class PredefinedSuitesNavigator(BaseNavigator):
         return [direction for direction in directions if direction]
 
 
+class ProbingNavigator(PredefinedSuitesNavigator):
+    """
+    Navigator for repositories that don't serve any html and whose suites
+    aren't known. The suites are found with probe_suites, codenames and
+    pockets default to the ones of debian and ubuntu. Only the Release
+    files of the suites are known, their indexes are left to scraping.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        codenames: t.Iterable[str] | None = None,
+        pockets: t.Iterable[str] | None = None,
+        predefined_paths: list[str] | None = None,
+        flat_repo: bool = False,
+        workers: int = 16,
+    ) -> None:
+        if not base_url.endswith("/"):
+            base_url += "/"
+        self.suites = probe_suites(base_url, codenames, pockets, flat_repo, workers)
+        self._paths = predefined_paths or []
+        for suite in self.suites:
+            suite_path = _suite_path(suite, flat_repo)
+            self._paths.extend(
+                f"{suite_path}{name}"
+                for name in ("Release", "Release.gpg", "InRelease")
+            )
+        BaseNavigator.__init__(self, base_url)
+
+
 class ApacheBrowseNavigator(BaseNavigator):
     """Navigator for navigating File Browers served by the apache web server"""
 
@@ -253,3 +303,41 @@ class ApacheBrowseNavigator(BaseNavigator):
             for child in link.children
             if isinstance(child, str)
         ]
+
+
+class FileSystemNavigator(BaseNavigator):
+    """
+    Navigator for repositories mirrored to the local file system
+
+    Accepts a file:// url or a plain path
+    """
+
+    def __init__(self, base_url: str) -> None:
+        if local_path(base_url) is None:
+            base_url = Path(base_url).resolve().as_uri()
+        super().__init__(base_url)
+
+    def _refresh_soup(self):
+        # the directions are read from the file system, not from listings
+        self._soup = None
+
+    def _parse_directions(self) -> list[str]:
+        path = local_path(self.current_url)
+        assert path is not None
+        try:
+            with os.scandir(path) as entries:
+                return [entry.name for entry in entries]
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+
+def get_navigator(repo_url: str | BaseNavigator) -> BaseNavigator:
+    """
+    Return the navigator for a repository url: a FileSystemNavigator for
+    file:// urls and local paths, otherwise an ApacheBrowseNavigator
+    """
+    if isinstance(repo_url, BaseNavigator):
+        return repo_url
+    if urlsplit(repo_url).scheme in ("", "file"):
+        return FileSystemNavigator(repo_url)
+    return ApacheBrowseNavigator(repo_url)
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import bz2
+import gzip
+import lzma
+import re
+import typing as t
+import zlib
+
+if t.TYPE_CHECKING:
+    from concurrent.futures import Future, ProcessPoolExecutor
+
+DECOMPRESSORS: dict[str, t.Callable[[bytes], bytes]] = {
+    ".gz": gzip.decompress,
+    ".xz": lzma.decompress,
+    ".lzma": lzma.decompress,
+    ".bz2": bz2.decompress,
+}
+
+STREAM_DECOMPRESSORS: dict[str, t.Callable[[], t.Any]] = {
+    ".gz": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    ".xz": lzma.LZMADecompressor,
+    ".lzma": lzma.LZMADecompressor,
+    ".bz2": bz2.BZ2Decompressor,
+}
+
+
+def iter_decompressed(
+    chunks: t.Iterable[bytes], compression: str = ""
+) -> t.Iterator[bytes]:
+    """Decompress a stream of chunks, compression is a suffix like ".gz" or empty"""
+    factory = STREAM_DECOMPRESSORS.get(compression)
+    if factory is None:
+        yield from chunks
+        return
+    decompressor = factory()
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    flush = getattr(decompressor, "flush", None)
+    if flush is not None:
+        data = flush()
+        if data:
+            yield data
+
+
+PACKAGE_FIELDS = frozenset(
+    (
+        "package",
+        "version",
+        "filename",
+        "architecture",
+        "section",
+        "size",
+        "sha256",
+        "sha1",
+        "md5sum",
+        "priority",
+        "maintainer",
+        "description",
+        "description-md5",
+        "phased-update-percentage",
+    )
+)
+"""Fields of a Packages stanza that scraping needs"""
+
+RELEASE_HASH_FIELDS = ("md5sum", "sha1", "sha256", "sha512")
+SOURCES_HASH_FIELDS = (
+    ("md5sum", "files"),
+    ("sha1", "checksums-sha1"),
+    ("sha256", "checksums-sha256"),
+)
+"""Hash sums as named in Packages and the Sources fields that list them"""
+
+
+class Stanza(t.Dict[str, t.Any]):
+    """
+    Fields of a deb822 paragraph. Like in python-debian, field names are
+    case-insensitive, they are stored in lower case.
+    """
+
+    def __getitem__(self, key: str) -> t.Any:
+        return super().__getitem__(key.lower())
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and super().__contains__(key.lower())
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:
+        return super().get(key.lower(), default)
+
+
+Paragraph = t.Mapping[str, t.Any]
+"""A Stanza or, for input the native parser leaves to python-debian, a Deb822"""
+
+_BLOCK_RE = re.compile(rb"[^\n]+(?:\n[^\n]+)*")
+_FIELD_RE = re.compile(rb"([^:\s]+)[ \t]*:[ \t]*([^\n]*(?:\n[ \t][^\n]*)*)")
+# signatures, comments, CRLF line endings and whitespace-only separator lines
+_EXOTIC_RE = re.compile(rb"\r|^#|^-----BEGIN|^[ \t]+$", re.M)
+
+
+class _Exotic(Exception):
+    pass
+
+
+class _FieldSelection(t.FrozenSet[str]):
+    """
+    Lower case field names that match case-insensitively, python-debian
+    compares them with the field names as written in the file
+    """
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and super().__contains__(key.lower())
+
+
+def _parse_native(
+    content: bytes | memoryview, fields: t.Container[str] | None = None
+) -> list[Stanza]:
+    """
+    Parse deb822 paragraphs directly from the content, without splitting it
+    into lines first. Raises _Exotic if the input needs python-debian.
+    """
+    if isinstance(content, memoryview):
+        content = content.tobytes()
+    if _EXOTIC_RE.search(content):
+        raise _Exotic
+
+    stanzas: list[Stanza] = []
+    for block in _BLOCK_RE.finditer(content):
+        start, end = block.span()
+        stanza = Stanza()
+        for field in _FIELD_RE.finditer(content, start, end):
+            if field.start() != start:
+                raise _Exotic
+            start = field.end() + 1
+            key = field.group(1).decode().lower()
+            if fields is not None and key not in fields:
+                continue
+            first_line, newline, continuation = field.group(2).partition(b"\n")
+            stanza[key] = (first_line.strip() + newline + continuation).decode()
+        if start != end + 1:
+            raise _Exotic
+        stanzas.append(stanza)
+    return stanzas
+
+
+def _iter_packages(
+    content: bytes, fields: t.Collection[str] | None = None
+) -> t.Iterator[Paragraph]:
+    """
+    Iterate over all package stanzas of a Packages file, optionally only
+    with the given (lower case) fields
+    """
+    try:
+        return iter(_parse_native(content, fields))
+    except (_Exotic, UnicodeDecodeError):
+        # python-debian is slow to import and only needed for exotic input
+        from debian.deb822 import Packages
+
+        return Packages.iter_paragraphs(
+            content.split(b"\n"),
+            fields=_FieldSelection(fields) if fields is not None else None,  # type: ignore
+            use_apt_pkg=False,
+        )
+
+
+def parse_release(content: bytes) -> Paragraph:
+    """Parse a Release file including its hash tables"""
+    try:
+        stanzas = _parse_native(content)
+    except (_Exotic, UnicodeDecodeError):
+        from debian.deb822 import Release
+
+        return Release(content.split(b"\n"))
+    release = stanzas[0] if stanzas else Stanza()
+    for key in RELEASE_HASH_FIELDS:
+        if key in release:
+            release[key] = [
+                dict(zip((key, "size", "name"), line.split()))
+                for line in release[key].splitlines()
+                if line.strip()
+            ]
+    return release
+
+
+def iter_stanzas(
+    chunks: t.Iterable[bytes], fields: t.Collection[str] | None = None
+) -> t.Iterator[Paragraph]:
+    """Parse the paragraphs of a stream of chunks as soon as they are complete"""
+    rest = b""
+    for chunk in chunks:
+        content = rest + chunk
+        boundary = content.rfind(b"\n\n")
+        if boundary == -1:
+            rest = content
+            continue
+        yield from _iter_packages(content[: boundary + 1], fields)
+        rest = content[boundary + 2 :]  # noqa: E203
+    if rest.strip():
+        yield from _iter_packages(rest, fields)
+
+
+def source_files(stanza: Paragraph) -> dict[str, dict[str, str]]:
+    """
+    The files of a Sources stanza by name, with their size and their hash
+    sums named like in Packages
+    """
+    files: dict[str, dict[str, str]] = {}
+    for key, field in SOURCES_HASH_FIELDS:
+        for line in (stanza.get(field) or "").splitlines():
+            parts = line.split()
+            if len(parts) != 3:
+                continue
+            hashsum, size, name = parts
+            files.setdefault(name, {"size": size})[key] = hashsum
+    return files
+
+
+def split_stanzas(content: bytes, chunk_size: int) -> list[bytes]:
+    """
+    Split the content of a Packages file into chunks of about chunk_size
+    bytes that only end at stanza boundaries
+    """
+    chunks: list[bytes] = []
+    start = 0
+    while start < len(content):
+        boundary = content.find(b"\n\n", start + chunk_size)
+        if boundary == -1:
+            chunks.append(content[start:])
+            break
+        chunks.append(content[start : boundary + 1])  # noqa: E203
+        start = boundary + 2
+    return chunks
+
+
+def _parse_in_worker(content: bytes, fields: t.Collection[str] | None) -> list[Stanza]:
+    # deb822 objects can't be pickled, so they are sent back as stanzas
+    return [
+        packages
+        if isinstance(packages, Stanza)
+        else Stanza((key.lower(), value) for key, value in packages.items())
+        for packages in _iter_packages(content, fields)
+    ]
+
+
+class PackagesParser:
+    """
+    Parses uncompressed Packages files, in a process pool if workers > 1.
+
+    Files larger than chunk_size are split at stanza boundaries and parsed
+    in parallel, the stanzas are returned in their original order.
+    Use it as a context manager to reuse the pool for many files.
+    With fields only these (lower case) fields are kept.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        chunk_size: int = 2**20,
+        fields: t.Collection[str] | None = None,
+    ) -> None:
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.fields = fields
+        self._executor: ProcessPoolExecutor | None = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            # multiprocessing is only imported when a pool is used
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._executor = ProcessPoolExecutor(self.workers)
+        return self
+
+    def __exit__(self, *_):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def parse(self, files: list[bytes]) -> list[list[Paragraph]]:
+        """Parse the contents of Packages files"""
+        if self._executor is None:
+            return [list(_iter_packages(content, self.fields)) for content in files]
+
+        futures: list[list[Future[list[Stanza]]]] = []
+        for content in files:
+            futures.append(
+                [
+                    self._executor.submit(_parse_in_worker, chunk, self.fields)
+                    for chunk in split_stanzas(content, self.chunk_size)
+                ]
+            )
+        return [
+            [stanza for future in file_futures for stanza in future.result()]
+            for file_futures in futures
+        ]
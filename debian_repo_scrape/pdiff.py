@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import lzma
+import os
+import re
+import typing as t
+import zlib
+from dataclasses import dataclass, field
+from urllib.parse import quote, urljoin
+
+from debian_repo_scrape.exc import (
+    FileRequestError,
+    HashInvalid,
+    SHA1Invalid,
+    SHA256Invalid,
+)
+from debian_repo_scrape.instrumentation import phase
+from debian_repo_scrape.parsing import DECOMPRESSORS, _iter_packages
+from debian_repo_scrape.utils import _get_file_abs
+
+log = logging.getLogger(__name__)
+
+# hash sums that pdiff indexes are published with, strongest first
+_PDIFF_HASHES: tuple[tuple[str, str, t.Type[HashInvalid]], ...] = (
+    ("SHA256", "sha256", SHA256Invalid),
+    ("SHA1", "sha1", SHA1Invalid),
+)
+_ED_COMMAND_RE = re.compile(rb"^(\d+)?(?:,(\d+))?([acd])$")
+# raised by malformed pdiff indexes and patches
+_PATCH_ERRORS = (ValueError, IndexError, EOFError, OSError, lzma.LZMAError, zlib.error)
+
+
+class PDiffUnavailable(Exception):
+    """The index can't be updated with pdiffs and has to be downloaded"""
+
+
+@dataclass(frozen=True)
+class PDiffIndex:
+    """
+    A parsed Packages.diff/Index. History has the hash sums of former
+    versions of the index and the names of the patches that update them.
+    """
+
+    hash_type: str
+    current: tuple[str, int]
+    history: list[tuple[str, int, str]]
+    patches: dict[str, tuple[str, int]] = field(default_factory=dict)
+    """Hash sums of the uncompressed patches"""
+    downloads: dict[str, tuple[str, int]] = field(default_factory=dict)
+    """Hash sums of the compressed patches by the name of the download"""
+    merged: bool = False
+    """Every patch updates its version to the current one directly"""
+
+    @classmethod
+    def parse(cls, content: bytes) -> PDiffIndex:
+        stanza = next(_iter_packages(content), None)
+        if stanza is None:
+            raise PDiffUnavailable("empty pdiff index")
+
+        def table(name: str) -> list[list[str]]:
+            return [line.split() for line in (stanza.get(name) or "").splitlines()]
+
+        for hash_type, _, _ in _PDIFF_HASHES:
+            current = (stanza.get(f"{hash_type}-Current") or "").split()
+            if len(current) == 2:
+                break
+        else:
+            raise PDiffUnavailable("pdiff index without supported hash sums")
+
+        return cls(
+            hash_type=hash_type,
+            current=(current[0], int(current[1])),
+            history=[
+                (line[0], int(line[1]), line[2])
+                for line in table(f"{hash_type}-History")
+                if len(line) == 3
+            ],
+            patches={
+                line[2]: (line[0], int(line[1]))
+                for line in table(f"{hash_type}-Patches")
+                if len(line) == 3
+            },
+            downloads={
+                line[2]: (line[0], int(line[1]))
+                for line in table(f"{hash_type}-Download")
+                if len(line) == 3
+            },
+            merged=stanza.get("X-Patch-Precedence") == "merged",
+        )
+
+    @property
+    def _hash(self) -> tuple[str, t.Type[HashInvalid]]:
+        for hash_type, hash_method, exc in _PDIFF_HASHES:
+            if hash_type == self.hash_type:
+                return hash_method, exc
+        raise PDiffUnavailable(self.hash_type)  # pragma: no cover
+
+    def hexdigest(self, content: bytes) -> str:
+        return hashlib.new(self._hash[0], content).hexdigest()
+
+    def patch_chain(self, content: bytes) -> list[str]:
+        """Names of the patches that update content to the current version"""
+        digest = self.hexdigest(content)
+        if digest == self.current[0]:
+            return []
+        for i, (history_digest, size, name) in enumerate(self.history):
+            if history_digest == digest and size == len(content):
+                if self.merged:
+                    return [name]
+                return [name for _, _, name in self.history[i:]]
+        raise PDiffUnavailable("the version is not in the pdiff history")
+
+
+def apply_ed_patch(content: bytes, patch: bytes) -> bytes:
+    """
+    Apply a patch in the subset of ed commands that diff --ed writes
+    (a, c, d and s/.// for lines that consist of a dot)
+    """
+    lines = content.split(b"\n")
+    trailing_newline = lines[-1] == b""
+    if trailing_newline:
+        lines.pop()
+    commands = patch.split(b"\n")
+    current = 0
+    i = 0
+    while i < len(commands):
+        command = commands[i]
+        i += 1
+        if not command:
+            continue
+        if command == b"s/.//":
+            lines[current - 1] = lines[current - 1][1:]
+            continue
+        match = _ED_COMMAND_RE.match(command)
+        if match is None:
+            raise PDiffUnavailable(f"unsupported ed command {command!r}")
+        start = int(match.group(1)) if match.group(1) else current
+        end = int(match.group(2)) if match.group(2) else start
+        operation = match.group(3)
+        text: list[bytes] = []
+        if operation in (b"a", b"c"):
+            while i < len(commands) and commands[i] != b".":
+                text.append(commands[i])
+                i += 1
+            i += 1
+        if operation == b"a":
+            lines[start:start] = text
+            current = start + len(text)
+        elif operation == b"c":
+            lines[start - 1 : end] = text  # noqa: E203
+            current = start - 1 + len(text)
+        else:
+            del lines[start - 1 : end]  # noqa: E203
+            current = min(start, len(lines))
+    return b"\n".join(lines) + (b"\n" if trailing_newline else b"")
+
+
+def apply_pdiffs(
+    content: bytes,
+    index: PDiffIndex,
+    fetch_patch: t.Callable[[str], bytes],
+    url: str = "",
+) -> bytes:
+    """
+    Update content, the index at url, with the patches of a pdiff index.
+    fetch_patch returns the compressed download of a patch by its name.
+    """
+    index_url = f"{url}.diff/Index"
+    hash_method, exc = index._hash
+    for name in index.patch_chain(content):
+        download_name = next(
+            (n for n in index.downloads if n.startswith(f"{name}.")), f"{name}.gz"
+        )
+        download = fetch_patch(download_name)
+        expected = index.downloads.get(download_name)
+        if expected is not None and (
+            hashlib.new(hash_method, download).hexdigest() != expected[0]
+        ):
+            raise exc(f"{url}.diff/{download_name}", index_url)
+        decompress = DECOMPRESSORS.get(os.path.splitext(download_name)[1])
+        patch = decompress(download) if decompress is not None else download
+        expected = index.patches.get(name)
+        if (
+            expected is not None
+            and hashlib.new(hash_method, patch).hexdigest() != expected[0]
+        ):
+            raise exc(f"{url}.diff/{name}", index_url)
+        content = apply_ed_patch(content, patch)
+
+    if index.hexdigest(content) != index.current[0]:
+        raise exc(url, index_url)
+    return content
+
+
+def update_index(url: str, content: bytes) -> bytes:
+    """
+    Update the previously fetched content of an index like Packages with the
+    pdiffs published next to it. Raises PDiffUnavailable if that isn't possible.
+    """
+    index_url = f"{url}.diff/Index"
+    with phase("pdiff", url=url):
+        try:
+            index = PDiffIndex.parse(_get_file_abs(index_url))
+            return apply_pdiffs(
+                content,
+                index,
+                lambda name: _get_file_abs(urljoin(index_url, name)),
+                url,
+            )
+        except (FileRequestError, *_PATCH_ERRORS) as e:
+            raise PDiffUnavailable(str(e))
+
+
+class IndexCache:
+    """
+    Keeps the last fetched version of indexes in a directory, so that they
+    can be updated with pdiffs instead of being downloaded again
+    """
+
+    def __init__(self, directory: str | os.PathLike) -> None:
+        self.directory = os.fspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, quote(url, safe=""))
+
+    def get(self, url: str) -> bytes | None:
+        try:
+            with open(self._path(url), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url: str, content: bytes):
+        path = self._path(url)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def fetch(self, url: str, hashsums: t.Mapping[str, str] | None = None) -> bytes:
+        """
+        Return the current content of an index. hashsums from the Release
+        file (e.g. {"sha256": ...}) tell if the cached version is current.
+        If the pdiffs can't be applied the index is downloaded completely.
+        """
+        cached = self.get(url)
+        if cached is not None:
+            if hashsums and _matches(cached, hashsums):
+                return cached
+            try:
+                content = update_index(url, cached)
+            except (PDiffUnavailable, HashInvalid) as e:
+                log.info(f"Downloading {url} completely: {e}")
+            else:
+                if not hashsums or _matches(content, hashsums):
+                    self.put(url, content)
+                    return content
+                log.warning(f"{url} updated with pdiffs does not match the Release")
+
+        content = _get_file_abs(url)
+        self.put(url, content)
+        return content
+
+
+def _matches(content: bytes, hashsums: t.Mapping[str, str]) -> bool:
+    for key, hash_method in (("sha256", "sha256"), ("sha1", "sha1"), ("md5sum", "md5")):
+        if key in hashsums:
+            return hashlib.new(hash_method, content).hexdigest() == hashsums[key]
+    return False  # pragma: no cover
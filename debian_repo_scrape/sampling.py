@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import time
+import typing as t
+from dataclasses import dataclass
+
+T = t.TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Sample:
+    """
+    Which packages verify_hash_sums checks. Every Packages index is a group
+    (component and architecture of a suite) of which either a fraction or a
+    fixed count of packages is verified. With a history file, the packages
+    that were verified longest ago are picked first.
+    """
+
+    fraction: float | None = None
+    count: int | None = None
+    seed: int | None = None
+    history: str | None = None
+    confidence: float = 0.95
+
+    def __post_init__(self):
+        if (self.fraction is None) == (self.count is None):
+            raise ValueError("Sample needs either a fraction or a count")
+        if self.fraction is not None and not 0 < self.fraction <= 1:
+            raise ValueError(f"{self.fraction} is not a valid sample fraction")
+        if self.count is not None and self.count < 1:
+            raise ValueError(f"{self.count} is not a valid sample count")
+        if not 0 < self.confidence < 1:
+            raise ValueError(f"{self.confidence} is not a valid confidence level")
+
+    def size(self, population: int) -> int:
+        if self.count is not None:
+            return min(self.count, population)
+        assert self.fraction is not None
+        return min(population, math.ceil(self.fraction * population))
+
+
+@dataclass(frozen=True)
+class SamplingResult:
+    """
+    Outcome of a sampled verification. lower and upper bound the fraction
+    of corrupt or missing packages in the population at the confidence level.
+    """
+
+    population: int
+    sampled: int
+    failures: int
+    confidence: float
+    lower: float
+    upper: float
+
+    @property
+    def max_corrupt(self) -> int:
+        """Upper bound of corrupt or missing packages in the population"""
+        return max(self.failures, math.floor(self.upper * self.population))
+
+
+class SampleHistory:
+    """When packages were last verified successfully, stored as JSON"""
+
+    def __init__(self, verified: dict[str, float] | None = None) -> None:
+        self.verified: dict[str, float] = verified or {}
+
+    @classmethod
+    def load(cls, path: str) -> SampleHistory:
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.verified, f)
+        os.replace(tmp_path, path)
+
+    def last_verified(self, url: str) -> float:
+        return self.verified.get(url, 0.0)
+
+    def mark(self, url: str, when: float | None = None):
+        self.verified[url] = time.time() if when is None else when
+
+
+def _binomial_cdf(k: int, n: int, p: float) -> float:
+    if p <= 0:
+        return 1.0
+    if p >= 1:
+        return 1.0 if k >= n else 0.0
+    log_p, log_q = math.log(p), math.log1p(-p)
+    return min(
+        1.0,
+        sum(
+            math.exp(
+                math.lgamma(n + 1)
+                - math.lgamma(i + 1)
+                - math.lgamma(n - i + 1)
+                + i * log_p
+                + (n - i) * log_q
+            )
+            for i in range(k + 1)
+        ),
+    )
+
+
+def _solve(func: t.Callable[[float], float], target: float) -> float:
+    """Find p in [0, 1] with func(p) == target for a decreasing func"""
+    low, high = 0.0, 1.0
+    for _ in range(60):
+        mid = (low + high) / 2
+        if func(mid) > target:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+def clopper_pearson(failures: int, n: int, confidence: float) -> tuple[float, float]:
+    """Exact two-sided confidence interval of a binomial proportion"""
+    if n == 0:
+        return 0.0, 1.0
+    alpha = (1 - confidence) / 2
+    lower = (
+        0.0
+        if failures == 0
+        else _solve(lambda p: _binomial_cdf(failures - 1, n, p), 1 - alpha)
+    )
+    upper = (
+        1.0 if failures == n else _solve(lambda p: _binomial_cdf(failures, n, p), alpha)
+    )
+    return lower, upper
+
+
+class Sampler:
+    """Picks the packages of every group and keeps track of the outcome"""
+
+    def __init__(self, sample: Sample) -> None:
+        self.sample = sample
+        self.history = (
+            SampleHistory.load(sample.history) if sample.history else SampleHistory()
+        )
+        self._random = random.Random(sample.seed)
+        self._groups: set[str] = set()
+        self._population: set[str] = set()
+        self._selected: set[str] = set()
+        self._sampled: set[str] = set()
+        self._failures: set[str] = set()
+
+    def select(
+        self, group: str, candidates: list[tuple[str, T]]
+    ) -> list[tuple[str, T]]:
+        """
+        Choose the (url, item) candidates of a group to verify. Groups that
+        were seen before, e.g. as another compression of the same index,
+        get an empty selection. Candidates selected for another group are
+        picked last, like the ones verified most recently.
+        """
+        if group in self._groups:
+            return []
+        self._groups.add(group)
+        self._population.update(url for url, _ in candidates)
+
+        candidates = list(candidates)
+        self._random.shuffle(candidates)
+        candidates.sort(
+            key=lambda candidate: (
+                candidate[0] in self._selected,
+                self.history.last_verified(candidate[0]),
+            )
+        )
+        selection = candidates[: self.sample.size(len(candidates))]
+        self._selected.update(url for url, _ in selection)
+        return selection
+
+    def record(self, url: str, ok: bool):
+        self._sampled.add(url)
+        if ok:
+            self.history.mark(url)
+        else:
+            self._failures.add(url)
+
+    def save_history(self):
+        if self.sample.history:
+            self.history.save(self.sample.history)
+
+    def result(self) -> SamplingResult:
+        lower, upper = clopper_pearson(
+            len(self._failures), len(self._sampled), self.sample.confidence
+        )
+        return SamplingResult(
+            population=len(self._population),
+            sampled=len(self._sampled),
+            failures=len(self._failures),
+            confidence=self.sample.confidence,
+            lower=lower,
+            upper=upper,
+        )
@@ -2,22 +2,38 @@ from __future__ import annotations
 
 import functools
 import logging
+import os
 import typing as t
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from io import BufferedReader
 from urllib.parse import urljoin
 
 import typing_extensions as te
-from debian.deb822 import Packages
 
-from debian_repo_scrape.navigation import ApacheBrowseNavigator, BaseNavigator
+from debian_repo_scrape.instrumentation import phase, timed
+from debian_repo_scrape.keyring import Keyring
+from debian_repo_scrape.navigation import BaseNavigator, get_navigator
+from debian_repo_scrape.parsing import (
+    PACKAGE_FIELDS,
+    PackagesParser,
+    Paragraph,
+    _iter_packages,
+    iter_decompressed,
+    iter_stanzas,
+    source_files,
+)
+from debian_repo_scrape.pdiff import IndexCache
 from debian_repo_scrape.utils import (
+    IndexFilter,
     _get_file,
-    clear_response_cache,
+    _iter_file_abs,
+    _iter_verified,
+    _release_indexes,
     get_packages_files,
     get_release_file,
     get_suites,
     get_suites_flat,
+    response_cache_scope,
 )
 from debian_repo_scrape.verify import (
     VerificationModes,
@@ -55,6 +71,10 @@ class Suite(BaseDataclass):
     def packages(self) -> list[Package]:
         return [p for c in self.components for p in c.packages]
 
+    @property
+    def sources(self) -> list[SourcePackage]:
+        return [s for c in self.components for s in c.sources]
+
 
 _S = t.TypeVar("_S", FlatSuite, Suite)
 
@@ -78,23 +98,38 @@ class Repository(BaseDataclass, t.Generic[_S]):
             else [p for s in self.suites for p in s.packages]  # type: ignore
         )
 
+    @property
+    def sources(self) -> list[SourcePackage]:
+        return (
+            []
+            if self.flat
+            else [p for s in self.suites for p in s.sources]  # type: ignore
+        )
+
 
 @dataclass(frozen=True)
 class Component(BaseDataclass):
     name: str
     packages: list[Package]
     url: str
+    sources: list[SourcePackage] = field(default_factory=list)
+    """Only scraped with scrape_repo(sources=True)"""
 
 
 @dataclass(frozen=True)
 class Package(BaseDataclass):
+    """
+    A binary package. Fields that a scrape with fields= did not select are
+    None, name, version, architecture and date are always set.
+    """
+
     name: str
     version: str
-    url: str
-    size: int
-    sha256: str
-    sha1: str
-    md5: str
+    url: str | None
+    size: int | None
+    sha256: str | None
+    sha1: str | None
+    md5: str | None
     description: str | None
     maintainer: str | None
     section: str | None
@@ -105,113 +140,341 @@ class Package(BaseDataclass):
     phased_update_percentage: int | None
 
 
+PACKAGE_STANZA_FIELDS: dict[str, str] = {
+    "url": "filename",
+    "size": "size",
+    "sha256": "sha256",
+    "sha1": "sha1",
+    "md5": "md5sum",
+    "description": "description",
+    "maintainer": "maintainer",
+    "section": "section",
+    "priority": "priority",
+    "description_md5": "description-md5",
+    "phased_update_percentage": "phased-update-percentage",
+}
+"""The Packages field that every selectable Package field is parsed from"""
+_ALWAYS_KEPT = ("name", "version", "architecture", "date")
+
+
+def _stanza_fields(fields: t.Collection[str] | None) -> frozenset[str]:
+    """The Packages fields to parse for a selection of Package fields"""
+    if fields is None:
+        return PACKAGE_FIELDS
+    unknown = set(fields) - set(PACKAGE_STANZA_FIELDS) - set(_ALWAYS_KEPT)
+    if unknown:
+        raise ValueError(f"{', '.join(sorted(unknown))} are no Package fields")
+    return frozenset(
+        (
+            "package",
+            "version",
+            "architecture",
+            *(PACKAGE_STANZA_FIELDS[f] for f in fields if f in PACKAGE_STANZA_FIELDS),
+        )
+    )
+
+
+def __package(stanza: t.Mapping[str, t.Any], base_url: str, date: str) -> Package:
+    """Fields that were not parsed are None"""
+    filename = stanza.get("filename")
+    size = stanza.get("size")
+    return Package(
+        name=stanza["Package"],
+        version=stanza["version"],
+        url=urljoin(base_url, filename) if filename is not None else None,
+        architecture=stanza["architecture"],
+        date=date,
+        section=stanza.get("section"),
+        size=int(size) if size is not None else None,
+        sha256=stanza.get("sha256"),
+        sha1=stanza.get("sha1"),
+        md5=stanza.get("md5sum"),
+        priority=stanza.get("priority"),
+        maintainer=stanza.get("maintainer"),
+        description=stanza.get("description"),
+        description_md5=stanza.get("description-md5"),
+        phased_update_percentage=stanza.get("Phased-Update-Percentage"),
+    )
+
+
+@dataclass(frozen=True)
+class SourceFile(BaseDataclass):
+    name: str
+    url: str
+    size: int
+    md5: str | None
+    sha1: str | None
+    sha256: str | None
+
+
+@dataclass(frozen=True)
+class SourcePackage(BaseDataclass):
+    name: str
+    version: str
+    url: str
+    binaries: list[str]
+    architecture: str | None
+    format: str | None
+    maintainer: str | None
+    section: str | None
+    priority: str | None
+    date: str
+    files: list[SourceFile]
+
+
+def __scrape_sources(
+    base_url: str,
+    suite: str,
+    release_file: t.Mapping[str, t.Any],
+    index_filter: IndexFilter,
+) -> dict[str, list[SourcePackage]]:
+    """
+    Stream the Sources files of a suite, one compression of each, and check
+    them against the sizes and hash sums in the Release file
+    """
+    sources: dict[str, list[SourcePackage]] = {}
+    release_url = urljoin(base_url, f"dists/{suite}/Release")
+    for name, hashsums in _release_indexes(
+        release_file, r"(?:.*/)?Sources(\.\w+)?$", index_filter
+    ).items():
+        url = urljoin(base_url, f"dists/{suite}/{name}")
+        with phase("sources_file", suite=suite, url=url):
+            stanzas = iter_stanzas(
+                iter_decompressed(
+                    _iter_verified(_iter_file_abs(url), hashsums, url, release_url),
+                    os.path.splitext(name)[1],
+                )
+            )
+            sources[name.split("/")[0]] = [
+                SourcePackage(
+                    name=s["Package"],
+                    version=s["version"],
+                    url=urljoin(base_url, s["directory"]),
+                    binaries=[
+                        b.strip()
+                        for b in (s.get("binary") or "").split(",")
+                        if b.strip()
+                    ],
+                    architecture=s.get("architecture"),
+                    format=s.get("format"),
+                    maintainer=s.get("maintainer"),
+                    section=s.get("section"),
+                    priority=s.get("priority"),
+                    date=release_file["date"],
+                    files=[
+                        SourceFile(
+                            name=file_name,
+                            url=urljoin(base_url, f'{s["directory"]}/{file_name}'),
+                            size=int(file["size"]),
+                            md5=file.get("md5sum"),
+                            sha1=file.get("sha1"),
+                            sha256=file.get("sha256"),
+                        )
+                        for file_name, file in source_files(s).items()
+                    ],
+                )
+                for s in stanzas
+            ]
+    return sources
+
+
+def __scrape_suite(
+    base_url: str,
+    suite: str,
+    in_release_first: bool,
+    parser: PackagesParser,
+    sources: bool,
+    index_cache: IndexCache | None,
+    index_filter: IndexFilter,
+    verified_release_file: Paragraph | None = None,
+) -> Suite:
+    release_file = verified_release_file
+    if release_file is None:
+        release_file = get_release_file(
+            base_url, suite, in_release_first=in_release_first
+        )
+    components: list[Component] = []
+    packages_map = get_packages_files(
+        base_url,
+        suite,
+        in_release_first,
+        parser,
+        index_cache,
+        index_filter,
+        verified_release_file,
+    )
+    sources_map = (
+        __scrape_sources(base_url, suite, release_file, index_filter) if sources else {}
+    )
+    for component in sources_map:
+        packages_map.setdefault(component, [])
+    for component, packages in packages_map.items():
+        pkgs = [__package(p, base_url, release_file["date"]) for p in packages]
+        components.append(
+            Component(
+                name=component,
+                packages=pkgs,
+                url=urljoin(base_url, f"dists/{suite}/{component}"),
+                sources=sources_map.get(component, []),
+            )
+        )
+    return Suite(
+        name=suite,
+        url=urljoin(base_url, f"{suite}"),
+        components=components,
+        architectures=release_file["architectures"].split(),
+        date=release_file["date"],
+    )
+
+
+@timed("scrape")
+@response_cache_scope()
 def scrape_repo(
     repo_url: str | BaseNavigator,
-    pub_key_file: str | BufferedReader | bytes,
+    pub_key_file: str | BufferedReader | bytes | Keyring,
     verify: VerificationModes | str | te.Literal[False] = VerificationModes.STRICT,
+    in_release_first: bool = False,
+    workers: int = 1,
+    parse_workers: int = 1,
+    sources: bool = False,
+    index_cache: IndexCache | None = None,
+    suites: t.Collection[str] | None = None,
+    components: t.Collection[str] | None = None,
+    architectures: t.Collection[str] | None = None,
+    fields: t.Collection[str] | None = None,
 ) -> Repository[Suite]:
-    navigator = (
-        ApacheBrowseNavigator(repo_url) if isinstance(repo_url, str) else repo_url
-    )
+    """
+    Scrape the packages of every suite, with sources also the source
+    packages listed in the Sources files. With an IndexCache, Packages files
+    fetched by an earlier scrape are updated with pdiffs where possible.
+
+    suites, components and architectures restrict scraping and verification
+    to them, indexes of other ones are not requested. fields selects the
+    Package fields to parse (e.g. ["sha256"]), the others are skipped by
+    the parser and left None.
+    """
+    navigator = get_navigator(repo_url)
+    index_filter = IndexFilter(suites, components, architectures)
+    stanza_fields = _stanza_fields(fields)
 
     if verify:
-        verify_release_signatures(navigator, pub_key_file)
-        verify_hash_sums(navigator, verify)
+        verify_release_signatures(
+            navigator, pub_key_file, workers=workers, in_release_only=in_release_first
+        )
+        verify_hash_sums(
+            navigator,
+            verify,
+            in_release_first=in_release_first,
+            workers=workers,
+            suites=suites,
+            components=components,
+            architectures=architectures,
+        )
 
     navigator.set_checkpoint()
     navigator.reset()
     navigator["dists"]
-    suites: list[Suite] = []
-    for suite in get_suites(navigator):
-
-        release_file = get_release_file(navigator.base_url, suite)
-        components: list[Component] = []
-        packages_map = get_packages_files(navigator.base_url, suite)
-        for component, packages in packages_map.items():
-            pkgs = [
-                Package(
-                    name=p["Package"],
-                    version=p["version"],
-                    url=urljoin(navigator.base_url, p["filename"]),
-                    architecture=p["architecture"],
-                    date=release_file["date"],
-                    section=p.get("section"),
-                    size=int(p["size"]),
-                    sha256=p["sha256"],
-                    sha1=p["sha1"],
-                    md5=p["md5sum"],
-                    priority=p.get("priority"),
-                    maintainer=p.get("maintainer"),
-                    description=p.get("description"),
-                    description_md5=p.get("description_md5"),
-                    phased_update_percentage=p.get("Phased-Update-Percentage"),
-                )
-                for p in packages
-            ]
-            components.append(
-                Component(
-                    name=component,
-                    packages=pkgs,
-                    url=urljoin(navigator.base_url, f"dists/{suite}/{component}"),
-                )
-            )
-        suites.append(
-            Suite(
-                name=suite,
-                url=urljoin(navigator.base_url, f"{suite}"),
-                components=components,
-                architectures=release_file["architectures"].split(),
-                date=release_file["date"],
+    with PackagesParser(parse_workers, fields=stanza_fields) as parser:
+        scraped = [
+            __scrape_suite(
+                navigator.base_url,
+                suite,
+                in_release_first,
+                parser,
+                sources,
+                index_cache,
+                index_filter,
             )
-        )
+            for suite in get_suites(navigator)
+            if index_filter.selects_suite(suite)
+        ]
     navigator.use_checkpoint()
-    clear_response_cache()
-    return Repository(url=navigator.base_url, suites=suites)
+    return Repository(url=navigator.base_url, suites=scraped)
+
+
+@response_cache_scope()
+def scrape_suite(
+    repo_url: str,
+    suite: str,
+    in_release_first: bool = False,
+    components: t.Collection[str] | None = None,
+    architectures: t.Collection[str] | None = None,
+    fields: t.Collection[str] | None = None,
+    release_file: Paragraph | None = None,
+) -> Suite:
+    """
+    Scrape the packages of one suite without discovering the suites of the
+    repository and without verification. The arguments are like in scrape_repo.
+    Pass the parsed Release file of the suite if it was verified already,
+    it is not fetched again and the Packages files are checked against it.
+    """
+    with PackagesParser(fields=_stanza_fields(fields)) as parser:
+        return __scrape_suite(
+            repo_url if repo_url.endswith("/") else f"{repo_url}/",
+            suite,
+            in_release_first,
+            parser,
+            False,
+            None,
+            IndexFilter(components=components, architectures=architectures),
+            release_file,
+        )
 
 
+@timed("scrape")
+@response_cache_scope()
 def scrape_flat_repo(
     repo_url: str | BaseNavigator,
-    pub_key_file: str | BufferedReader | bytes,
+    pub_key_file: str | BufferedReader | bytes | Keyring,
     verify: VerificationModes | str | te.Literal[False] = VerificationModes.STRICT,
+    in_release_first: bool = False,
+    workers: int = 1,
+    fields: t.Collection[str] | None = None,
 ) -> Repository[FlatSuite]:
-    navigator = (
-        ApacheBrowseNavigator(repo_url) if isinstance(repo_url, str) else repo_url
-    )
+    """fields selects the Package fields to parse like in scrape_repo"""
+    navigator = get_navigator(repo_url)
+    stanza_fields = _stanza_fields(fields)
 
     if verify:
-        verify_release_signatures(navigator, pub_key_file, flat_repo=True)
-        verify_hash_sums(navigator, verify, flat_repo=True)
+        verify_release_signatures(
+            navigator,
+            pub_key_file,
+            flat_repo=True,
+            workers=workers,
+            in_release_only=in_release_first,
+        )
+        verify_hash_sums(
+            navigator,
+            verify,
+            flat_repo=True,
+            in_release_first=in_release_first,
+            workers=workers,
+        )
 
     navigator.set_checkpoint()
     navigator.reset()
     suites: list[FlatSuite] = []
 
     for suite in get_suites_flat(navigator):
-        release_file = get_release_file(navigator.base_url, suite, flat_repo=True)
-        packages_file = Packages(
-            _get_file(navigator.base_url, f"{suite}/Packages" if suite else "Packages")
+        release_file = get_release_file(
+            navigator.base_url, suite, True, in_release_first
         )
-        package = Package(
-            name=packages_file["Package"],
-            version=packages_file["version"],
-            url=urljoin(
-                navigator.base_url,
-                f'{suite}/{packages_file["filename"]}'
-                if suite
-                else packages_file["filename"],
+        packages_file = next(
+            _iter_packages(
+                _get_file(
+                    navigator.base_url, f"{suite}/Packages" if suite else "Packages"
+                ),
+                stanza_fields,
             ),
-            architecture=packages_file["architecture"],
-            date=release_file["date"],
-            section=packages_file.get("section"),
-            size=int(packages_file["size"]),
-            sha256=packages_file["sha256"],
-            sha1=packages_file["sha1"],
-            md5=packages_file["md5sum"],
-            priority=packages_file.get("priority"),
-            maintainer=packages_file.get("maintainer"),
-            description=packages_file.get("description"),
-            description_md5=packages_file.get("description_md5"),
-            phased_update_percentage=packages_file.get("Phased-Update-Percentage"),
+            None,
+        )
+        if packages_file is None:
+            log.warning(f"The Packages file of {suite or 'the repository'} is empty")
+            continue
+        package = __package(
+            packages_file,
+            urljoin(navigator.base_url, f"{suite}/") if suite else navigator.base_url,
+            release_file["date"],
         )
         suites.append(
             FlatSuite(
@@ -224,5 +487,4 @@ def scrape_flat_repo(
         )
 
     navigator.use_checkpoint()
-    clear_response_cache()
     return Repository(url=navigator.base_url, suites=suites)
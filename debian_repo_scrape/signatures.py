@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import typing as t
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+
+from debian_repo_scrape.exc import SignatureInvalid
+from debian_repo_scrape.instrumentation import phase
+from debian_repo_scrape.keyring import Keyring
+
+log = logging.getLogger(__name__)
+
+SignedFile = t.Tuple[str, bytes, t.Optional[bytes]]
+"""(url, data, detached signature or None for clearsigned data)"""
+
+
+class SignatureBackend(metaclass=ABCMeta):
+    """
+    Base class for engines that verify release signatures.
+
+    Use it as a context manager and submit the signed files of one suite at a
+    time. Every returned future resolves to a list of (file, reason) tuples
+    for the signatures that could not be verified.
+    """
+
+    def __init__(self, keyring: Keyring, workers: int = 1) -> None:
+        self.keyring = keyring
+        self.workers = workers
+        self._executor: Executor | None = None
+
+    def _create_executor(self) -> Executor | None:
+        if self.workers > 1:
+            return ThreadPoolExecutor(self.workers)
+        return None
+
+    def __enter__(self):
+        self._executor = self._create_executor()
+        return self
+
+    def __exit__(self, *_):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @abstractmethod
+    def verify(self, signed_files: list[SignedFile]) -> list[tuple[str, str]]:
+        """Verify signed files and return (file, reason) for every failure"""
+
+    def submit(self, signed_files: list[SignedFile]) -> Future[list[tuple[str, str]]]:
+        if self._executor is not None:
+            return self._executor.submit(self.verify, signed_files)
+        future: Future[list[tuple[str, str]]] = Future()
+        future.set_result(self.verify(signed_files))
+        return future
+
+
+class PGPyBackend(SignatureBackend):
+    """Verifies signatures with pgpy, in a process pool if workers > 1"""
+
+    def _create_executor(self) -> Executor | None:
+        if self.workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            return ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.keyring,)
+            )
+        return None
+
+    def verify(self, signed_files: list[SignedFile]) -> list[tuple[str, str]]:
+        errors: list[tuple[str, str]] = []
+        for file, data, signature in signed_files:
+            try:
+                with phase("pgp", url=file):
+                    self.keyring.verify(data, signature, file)
+            except SignatureInvalid as e:
+                errors.append((e.file, e.reason))
+        return errors
+
+    def submit(self, signed_files: list[SignedFile]) -> Future[list[tuple[str, str]]]:
+        if self._executor is not None:
+            return self._executor.submit(_verify_in_worker, signed_files)
+        return super().submit(signed_files)
+
+
+_worker_keyring: Keyring | None = None
+
+
+def _init_worker(keyring: Keyring):
+    global _worker_keyring
+    _worker_keyring = keyring
+
+
+def _verify_in_worker(signed_files: list[SignedFile]) -> list[tuple[str, str]]:
+    assert _worker_keyring is not None
+    return PGPyBackend(_worker_keyring).verify(signed_files)
+
+
+class GPGVBackend(SignatureBackend):
+    """
+    Verifies signatures with the gpgv binary, running up to workers
+    gpgv processes at the same time
+    """
+
+    def __init__(self, keyring: Keyring, workers: int = 1, gpgv: str = "gpgv") -> None:
+        super().__init__(keyring, workers)
+        executable = shutil.which(gpgv)
+        if executable is None:
+            raise FileNotFoundError(f"Could not find {gpgv} executable")
+        self.gpgv = executable
+        self._tempdir: tempfile.TemporaryDirectory | None = None
+        self._keyring_file = ""
+
+    def __enter__(self):
+        self._tempdir = tempfile.TemporaryDirectory(prefix="debian_repo_scrape")
+        self._keyring_file = os.path.join(self._tempdir.name, "keyring.gpg")
+        with open(self._keyring_file, "wb") as f:
+            for key in self.keyring.keys:
+                f.write(bytes(key))
+        return super().__enter__()
+
+    def __exit__(self, *args):
+        super().__exit__(*args)
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+            self._tempdir = None
+
+    def _run(self, file: str, data: bytes, signature: bytes | None) -> str | None:
+        assert self._tempdir is not None
+        with tempfile.TemporaryDirectory(dir=self._tempdir.name) as workdir:
+            data_file = os.path.join(workdir, "data")
+            with open(data_file, "wb") as f:
+                f.write(data)
+            args = [self.gpgv, "--status-fd", "1", "--keyring", self._keyring_file]
+            if signature is not None:
+                signature_file = os.path.join(workdir, "signature")
+                with open(signature_file, "wb") as f:
+                    f.write(signature)
+                args.append(signature_file)
+            args.append(data_file)
+            with phase("gpgv", url=file):
+                process = subprocess.run(args, capture_output=True)
+
+        status = {
+            line.split()[1]: line
+            for line in process.stdout.decode(errors="replace").splitlines()
+            if line.startswith("[GNUPG:] ")
+        }
+        if process.returncode == 0 and "VALIDSIG" in status:
+            if "EXPKEYSIG" in status:
+                if self.keyring.reject_expired:
+                    return "Expired"
+                log.warning(f"Signature of {file} was made by an expired key")
+            return None
+        if "BADSIG" in status:
+            return "WrongSig"
+        if "NO_PUBKEY" in status:
+            return f"no key for signer {status['NO_PUBKEY'].split()[2]}"
+        return process.stderr.decode(errors="replace").strip() or "gpgv failed"
+
+    def verify(self, signed_files: list[SignedFile]) -> list[tuple[str, str]]:
+        errors: list[tuple[str, str]] = []
+        for file, data, signature in signed_files:
+            reason = self._run(file, data, signature)
+            if reason is not None:
+                errors.append((file, reason))
+        return errors
+
+
+BACKENDS: dict[str, t.Type[SignatureBackend]] = {
+    "pgpy": PGPyBackend,
+    "gpgv": GPGVBackend,
+}
+
+_default_backend: t.Type[SignatureBackend] = PGPyBackend
+
+
+def get_backend(
+    backend: str | t.Type[SignatureBackend] | None = None,
+) -> t.Type[SignatureBackend]:
+    if backend is None:
+        return _default_backend
+    if isinstance(backend, str):
+        try:
+            return BACKENDS[backend]
+        except KeyError:
+            raise ValueError(f"{backend} is not a valid signature backend")
+    return backend
+
+
+def set_default_backend(backend: str | t.Type[SignatureBackend]):
+    """Set the backend used when verify functions are not given one explicitly"""
+    global _default_backend
+    _default_backend = get_backend(backend)
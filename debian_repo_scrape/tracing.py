@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+from debian_repo_scrape.instrumentation import Observer, PhaseEvent, RequestEvent
+
+
+@dataclass(frozen=True)
+class Span:
+    id: int
+    parent_id: int | None
+    name: str
+    start: float
+    duration: float
+    thread_id: int
+    attributes: dict[str, t.Any] = field(default_factory=dict)
+    category: str = "phase"
+
+
+class Tracer(Observer):
+    """
+    Observer that records phases as nested spans and requests as leaf spans.
+
+    Register it with debian_repo_scrape.instrumentation.observe and export
+    the result with write_chrome_trace to open it in chrome://tracing or
+    any other viewer for the trace event format.
+    """
+
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.spans: list[Span] = []
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _stack(self) -> list[int]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def on_phase_start(self, name: str, attributes: dict[str, t.Any]):
+        self._stack.append(next(self._ids))
+
+    def on_phase(self, event: PhaseEvent):
+        stack = self._stack
+        span_id = stack.pop() if stack else next(self._ids)
+        self._record(
+            Span(
+                id=span_id,
+                parent_id=stack[-1] if stack else None,
+                name=event.name,
+                start=event.start,
+                duration=event.duration,
+                thread_id=event.thread_id,
+                attributes=dict(event.attributes),
+            )
+        )
+
+    def on_request(self, event: RequestEvent):
+        stack = self._stack
+        self._record(
+            Span(
+                id=next(self._ids),
+                parent_id=stack[-1] if stack else None,
+                name=f"{event.method} {event.url_class}",
+                start=time.perf_counter() - event.latency,
+                duration=event.latency,
+                thread_id=threading.get_ident(),
+                attributes={
+                    "url": event.url,
+                    "status_code": event.status_code,
+                    "bytes": event.bytes,
+                    "cache_hit": event.cache_hit,
+                },
+                category="request",
+            )
+        )
+
+    def _record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def children(self, span: Span) -> list[Span]:
+        return [s for s in self.spans if s.parent_id == span.id]
+
+    def to_chrome_trace(self) -> dict[str, t.Any]:
+        """Convert the spans to complete events of the chrome trace event format"""
+        pid = os.getpid()
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": (span.start - self.origin) * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": span.attributes,
+                }
+                for span in sorted(self.spans, key=lambda s: s.start)
+            ],
+        }
+
+    def write_chrome_trace(self, file: str | os.PathLike | t.TextIO):
+        trace = self.to_chrome_trace()
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "w") as f:
+                json.dump(trace, f, default=str)
+        else:
+            json.dump(trace, file, default=str)
@@ -1,34 +1,103 @@
 from __future__ import annotations
 
+import contextlib
 import functools
+import hashlib
 import logging
+import mmap
+import os
 import re
+import threading
+import time
 import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from urllib.parse import urljoin
 
-import requests
-from debian.deb822 import Packages, Release
-
-from debian_repo_scrape.exc import FileRequestError, NoDistsPath
+from debian_repo_scrape.exc import (
+    FileRequestError,
+    HashInvalid,
+    MD5SumInvalid,
+    NoDistsPath,
+    SHA1Invalid,
+    SHA256Invalid,
+    SignatureInvalid,
+    SizeInvalid,
+)
+from debian_repo_scrape.fetch import get_scheduler, local_path
+from debian_repo_scrape.instrumentation import emit_request, observed, phase, timed
+from debian_repo_scrape.parsing import PackagesParser, Paragraph, parse_release
 
 if t.TYPE_CHECKING:
     from debian_repo_scrape.navigation import BaseNavigator
+    from debian_repo_scrape.pdiff import IndexCache
 
 log = logging.getLogger(__name__)
 
+CHUNK_SIZE = 2**20
+"""Size of the chunks that streamed downloads are read in"""
 
-@functools.lru_cache(None)
-def __get_response(url: str):
-    return requests.get(url, allow_redirects=True)
 
+_responses: dict[str, t.Any] = {}
+_responses_lock = threading.Lock()
 
-def _get_response(url: str):
 
-    return __get_response(url.strip("/"))
+def __get_response(url: str) -> tuple[t.Any, bool]:
+    """Return the cached or fetched response and whether it was cached"""
+    with _responses_lock:
+        resp = _responses.get(url)
+    if resp is not None:
+        return resp, True
+    resp = get_scheduler().get(url)
+    with _responses_lock:
+        return _responses.setdefault(url, resp), False
 
 
-def clear_response_cache():
-    return __get_response.cache_clear()
+def _get_response(url: str):
+    url = url.strip("/")
+    if not observed():
+        return __get_response(url)[0]
+
+    start = time.perf_counter()
+    resp, cache_hit = __get_response(url)
+    latency = time.perf_counter() - start
+    emit_request(url, resp.status_code, len(resp.content), latency, cache_hit)
+    return resp
+
+
+def clear_response_cache(prefix: str | None = None):
+    """Forget cached responses, with a prefix only those of urls below it"""
+    with _responses_lock:
+        if prefix is None:
+            _responses.clear()
+            return
+        prefix = prefix.strip("/")
+        for url in [
+            url for url in _responses if url == prefix or url.startswith(f"{prefix}/")
+        ]:
+            del _responses[url]
+
+
+_cache_scopes = 0
+_cache_scopes_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def response_cache_scope():
+    """
+    Keep responses cached until the outermost scope is left, so that
+    nested scrape and verify calls share their downloads
+    """
+    global _cache_scopes
+    with _cache_scopes_lock:
+        _cache_scopes += 1
+    try:
+        yield
+    finally:
+        with _cache_scopes_lock:
+            _cache_scopes -= 1
+            if not _cache_scopes:
+                clear_response_cache()
 
 
 def _get_file_abs(
@@ -40,6 +109,102 @@ def _get_file_abs(
     return resp.content
 
 
+def _iter_file_abs(url: str, chunk_size: int = CHUNK_SIZE) -> t.Iterator[bytes]:
+    """
+    Yield the content of a file in chunks while downloading or reading it.
+    The response is not cached.
+    """
+    url = url.strip("/")
+    start = time.perf_counter()
+    size = 0
+    path = local_path(url)
+    if path is not None:
+        try:
+            f = open(path, "rb")
+        except (FileNotFoundError, IsADirectoryError):
+            emit_request(url, 404, 0, time.perf_counter() - start, False)
+            raise FileRequestError(url, 404)
+        with f:
+            for chunk in iter(functools.partial(f.read, chunk_size), b""):
+                size += len(chunk)
+                yield chunk
+        emit_request(url, 200, size, time.perf_counter() - start, False)
+        return
+
+    scheduler = get_scheduler()
+    with scheduler.get(url, stream=True) as resp:
+        if resp.status_code != 200:
+            emit_request(url, resp.status_code, 0, time.perf_counter() - start, False)
+            raise FileRequestError(url, resp.status_code)
+        for chunk in resp.iter_content(chunk_size):
+            size += len(chunk)
+            scheduler.throttle(len(chunk))
+            yield chunk
+    emit_request(url, 200, size, time.perf_counter() - start, False)
+
+
+def _stream_hash_abs(url: str, hash_method: str) -> str:
+    """
+    Hash a file while downloading it, without holding its content in memory.
+    The response is not cached.
+    """
+    return _hash_file_abs(url, [hash_method])[1][0]
+
+
+def _hash_local_file(path: str, hash_methods: list[str]) -> tuple[int, list[str]]:
+    """Hash a memory-mapped file, without copying it, with every hash method"""
+    hashes = [hashlib.new(hash_method) for hash_method in hash_methods]
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for hash_ in hashes:
+                    hash_.update(mapped)
+    return size, [hash_.hexdigest() for hash_ in hashes]
+
+
+def _hash_file_abs(url: str, hash_methods: list[str]) -> tuple[int, list[str]]:
+    """
+    Return the size and the hash sums of a file. Local files are hashed
+    directly from disk, remote files chunk by chunk while downloading them,
+    so memory use does not grow with the file size. The response is not
+    cached.
+    """
+    path = local_path(url)
+    if path is None:
+        hashes = [hashlib.new(hash_method) for hash_method in hash_methods]
+        size = 0
+        for chunk in _iter_file_abs(url):
+            for hash_ in hashes:
+                hash_.update(chunk)
+            size += len(chunk)
+        return size, [hash_.hexdigest() for hash_ in hashes]
+
+    start = time.perf_counter()
+    try:
+        size, hashsums = _hash_local_file(path, hash_methods)
+    except (FileNotFoundError, IsADirectoryError):
+        emit_request(url, 404, 0, time.perf_counter() - start, False)
+        raise FileRequestError(url, 404)
+    emit_request(url, 200, size, time.perf_counter() - start, False)
+    return size, hashsums
+
+
+def _get_size_abs(url: str) -> int | None:
+    """
+    Check that a file exists with a HEAD request and return its size
+    or None if the server does not send a Content-Length
+    """
+    url = url.strip("/")
+    start = time.perf_counter()
+    resp = get_scheduler().head(url)
+    emit_request(url, resp.status_code, 0, time.perf_counter() - start, False, "HEAD")
+    if resp.status_code != 200:
+        raise FileRequestError(url, resp.status_code)
+    content_length = resp.headers.get("Content-Length")
+    return int(content_length) if content_length is not None else None
+
+
 def _get_file(base_url: str, rel_path: str) -> bytes:
     if not base_url.endswith("/"):
         base_url += "/"
@@ -48,23 +213,187 @@ def _get_file(base_url: str, rel_path: str) -> bytes:
     return _get_file_abs(url)
 
 
-def _get_release_file(repo_url: str, suite: str, flat_repo: bool = False):
+def _suite_path(suite: str, flat_repo: bool = False) -> str:
     if not flat_repo:
-        path = f"dists/{suite}/Release"
+        return f"dists/{suite}/"
     elif suite:
-        path = f"{suite}/Release"
-    else:
-        path = "Release"
+        return f"{suite}/"
+    return ""
 
-    return _get_file(repo_url, path)
 
+_SIGNED_MESSAGE_HEADER = b"-----BEGIN PGP SIGNED MESSAGE-----"
+_SIGNATURE_HEADER = b"-----BEGIN PGP SIGNATURE-----"
 
-def get_release_file(repo_url: str, suite: str, flat_repo: bool = False):
-    return Release(_get_release_file(repo_url, suite, flat_repo).split(b"\n"))
 
+def _extract_signed_text(content: bytes, file: str = "") -> bytes:
+    """Return the text of a clearsigned message like InRelease"""
+    lines = content.splitlines()
+    try:
+        start = lines.index(_SIGNED_MESSAGE_HEADER)
+        end = lines.index(_SIGNATURE_HEADER, start)
+        # the armor headers are followed by an empty line
+        text_start = lines.index(b"", start, end) + 1
+    except ValueError:
+        raise SignatureInvalid(file, "not a clearsigned message")
+    return b"".join(
+        (line[2:] if line.startswith(b"- ") else line) + b"\n"
+        for line in lines[text_start:end]
+    )
+
+
+def _get_release_file(
+    repo_url: str, suite: str, flat_repo: bool = False, in_release_first: bool = False
+):
+    """
+    Fetch the Release file of a suite. With in_release_first the Release
+    data is taken from InRelease and Release is only fetched if InRelease
+    is missing.
+    """
+    base_path = _suite_path(suite, flat_repo)
+    if in_release_first:
+        try:
+            in_release_file = _get_file(repo_url, f"{base_path}InRelease")
+        except FileRequestError:
+            log.info(f"No InRelease file for {suite}, using Release")
+        else:
+            return _extract_signed_text(
+                in_release_file, f"{repo_url.rstrip('/')}/{base_path}InRelease"
+            )
 
-def _get_packages_files(repo_url: str, suite: str) -> dict[str, list[bytes]]:
-    release_file = get_release_file(repo_url, suite)
+    return _get_file(repo_url, f"{base_path}Release")
+
+
+def get_release_file(
+    repo_url: str, suite: str, flat_repo: bool = False, in_release_first: bool = False
+) -> Paragraph:
+    with phase("release", suite=suite):
+        return parse_release(
+            _get_release_file(repo_url, suite, flat_repo, in_release_first)
+        )
+
+
+# the architecture of binary-<arch>/ indexes and Contents-[udeb-]<arch> files
+_INDEX_ARCHITECTURE_RE = re.compile(r"(?:^|/)(?:binary-|Contents-(?:udeb-)?)([^/.]+)")
+
+
+@dataclass(frozen=True)
+class IndexFilter:
+    """
+    Restricts scraping and verification to some suites, components and
+    architectures. None selects all of them. Architecture "all" is always
+    selected like apt does.
+    """
+
+    suites: t.Collection[str] | None = None
+    components: t.Collection[str] | None = None
+    architectures: t.Collection[str] | None = None
+
+    def selects_suite(self, suite: str) -> bool:
+        return self.suites is None or suite in self.suites
+
+    def selects_index(self, name: str) -> bool:
+        """
+        Whether a file listed in a Release file, e.g. main/binary-amd64/Packages,
+        belongs to the selected components and architectures
+        """
+        component, slash, _ = name.partition("/")
+        if self.components is not None and slash and component not in self.components:
+            return False
+        if self.architectures is not None:
+            match = _INDEX_ARCHITECTURE_RE.search(name)
+            if match is not None and match.group(1) not in {*self.architectures, "all"}:
+                return False
+        return True
+
+
+_PREFERRED_COMPRESSIONS = (".xz", ".gz", ".bz2", ".lzma", "")
+_RELEASE_HASH_KEYS = ("SHA256", "SHA1", "MD5Sum")
+
+
+def _release_indexes(
+    release_file: t.Mapping[str, t.Any],
+    name_regex: str,
+    index_filter: IndexFilter | None = None,
+) -> dict[str, dict[str, str]]:
+    """
+    Size and hash sums (md5sum, sha1, sha256) of the files in a Release file
+    that match name_regex, whose first group is the compression suffix.
+    Only the preferred compression of every index is returned.
+    """
+    candidates: dict[str, dict[str, dict[str, str]]] = {}
+    for key in _RELEASE_HASH_KEYS:
+        for file in release_file.get(key) or ():
+            match = re.match(name_regex, file["name"])
+            if match is None:
+                continue
+            if index_filter is not None and not index_filter.selects_index(
+                file["name"]
+            ):
+                continue
+            compression = match.group(1) or ""
+            if compression not in _PREFERRED_COMPRESSIONS:
+                continue
+            stem = file["name"][: len(file["name"]) - len(compression)]
+            hashsums = candidates.setdefault(stem, {}).setdefault(
+                file["name"], {"size": file["size"]}
+            )
+            hashsums[key.lower()] = file[key.lower()]
+
+    indexes: dict[str, dict[str, str]] = {}
+    for stem, by_name in candidates.items():
+        for compression in _PREFERRED_COMPRESSIONS:
+            if stem + compression in by_name:
+                indexes[stem + compression] = by_name[stem + compression]
+                break
+    return indexes
+
+
+# hashlib names and errors of the hash sums in Release files
+_RELEASE_HASHES: dict[str, tuple[str, t.Type[HashInvalid]]] = {
+    "SHA256": ("sha256", SHA256Invalid),
+    "SHA1": ("sha1", SHA1Invalid),
+    "MD5Sum": ("md5", MD5SumInvalid),
+}
+
+
+def _iter_verified(
+    chunks: t.Iterable[bytes], hashsums: dict[str, str], url: str, release_url: str
+) -> t.Iterator[bytes]:
+    """
+    Pass chunks through and check them against the size and the strongest
+    hash sum of their entry in a Release file, see _release_indexes
+    """
+    key = next((key for key in _RELEASE_HASHES if key.lower() in hashsums), None)
+    hash_ = hashlib.new(_RELEASE_HASHES[key][0]) if key is not None else None
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if hash_ is not None:
+            hash_.update(chunk)
+        yield chunk
+    if hash_ is not None and key is not None:
+        if hash_.hexdigest() != hashsums[key.lower()]:
+            raise _RELEASE_HASHES[key][1](url, release_url)
+    if "size" in hashsums and size != int(hashsums["size"]):
+        raise SizeInvalid(url, release_url)
+
+
+def _get_packages_files(
+    repo_url: str,
+    suite: str,
+    in_release_first: bool = False,
+    index_cache: IndexCache | None = None,
+    index_filter: IndexFilter | None = None,
+    release_file: Paragraph | None = None,
+) -> dict[str, list[bytes]]:
+    check_hashes = release_file is not None
+    if release_file is None:
+        release_file = get_release_file(
+            repo_url, suite, in_release_first=in_release_first
+        )
+    release_url = urljoin(
+        repo_url, f"dists/{suite}/{'InRelease' if in_release_first else 'Release'}"
+    )
     packages: dict[str, list[bytes]] = {}
     for key in ("SHA256", "SHA1", "MD5Sum"):
         val = release_file.get(key, None)
@@ -74,9 +403,30 @@ def _get_packages_files(repo_url: str, suite: str) -> dict[str, list[bytes]]:
 
                 if not filename.endswith("Packages"):
                     continue
+                if index_filter is not None and not index_filter.selects_index(
+                    filename
+                ):
+                    continue
                 component_name = filename.split("/")[0]
                 comp_packages = packages.get(component_name, None)
-                packages_file = _get_file(repo_url, f"dists/{suite}/{filename}")
+                path = f"dists/{suite}/{filename}"
+                with phase(
+                    "packages_file", suite=suite, component=component_name, url=path
+                ) as span:
+                    packages_file = (
+                        index_cache.fetch(
+                            urljoin(repo_url.rstrip("/") + "/", path),
+                            {key.lower(): file[key.lower()]},
+                        )
+                        if index_cache is not None
+                        else _get_file(repo_url, path)
+                    )
+                    span.set_attributes(bytes=len(packages_file))
+                if check_hashes:
+                    hash_method, exc = _RELEASE_HASHES[key]
+                    digest = hashlib.new(hash_method, packages_file).hexdigest()
+                    if digest != file[key.lower()]:
+                        raise exc(urljoin(repo_url, path), release_url)
                 if not packages_file:
                     continue
                 if comp_packages is not None:
@@ -88,11 +438,41 @@ def _get_packages_files(repo_url: str, suite: str) -> dict[str, list[bytes]]:
     return packages
 
 
-def get_packages_files(repo_url: str, suite: str) -> dict[str, list[Packages]]:
-    return {
-        component: [Packages(p.split(b"\n")) for p in ps]
-        for component, ps in _get_packages_files(repo_url, suite).items()
-    }
+def get_packages_files(
+    repo_url: str,
+    suite: str,
+    in_release_first: bool = False,
+    parser: PackagesParser | None = None,
+    index_cache: IndexCache | None = None,
+    index_filter: IndexFilter | None = None,
+    release_file: Paragraph | None = None,
+) -> dict[str, list[Paragraph]]:
+    """
+    Fetch and parse the Packages files of a suite by component.
+    Pass a PackagesParser with workers to parse them in a process pool,
+    an IndexCache to update previously fetched Packages files with pdiffs
+    and an IndexFilter to only fetch some components and architectures.
+    A parsed release_file is used instead of fetching it, the Packages files
+    are checked against its hash sums then.
+    """
+    with phase("packages", suite=suite):
+        packages_files = _get_packages_files(
+            repo_url, suite, in_release_first, index_cache, index_filter, release_file
+        )
+        with phase("parse", suite=suite):
+            parsed = iter(
+                (parser or PackagesParser()).parse(
+                    [
+                        content
+                        for contents in packages_files.values()
+                        for content in contents
+                    ]
+                )
+            )
+            return {
+                component: [p for _ in contents for p in next(parsed)]
+                for component, contents in packages_files.items()
+            }
 
 
 def __get_suites(navigator: BaseNavigator) -> list[str]:
@@ -121,6 +501,7 @@ def __get_suites(navigator: BaseNavigator) -> list[str]:
     return suites
 
 
+@timed("discovery")
 def get_suites(navigator: BaseNavigator) -> list[str]:
     navigator.set_checkpoint()
     navigator.reset()
@@ -136,6 +517,7 @@ def get_suites(navigator: BaseNavigator) -> list[str]:
     return suites
 
 
+@timed("discovery")
 def get_suites_flat(navigator: BaseNavigator) -> list[str]:
     navigator.set_checkpoint()
     navigator.reset()
@@ -147,3 +529,84 @@ def get_suites_flat(navigator: BaseNavigator) -> list[str]:
 
     navigator.use_checkpoint()
     return suites
+
+
+CODENAMES = (
+    # debian
+    "stable",
+    "oldstable",
+    "oldoldstable",
+    "testing",
+    "unstable",
+    "experimental",
+    "sid",
+    "jessie",
+    "stretch",
+    "buster",
+    "bullseye",
+    "bookworm",
+    "trixie",
+    "forky",
+    # ubuntu
+    "xenial",
+    "bionic",
+    "focal",
+    "jammy",
+    "kinetic",
+    "lunar",
+    "mantic",
+    "noble",
+    "oracular",
+    "plucky",
+)
+"""Suite names that probe_suites tries by default"""
+
+POCKETS = ("", "-updates", "-security", "-backports", "-proposed", "/updates")
+"""Suffixes of the codenames that probe_suites tries by default"""
+
+# servers that don't implement HEAD answer with these
+_HEAD_UNSUPPORTED = (405, 501)
+
+
+def __probe(url: str) -> bool:
+    start = time.perf_counter()
+    resp = get_scheduler().head(url)
+    emit_request(url, resp.status_code, 0, time.perf_counter() - start, False, "HEAD")
+    if resp.status_code in _HEAD_UNSUPPORTED:
+        # the response is cached, so scraping the suite won't fetch it again
+        return _get_response(url).status_code == 200
+    return resp.status_code == 200
+
+
+@timed("discovery")
+def probe_suites(
+    repo_url: str,
+    codenames: t.Iterable[str] | None = None,
+    pockets: t.Iterable[str] | None = None,
+    flat_repo: bool = False,
+    workers: int = 16,
+) -> list[str]:
+    """
+    Find the suites of a repository that serves no listings by probing for
+    the InRelease or Release file of every codename combined with every
+    pocket (e.g. "bookworm-updates") with HEAD requests. The suites are
+    returned in the order of the candidates.
+    """
+    if not repo_url.endswith("/"):
+        repo_url += "/"
+    candidates = [
+        f"{codename}{pocket}"
+        for codename in (CODENAMES if codenames is None else codenames)
+        for pocket in (POCKETS if pockets is None else pockets)
+    ]
+
+    def exists(suite: str) -> bool:
+        base_url = urljoin(repo_url, _suite_path(suite, flat_repo))
+        return any(
+            __probe(urljoin(base_url, name)) for name in ("InRelease", "Release")
+        )
+
+    with ThreadPoolExecutor(workers) as executor:
+        found = list(executor.map(exists, candidates))
+    suites = [suite for suite, ok in zip(candidates, found) if ok]
+    return sorted(set(suites), key=suites.index)
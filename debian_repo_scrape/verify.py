@@ -1,20 +1,16 @@
 from __future__ import annotations
 
-import bz2
-import gzip
 import hashlib
 import logging
-import lzma
 import os
 import re
 import typing as t
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from enum import Enum
 from io import BufferedReader
 from urllib.parse import urljoin
 
-from debian.deb822 import Packages
-from pgpy import PGPKey, PGPMessage, PGPSignature
-
 from debian_repo_scrape.exc import (
     FileError,
     FileRequestError,
@@ -22,16 +18,28 @@ from debian_repo_scrape.exc import (
     MD5SumInvalid,
     SHA1Invalid,
     SHA256Invalid,
+    SignatureInvalid,
+    SizeInvalid,
 )
-from debian_repo_scrape.navigation import ApacheBrowseNavigator, BaseNavigator
+from debian_repo_scrape.instrumentation import phase, timed
+from debian_repo_scrape.keyring import Keyring
+from debian_repo_scrape.navigation import BaseNavigator, get_navigator
+from debian_repo_scrape.parsing import DECOMPRESSORS, _iter_packages, source_files
+from debian_repo_scrape.sampling import Sample, Sampler, SamplingResult
+from debian_repo_scrape.signatures import SignatureBackend, SignedFile, get_backend
 from debian_repo_scrape.utils import (
+    IndexFilter,
     _get_file,
     _get_file_abs,
     _get_release_file,
-    clear_response_cache,
+    _get_size_abs,
+    _hash_file_abs,
+    _stream_hash_abs,
+    _suite_path,
     get_release_file,
     get_suites,
     get_suites_flat,
+    response_cache_scope,
 )
 
 log = logging.getLogger(__name__)
@@ -42,7 +50,8 @@ HASH_FUNCTION_MAP: list[tuple[str, str, t.Type[HashInvalid]]] = [
     ("SHA256", "sha256", SHA256Invalid),
 ]
 PACKAGES_FILE_REGEX = r"Packages(\..+)?"
-IMPORTANT_FILES_REGEX = (PACKAGES_FILE_REGEX, r".+\.deb", r"Sources.gz")
+SOURCES_FILE_REGEX = r"Sources(\..+)?"
+IMPORTANT_FILES_REGEX = (PACKAGES_FILE_REGEX, r".+\.deb", SOURCES_FILE_REGEX)
 
 
 class VerificationModes(str, Enum):
@@ -52,74 +61,160 @@ class VerificationModes(str, Enum):
     IGNORE_MISSING_NON_IMPORTANT = "ignore_missing_non_important"
     VERIFY_IMPORTANT_ONLY = "verify_important_only"
     VERIFY_IMPORTANT_ONLY_IGNORE_MISSING = "verify_important_only_ignore_missing"
+    SIZE_ONLY = "size_only"
+    SIZE_ONLY_IGNORE_MISSING = "size_only_ignore_missing"
+    SIZE_ONLY_VERIFY_IMPORTANT_ONLY = "size_only_verify_important_only"
+    SIZE_ONLY_VERIFY_IMPORTANT_ONLY_IGNORE_MISSING = (
+        "size_only_verify_important_only_ignore_missing"
+    )
+
+
+class ByHashModes(str, Enum):
+    """How files are checked under by-hash if a Release enables Acquire-By-Hash"""
+
+    HASH = "hash"
+    """Download and hash the by-hash file without keeping it in memory"""
+    HEAD = "head"
+    """Only check that the by-hash file exists and has the right size"""
 
 
 VERIFY_IMPORTANT_ONLY = (
     VerificationModes.VERIFY_IMPORTANT_ONLY,
     VerificationModes.VERIFY_IMPORTANT_ONLY_IGNORE_MISSING,
+    VerificationModes.SIZE_ONLY_VERIFY_IMPORTANT_ONLY,
+    VerificationModes.SIZE_ONLY_VERIFY_IMPORTANT_ONLY_IGNORE_MISSING,
 )
 
 IGNORE_MISSING = (
     VerificationModes.IGNORE_MISSING,
     VerificationModes.IGNORE_MISSING_NON_IMPORTANT,
     VerificationModes.VERIFY_IMPORTANT_ONLY_IGNORE_MISSING,
+    VerificationModes.SIZE_ONLY_IGNORE_MISSING,
+    VerificationModes.SIZE_ONLY_VERIFY_IMPORTANT_ONLY_IGNORE_MISSING,
 )
 
-RAISE_EXCEPTION = (VerificationModes.STRICT, VerificationModes.VERIFY_IMPORTANT_ONLY)
+SIZE_ONLY = (
+    VerificationModes.SIZE_ONLY,
+    VerificationModes.SIZE_ONLY_IGNORE_MISSING,
+    VerificationModes.SIZE_ONLY_VERIFY_IMPORTANT_ONLY,
+    VerificationModes.SIZE_ONLY_VERIFY_IMPORTANT_ONLY_IGNORE_MISSING,
+)
+
+RAISE_EXCEPTION = (
+    VerificationModes.STRICT,
+    VerificationModes.VERIFY_IMPORTANT_ONLY,
+    VerificationModes.SIZE_ONLY,
+    VerificationModes.SIZE_ONLY_VERIFY_IMPORTANT_ONLY,
+)
 RAISE_EXCEPTION_IMPORTANT_FILE = (
     VerificationModes.RAISE_IMPORTANT_ONLY,
     VerificationModes.IGNORE_MISSING_NON_IMPORTANT,
 )
 
+CHECKED_HASH = "hash"
+CHECKED_SIZE = "size"
+CHECKED_EXISTENCE = "existence"
+
+
+@dataclass(frozen=True)
+class VerificationReport:
+    """URLs of the files verified by verify_hash_sums by how they were checked"""
+
+    hashed: list[str] = field(default_factory=list)
+    size_only: list[str] = field(default_factory=list)
+    """Only checked to exist with the right size"""
+    existence_only: list[str] = field(default_factory=list)
+    """Only checked to exist, because the server did not send their size"""
+    sampling: SamplingResult | None = None
+
+    @classmethod
+    def from_checked(
+        cls, checked: dict[str, str], sampling: SamplingResult | None = None
+    ) -> VerificationReport:
+        return cls(
+            sampling=sampling,
+            hashed=[url for url, how in checked.items() if how == CHECKED_HASH],
+            size_only=[url for url, how in checked.items() if how == CHECKED_SIZE],
+            existence_only=[
+                url for url, how in checked.items() if how == CHECKED_EXISTENCE
+            ],
+        )
+
 
+def __signed_files(
+    repo_url: str, suite: str, flat_repo: bool, in_release_only: bool
+) -> list[SignedFile]:
+    """Fetch the signed release files of a suite as (url, data, signature)"""
+    base_path = _suite_path(suite, flat_repo)
+    base_url = urljoin(
+        repo_url if repo_url.endswith("/") else f"{repo_url}/", base_path
+    )
+
+    if in_release_only:
+        try:
+            in_release_file = _get_file(repo_url, f"{base_path}InRelease")
+        except FileRequestError:
+            log.info(f"No InRelease file for {suite}, using Release and Release.gpg")
+        else:
+            return [(f"{base_url}InRelease", in_release_file, None)]
+
+    release_file = _get_release_file(repo_url, suite, flat_repo)
+    release_sig = _get_file(repo_url, f"{base_path}Release.gpg")
+    signed_files: list[SignedFile] = [
+        (f"{base_url}Release.gpg", release_file, release_sig)
+    ]
+    if not in_release_only:
+        in_release_file = _get_file(repo_url, f"{base_path}InRelease")
+        signed_files.append((f"{base_url}InRelease", in_release_file, None))
+    return signed_files
+
+
+@timed("verify_signatures")
+@response_cache_scope()
 def verify_release_signatures(
     repo_url: str | BaseNavigator,
-    pub_key_file: str | BufferedReader | bytes,
+    pub_key_file: str | BufferedReader | bytes | Keyring,
     flat_repo: bool = False,
+    workers: int = 1,
+    in_release_only: bool = False,
+    backend: str | t.Type[SignatureBackend] | None = None,
 ):
+    """
+    Verify Release.gpg and InRelease of every suite.
 
-    navigator = (
-        ApacheBrowseNavigator(repo_url) if isinstance(repo_url, str) else repo_url
-    )
+    Pass a Keyring to avoid parsing the public key on every call.
+    With workers > 1 signatures are verified in parallel by the backend
+    ("pgpy" by default, see debian_repo_scrape.signatures).
+    With in_release_only only InRelease is verified if it exists.
+    """
+
+    navigator = get_navigator(repo_url)
     navigator.set_checkpoint()
     navigator.reset()
 
-    if isinstance(pub_key_file, BufferedReader):
-        pgp_key, _ = PGPKey.from_blob(pub_key_file.read())
-    elif isinstance(pub_key_file, str):
-        pgp_key, _ = PGPKey.from_file(pub_key_file)
-    elif isinstance(pub_key_file, bytes):
-        pgp_key, _ = PGPKey.from_blob(pub_key_file)
-    else:
-        raise TypeError(
-            f"{type(pub_key_file)} is not a valid type for public key input"
-        )
+    keyring = Keyring.from_key_input(pub_key_file)
 
     suites = get_suites_flat(navigator) if flat_repo else get_suites(navigator)
 
-    for suite in suites:
-
-        release_file = _get_release_file(navigator.base_url, suite, flat_repo)
-
-        if not flat_repo:
-            base_path = f"dists/{suite}/"
-        elif suite:
-            base_path = f"{suite}/"
-        else:
-            base_path = ""
-
-        release_sig = PGPSignature.from_blob(
-            _get_file(navigator.base_url, f"{base_path}Release.gpg")
-        )
-
-        pgp_key.verify(release_file, release_sig)
+    with get_backend(backend)(keyring, workers) as signature_backend:
+        futures = []
+        for suite in suites:
+            with phase("verify_suite_signatures", suite=suite):
+                future = signature_backend.submit(
+                    __signed_files(
+                        navigator.base_url, suite, flat_repo, in_release_only
+                    )
+                )
+            futures.append(future)
+            if future.done() and future.result():
+                raise SignatureInvalid(*future.result()[0])
 
-        in_release_file = _get_file(navigator.base_url, f"{base_path}InRelease")
-        pgp_message = PGPMessage.from_blob(in_release_file)
-        pgp_key.verify(pgp_message)
+        for future in futures:
+            errors = future.result()
+            if errors:
+                raise SignatureInvalid(*errors[0])
 
     navigator.use_checkpoint()
-    clear_response_cache()
 
 
 def __check_important(file: str) -> bool:
@@ -143,109 +238,425 @@ def __check_reraise(mode: str, e: FileError):
         log.warning(e)
 
 
-def verify_hash_sums(
-    repo_url: str | BaseNavigator,
-    mode: VerificationModes | str = VerificationModes.STRICT,
-    flat_repo: bool = False,
+def __verify_by_hash(
+    file_url: str,
+    file: dict[str, str],
+    key: str,
+    hash_method: str,
+    exc: t.Type[HashInvalid],
+    release_file_url: str,
+    mode: str,
+    by_hash: str,
 ):
-    if isinstance(mode, VerificationModes):
-        mode = mode.value
-    if mode not in [e.value for e in VerificationModes]:
-        raise ValueError(f"{mode} is not a valid verification mode")
+    by_hash_url = urljoin(file_url, f"by-hash/{key}/{file[key.lower()]}")
+    with phase("verify_by_hash", url=by_hash_url, mode=by_hash):
+        try:
+            if by_hash == ByHashModes.HEAD.value:
+                size = _get_size_abs(by_hash_url)
+                if size is not None and size != int(file["size"]):
+                    __check_reraise(mode, SizeInvalid(by_hash_url, release_file_url))
+            elif _stream_hash_abs(by_hash_url, hash_method) != file[key.lower()]:
+                __check_reraise(mode, exc(by_hash_url, release_file_url))
+        except FileRequestError as e:
+            e.file_mentioned_by = release_file_url
+            __check_reraise(mode, e)
+
+
+def __verify_package_hashes(
+    deb_file_url: str,
+    packages_file: t.Mapping[str, str],
+    file_url: str,
+    mode: str,
+    checked: dict[str, str],
+) -> bool:
+    with phase("verify_file", url=deb_file_url) as span:
+        try:
+            size, hashsums = _hash_file_abs(
+                deb_file_url, [hash_method for _, hash_method, _ in HASH_FUNCTION_MAP]
+            )
+        except FileRequestError as e:
+            e.file_mentioned_by = file_url
+            __check_reraise(mode, e)
+            return False
+        span.set_attributes(bytes=size)
+
+    ok = True
+    for (key, _, exc), hashsum in zip(HASH_FUNCTION_MAP, hashsums):
+        # Sources stanzas don't always list every hash sum
+        expected = packages_file.get(key.lower())
+        if expected is not None and hashsum != expected:
+            ok = False
+            __check_reraise(mode, exc(deb_file_url, file_url))
+    checked[deb_file_url] = CHECKED_HASH
+    return ok
+
+
+def __verify_package_size(
+    deb_file_url: str,
+    packages_file: t.Mapping[str, str],
+    file_url: str,
+    mode: str,
+    checked: dict[str, str],
+) -> bool:
+    if deb_file_url in checked:
+        return True
+    with phase("verify_file", url=deb_file_url, hash="Size"):
+        try:
+            size = _get_size_abs(deb_file_url)
+        except FileRequestError as e:
+            e.file_mentioned_by = file_url
+            __check_reraise(mode, e)
+            return False
+    if size is None:
+        checked[deb_file_url] = CHECKED_EXISTENCE
+        return True
+    checked[deb_file_url] = CHECKED_SIZE
+    if size != int(packages_file["size"]):
+        __check_reraise(mode, SizeInvalid(deb_file_url, file_url))
+        return False
+    return True
+
+
+@dataclass
+class _Artifact:
+    """A file listed in indexes, like a deb in Packages or a tarball in Sources"""
+
+    url: str
+    listed: t.Mapping[str, str]
+    verify_file: t.Callable[..., bool]
+    references: list[str]
+    """URLs of all indexes that list the file"""
+
+
+ArtifactKey = t.Tuple[str, t.Optional[str]]
+
+
+def __enqueue_candidates(
+    candidates: list[tuple[str, t.Mapping[str, str]]],
+    group: str,
+    file_url: str,
+    sampler: Sampler | None,
+    verify_file: t.Callable[..., bool],
+    artifacts: dict[ArtifactKey, _Artifact],
+):
+    """
+    Queue the files listed in an index, optionally only a sample of them.
+    Files are keyed by URL and SHA256, so every file is only verified once
+    however many indexes list it.
+    """
+    if sampler is not None:
+        candidates = sampler.select(group, candidates)
+    for url, listed in candidates:
+        key = (url, listed.get("sha256"))
+        artifact = artifacts.get(key)
+        if artifact is None:
+            artifacts[key] = _Artifact(url, listed, verify_file, [file_url])
+        elif file_url not in artifact.references:
+            artifact.references.append(file_url)
+
+
+def __verify_artifacts(
+    artifacts: t.Iterable[_Artifact],
+    mode: str,
+    checked: dict[str, str],
+    sampler: Sampler | None,
+    executor: Executor | None,
+):
+    def verify(artifact: _Artifact) -> bool:
+        # errors name every index that lists the file
+        return artifact.verify_file(
+            artifact.url,
+            artifact.listed,
+            ", ".join(artifact.references),
+            mode,
+            checked,
+        )
 
-    navigator = (
-        ApacheBrowseNavigator(repo_url) if isinstance(repo_url, str) else repo_url
+    artifacts = list(artifacts)
+    results: t.Iterable[bool] = (
+        [verify(artifact) for artifact in artifacts]
+        if executor is None
+        else executor.map(verify, artifacts)
+    )
+    for artifact, ok in zip(artifacts, results):
+        if sampler is not None:
+            sampler.record(artifact.url, ok)
+
+
+def __verify_suite_hash_sums(
+    navigator: BaseNavigator,
+    suite: str,
+    mode: str,
+    flat_repo: bool,
+    processed_indexes: set[str],
+    in_release_first: bool,
+    by_hash: str,
+    checked: dict[str, str],
+    sampler: Sampler | None,
+    artifacts: dict[ArtifactKey, _Artifact],
+    index_filter: IndexFilter,
+):
+    release_file = get_release_file(
+        navigator.base_url, suite, flat_repo, in_release_first
     )
-    processed_urls: list[str] = []
+    release_file_url = urljoin(navigator.base_url, f"{suite}/Release")
+    # by-hash files are only checked with the strongest hash like apt does
+    by_hash_key = (
+        next(
+            reversed([key for key, _, _ in HASH_FUNCTION_MAP if key in release_file]),
+            None,
+        )
+        if release_file.get("Acquire-by-Hash") == "yes"
+        else None
+    )
+
+    hash_methods = [hash_method for _, hash_method, _ in HASH_FUNCTION_MAP]
+    streamed_hashes: dict[str, tuple[int, dict[str, str]]] = {}
+
     navigator.set_checkpoint()
-    navigator.reset()
-    if flat_repo:
-        suites = get_suites_flat(navigator)
-    else:
-        suites = get_suites(navigator)
-        navigator["dists"]
-    for suite in suites:
-        release_file = get_release_file(navigator.base_url, suite, flat_repo=flat_repo)
-        release_file_url = urljoin(navigator.base_url, f"{suite}/Release")
-
-        navigator.set_checkpoint()
-        if suite:
-            navigator[suite]
-        for key, hash_method, exc in HASH_FUNCTION_MAP:
-            hashed_files = release_file[key]
-            if mode in VERIFY_IMPORTANT_ONLY:
-                hashed_files = [
-                    file for file in hashed_files if __check_important(file["name"])
-                ]
-            for file in hashed_files:
-                file_url = urljoin(navigator.current_url, file["name"])
+    if suite:
+        navigator[suite]
+    for key, hash_method, exc in HASH_FUNCTION_MAP:
+        hashed_files = [
+            file
+            for file in release_file[key]
+            if index_filter.selects_index(file["name"])
+        ]
+        if mode in VERIFY_IMPORTANT_ONLY:
+            hashed_files = [
+                file for file in hashed_files if __check_important(file["name"])
+            ]
+        for file in hashed_files:
+            file_url = urljoin(navigator.current_url, file["name"])
+            packages_match = re.match(PACKAGES_FILE_REGEX, os.path.basename(file_url))
+            sources_match = re.match(SOURCES_FILE_REGEX, os.path.basename(file_url))
+            with phase("verify_file", url=file_url, hash=key) as span:
                 try:
-                    file_content = _get_file_abs(file_url)
-                    hashsum = hashlib.new(hash_method, file_content).hexdigest()
+                    if packages_match or sources_match:
+                        # indexes are parsed afterwards, so they are kept in memory
+                        file_content = _get_file_abs(file_url)
+                        span.set_attributes(bytes=len(file_content))
+                        with phase("hashing"):
+                            hashsum = hashlib.new(hash_method, file_content).hexdigest()
+                    else:
+                        # other files like Contents are hashed while downloading
+                        # them, once for all hash sums
+                        if file_url not in streamed_hashes:
+                            size, hashsums = _hash_file_abs(file_url, hash_methods)
+                            streamed_hashes[file_url] = (
+                                size,
+                                dict(zip(hash_methods, hashsums)),
+                            )
+                        size, hashsums_by_method = streamed_hashes[file_url]
+                        span.set_attributes(bytes=size)
+                        hashsum = hashsums_by_method[hash_method]
                     if not hashsum == file[key.lower()]:
                         __check_reraise(mode, exc(file_url, release_file_url))
-                    if release_file.get("Acquire-by-Hash") == "yes":
-                        by_hash_url = urljoin(file_url, f"by-hash/{key}/{hashsum}")
-
-                        by_hash_file = _get_file_abs(by_hash_url)
-                        assert (
-                            by_hash_file == file_content
-                        ), f"Could not acquire {file_url} by hash"
+                    checked[file_url] = CHECKED_HASH
                 except FileRequestError as e:
                     e.file_mentioned_by = release_file_url
                     __check_reraise(mode, e)
                     if mode in IGNORE_MISSING:
                         continue
+                # component Release files are not published by hash
+                if key == by_hash_key and os.path.basename(file_url) != "Release":
+                    __verify_by_hash(
+                        file_url,
+                        file,
+                        key,
+                        hash_method,
+                        exc,
+                        release_file_url,
+                        mode,
+                        by_hash,
+                    )
+
+            if packages_match is not None:
+                # all compressions of an index list the same files
+                packages_group = file_url[
+                    : len(file_url) - len(packages_match.group(1) or "")
+                ]
+                if packages_group not in processed_indexes:
+                    processed_indexes.add(packages_group)
+                    decompress = DECOMPRESSORS.get(packages_match.group(1))
+                    if decompress is not None:
+                        with phase("decompress"):
+                            file_content = decompress(file_content)
+
+                    with phase("parse"):
+                        packages_files = list(_iter_packages(file_content))
+
+                    candidates = [
+                        (urljoin(navigator.base_url, p["Filename"]), p)
+                        for p in packages_files
+                        if mode not in VERIFY_IMPORTANT_ONLY
+                        or __check_important(p["Filename"])
+                    ]
+                    __enqueue_candidates(
+                        candidates,
+                        packages_group,
+                        file_url,
+                        sampler,
+                        __verify_package_size
+                        if mode in SIZE_ONLY
+                        else __verify_package_hashes,
+                        artifacts,
+                    )
+
+            if sources_match is not None:
+                sources_group = file_url[
+                    : len(file_url) - len(sources_match.group(1) or "")
+                ]
+                if sources_group not in processed_indexes:
+                    processed_indexes.add(sources_group)
+                    decompress = DECOMPRESSORS.get(sources_match.group(1))
+                    if decompress is not None:
+                        with phase("decompress"):
+                            file_content = decompress(file_content)
+
+                    with phase("parse"):
+                        sources = list(_iter_packages(file_content))
+
+                    candidates = [
+                        (
+                            urljoin(navigator.base_url, f'{s["Directory"]}/{name}'),
+                            listed,
+                        )
+                        for s in sources
+                        for name, listed in source_files(s).items()
+                        if mode not in VERIFY_IMPORTANT_ONLY or __check_important(name)
+                    ]
+                    __enqueue_candidates(
+                        candidates,
+                        sources_group,
+                        file_url,
+                        sampler,
+                        __verify_package_size
+                        if mode in SIZE_ONLY
+                        else __verify_package_hashes,
+                        artifacts,
+                    )
+    navigator.use_checkpoint()
 
-                packages_match = re.match(
-                    PACKAGES_FILE_REGEX, os.path.basename(file_url)
+
+@timed("verify_hashes")
+@response_cache_scope()
+def verify_hash_sums(
+    repo_url: str | BaseNavigator,
+    mode: VerificationModes | str = VerificationModes.STRICT,
+    flat_repo: bool = False,
+    in_release_first: bool = False,
+    by_hash: ByHashModes | str = ByHashModes.HASH,
+    sample: Sample | None = None,
+    workers: int = 1,
+    suites: t.Collection[str] | None = None,
+    components: t.Collection[str] | None = None,
+    architectures: t.Collection[str] | None = None,
+) -> VerificationReport:
+    """
+    Verify the hash sums of all files listed in the Release files and of all
+    packages. With in_release_first the Release data is read from InRelease.
+    suites, components and architectures restrict verification to the
+    indexes of them and the packages these list.
+    by_hash selects how by-hash files are checked, see ByHashModes.
+    With workers > 1 packages are verified by a thread pool, which hashes
+    local mirrors on several cores.
+
+    The size_only modes check packages with HEAD requests against their size
+    instead of downloading them. With a Sample only some packages of every
+    Packages index are checked. The returned report lists how every file
+    was checked and the confidence bounds reached by sampling.
+    """
+
+    if isinstance(mode, VerificationModes):
+        mode = mode.value
+    if mode not in [e.value for e in VerificationModes]:
+        raise ValueError(f"{mode} is not a valid verification mode")
+    if isinstance(by_hash, ByHashModes):
+        by_hash = by_hash.value
+    if by_hash not in [e.value for e in ByHashModes]:
+        raise ValueError(f"{by_hash} is not a valid by-hash mode")
+
+    navigator = get_navigator(repo_url)
+    processed_indexes: set[str] = set()
+    checked: dict[str, str] = {}
+    artifacts: dict[ArtifactKey, _Artifact] = {}
+    sampler = Sampler(sample) if sample is not None else None
+    index_filter = IndexFilter(suites, components, architectures)
+    navigator.set_checkpoint()
+    navigator.reset()
+    if flat_repo:
+        repo_suites = get_suites_flat(navigator)
+    else:
+        repo_suites = get_suites(navigator)
+        navigator["dists"]
+    executor = ThreadPoolExecutor(workers) if workers > 1 else None
+    try:
+        for suite in filter(index_filter.selects_suite, repo_suites):
+            with phase("verify_suite_hashes", suite=suite):
+                __verify_suite_hash_sums(
+                    navigator,
+                    suite,
+                    mode,
+                    flat_repo,
+                    processed_indexes,
+                    in_release_first,
+                    by_hash,
+                    checked,
+                    sampler,
+                    artifacts,
+                    index_filter,
                 )
-                if packages_match and file_url not in processed_urls:
-                    processed_urls.append(file_url)
-                    if packages_match.group(1) == ".gz":
-                        file_content = gzip.decompress(file_content)
-                    elif packages_match.group(1) in (".xz", ".lzma"):
-                        file_content = lzma.decompress(file_content)  # pragma: no cover
-                    elif packages_match.group(1) == ".bz2":
-                        file_content = bz2.decompress(file_content)  # pragma: no cover
-
-                    packages_file = Packages(file_content.split(b"\n"))
-
-                    if packages_file.keys():
-                        packages_file_fn = packages_file["Filename"]
-                        if mode in VERIFY_IMPORTANT_ONLY and not __check_important(
-                            packages_file_fn
-                        ):
-                            continue  # pragma: no cover
-                        for key_2, hash_method_2, exc_2 in HASH_FUNCTION_MAP:
-                            deb_file_url = urljoin(navigator.base_url, packages_file_fn)
-
-                            try:
-                                deb_file_content = _get_file_abs(deb_file_url)
-                            except FileRequestError as e:
-                                e.file_mentioned_by = file_url
-                                __check_reraise(mode, e)
-                                if mode in IGNORE_MISSING:
-                                    continue
-
-                            hashsum = hashlib.new(
-                                hash_method_2, deb_file_content
-                            ).hexdigest()
-                            if not hashsum == packages_file[key_2.lower()]:
-                                __check_reraise(mode, exc_2(deb_file_url, file_url))
-        navigator.use_checkpoint()
+        with phase("verify_listed_files", files=len(artifacts)):
+            __verify_artifacts(artifacts.values(), mode, checked, sampler, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if sampler is not None:
+            sampler.save_history()
     navigator.use_checkpoint()
-    clear_response_cache()
+    return VerificationReport.from_checked(
+        checked, sampler.result() if sampler is not None else None
+    )
 
 
+@response_cache_scope()
 def verify_repo_integrity(
     repo_url: str | BaseNavigator,
-    pub_key_file: str | BufferedReader | bytes,
+    pub_key_file: str | BufferedReader | bytes | Keyring,
     mode: VerificationModes = VerificationModes.STRICT,
     flat_repo: bool = False,
-):
-    navigator = (
-        ApacheBrowseNavigator(repo_url) if isinstance(repo_url, str) else repo_url
+    in_release_first: bool = False,
+    by_hash: ByHashModes | str = ByHashModes.HASH,
+    sample: Sample | None = None,
+    workers: int = 1,
+    suites: t.Collection[str] | None = None,
+    components: t.Collection[str] | None = None,
+    architectures: t.Collection[str] | None = None,
+) -> VerificationReport:
+    """
+    Verify release signatures and hash sums. With in_release_first every
+    suite's InRelease is fetched once and used for both. suites, components
+    and architectures restrict the hash sum verification to them.
+    """
+
+    navigator = get_navigator(repo_url)
+    verify_release_signatures(
+        navigator,
+        pub_key_file,
+        flat_repo,
+        workers=workers,
+        in_release_only=in_release_first,
+    )
+    return verify_hash_sums(
+        navigator,
+        mode,
+        flat_repo,
+        in_release_first,
+        by_hash,
+        sample,
+        workers,
+        suites,
+        components,
+        architectures,
     )
-    verify_release_signatures(navigator, pub_key_file, flat_repo)
-    verify_hash_sums(navigator, mode, flat_repo)
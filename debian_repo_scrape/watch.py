@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+import typing as t
+from dataclasses import dataclass
+from io import BufferedReader
+
+from debian_repo_scrape.diff import PackageChange, diff_packages
+from debian_repo_scrape.exc import FileRequestError, SignatureInvalid
+from debian_repo_scrape.fetch import get_scheduler
+from debian_repo_scrape.instrumentation import emit_request, observed, phase
+from debian_repo_scrape.keyring import Keyring
+from debian_repo_scrape.navigation import BaseNavigator, get_navigator
+from debian_repo_scrape.parsing import Paragraph, parse_release
+from debian_repo_scrape.scrape import Component, Repository, Suite, scrape_suite
+from debian_repo_scrape.signatures import SignedFile, get_backend
+from debian_repo_scrape.utils import (
+    IndexFilter,
+    _extract_signed_text,
+    _get_file_abs,
+    _get_response,
+    _release_indexes,
+    _suite_path,
+    get_suites,
+    response_cache_scope,
+)
+
+log = logging.getLogger(__name__)
+
+_PACKAGES_RE = r"(?:.*/)?Packages(\.\w+)?$"
+
+
+@dataclass
+class _SuiteState:
+    url: str
+    digest: str
+    indexes: dict[str, frozenset[tuple[str, str]]]
+    """Names and hash sums of the selected Packages files by component"""
+    in_release: bool = False
+    """Whether url is the InRelease file of the suite"""
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+def _component_indexes(
+    release_file: Paragraph, index_filter: IndexFilter
+) -> dict[str, frozenset[tuple[str, str]]]:
+    indexes: dict[str, set[tuple[str, str]]] = {}
+    for name, hashsums in _release_indexes(
+        release_file, _PACKAGES_RE, index_filter
+    ).items():
+        hashsum = next(
+            hashsums[key] for key in ("sha256", "sha1", "md5sum") if key in hashsums
+        )
+        indexes.setdefault(name.split("/")[0], set()).add((name, hashsum))
+    return {component: frozenset(names) for component, names in indexes.items()}
+
+
+class RepoWatcher:
+    """
+    Watches a repository for changes. The suites are discovered once by
+    start(), after that every poll() only requests the Release files, or
+    InRelease with in_release_first if the suite has one, conditionally. The components of a
+    changed Release file whose Packages files changed are scraped again and
+    compared with the last snapshot.
+
+    Events are returned by poll(), passed to on_event and yielded by
+    events(), an async iterator that polls every interval seconds.
+    With a public key every changed Release file is verified. The Packages
+    files are scraped with the Release file that was polled and checked
+    against its hash sums. Suites that appear later are not picked up.
+    """
+
+    def __init__(
+        self,
+        repo_url: str | BaseNavigator,
+        pub_key_file: str | BufferedReader | bytes | Keyring | None = None,
+        interval: float = 300.0,
+        in_release_first: bool = False,
+        suites: t.Collection[str] | None = None,
+        components: t.Collection[str] | None = None,
+        architectures: t.Collection[str] | None = None,
+        fields: t.Collection[str] | None = None,
+        on_event: t.Callable[[PackageChange], t.Any] | None = None,
+    ) -> None:
+        self.navigator = get_navigator(repo_url)
+        self.interval = interval
+        self.in_release_first = in_release_first
+        self.on_event = on_event
+        self._keyring = (
+            Keyring.from_key_input(pub_key_file) if pub_key_file is not None else None
+        )
+        self._index_filter = IndexFilter(suites, components, architectures)
+        self._fields = fields
+        self._states: dict[str, _SuiteState] = {}
+        self._suites: dict[str, Suite] = {}
+        self._started = False
+
+    @property
+    def base_url(self) -> str:
+        return self.navigator.base_url
+
+    @property
+    def repository(self) -> Repository[Suite]:
+        """The last snapshot of the watched suites"""
+        return Repository(url=self.base_url, suites=list(self._suites.values()))
+
+    def _release_url(self, suite: str, in_release: bool) -> str:
+        name = "InRelease" if in_release else "Release"
+        return f"{self.base_url}{_suite_path(suite)}{name}"
+
+    def _get_release(self, suite: str) -> tuple[str, bool, t.Any]:
+        """
+        Fetch the InRelease file of a suite with in_release_first, its
+        Release file otherwise or if there is no InRelease file
+        """
+        for in_release in (True, False) if self.in_release_first else (False,):
+            url = self._release_url(suite, in_release)
+            resp = _get_response(url)
+            if resp.status_code == 200:
+                return url, in_release, resp
+            if in_release:
+                log.info(f"No InRelease file for {suite}, using Release")
+        raise FileRequestError(url, resp.status_code)
+
+    def _verify(self, url: str, content: bytes, in_release: bool):
+        if self._keyring is None:
+            return
+        signed_files: list[SignedFile] = (
+            [(url, content, None)]
+            if in_release
+            else [(f"{url}.gpg", content, _get_file_abs(f"{url}.gpg"))]
+        )
+        with get_backend(None)(self._keyring) as backend:
+            errors = backend.verify(signed_files)
+        if errors:
+            raise SignatureInvalid(*errors[0])
+
+    def _parse(self, url: str, content: bytes, in_release: bool) -> Paragraph:
+        self._verify(url, content, in_release)
+        if in_release:
+            content = _extract_signed_text(content, url)
+        return parse_release(content)
+
+    def _state(
+        self,
+        url: str,
+        in_release: bool,
+        content: bytes,
+        release_file: Paragraph,
+        resp,
+    ):
+        return _SuiteState(
+            url=url,
+            digest=hashlib.sha256(content).hexdigest(),
+            indexes=_component_indexes(release_file, self._index_filter),
+            in_release=in_release,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+        )
+
+    def _scrape(
+        self,
+        suite: str,
+        release_file: Paragraph,
+        in_release: bool,
+        components: t.Collection[str] | None = None,
+    ) -> Suite:
+        return scrape_suite(
+            self.base_url,
+            suite,
+            in_release,
+            components=components,
+            architectures=self._index_filter.architectures,
+            fields=self._fields,
+            release_file=release_file,
+        )
+
+    def start(self) -> Repository[Suite]:
+        """Discover the suites and scrape the first snapshot"""
+        self._states, self._suites = {}, {}
+        with phase("watch_start", url=self.base_url), response_cache_scope():
+            self.navigator.set_checkpoint()
+            self.navigator.reset()
+            self.navigator["dists"]
+            suites = [
+                suite
+                for suite in get_suites(self.navigator)
+                if self._index_filter.selects_suite(suite)
+            ]
+            self.navigator.use_checkpoint()
+            for suite in suites:
+                url, in_release, resp = self._get_release(suite)
+                release_file = self._parse(url, resp.content, in_release)
+                self._states[suite] = self._state(
+                    url, in_release, resp.content, release_file, resp
+                )
+                self._suites[suite] = self._scrape(
+                    suite, release_file, in_release, self._index_filter.components
+                )
+        self._started = True
+        return self.repository
+
+    def _conditional_get(self, state: _SuiteState):
+        headers: dict[str, str] = {}
+        if state.etag:
+            headers["If-None-Match"] = state.etag
+        elif state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+        start = time.perf_counter()
+        resp = get_scheduler().get(state.url, headers=headers)
+        if observed():
+            emit_request(
+                state.url,
+                resp.status_code,
+                len(resp.content),
+                time.perf_counter() - start,
+                False,
+            )
+        return resp
+
+    def _events(
+        self, suite: str, old: list[Component], new: list[Component]
+    ) -> list[PackageChange]:
+        old_by_name = {component.name: component for component in old}
+        new_by_name = {component.name: component for component in new}
+        events: list[PackageChange] = []
+        for name in [*new_by_name, *(n for n in old_by_name if n not in new_by_name)]:
+            old_packages = old_by_name[name].packages if name in old_by_name else []
+            new_packages = new_by_name[name].packages if name in new_by_name else []
+            events.extend(
+                PackageChange(change, suite, name, package, previous)
+                for change, package, previous in diff_packages(
+                    old_packages, new_packages
+                )
+            )
+        return events
+
+    def _poll_suite(self, suite: str) -> list[PackageChange]:
+        state = self._states[suite]
+        resp = self._conditional_get(state)
+        if resp.status_code == 304:
+            return []
+        if resp.status_code == 404:
+            log.warning(f"{state.url} disappeared, the suite {suite} was removed")
+            del self._states[suite]
+            old_suite = self._suites.pop(suite)
+            return self._events(suite, old_suite.components, [])
+        if resp.status_code != 200:
+            log.warning(f"Polling {state.url} failed with {resp.status_code}")
+            return []
+        if hashlib.sha256(resp.content).hexdigest() == state.digest:
+            return []
+
+        release_file = self._parse(state.url, resp.content, state.in_release)
+        new_state = self._state(
+            state.url, state.in_release, resp.content, release_file, resp
+        )
+        changed = {
+            component
+            for component in {*state.indexes, *new_state.indexes}
+            if state.indexes.get(component) != new_state.indexes.get(component)
+        }
+        self._states[suite] = new_state
+
+        old_suite = self._suites[suite]
+        new_components: list[Component] = []
+        if changed:
+            with phase("watch_rescrape", suite=suite, components=len(changed)):
+                new_components = self._scrape(
+                    suite, release_file, state.in_release, changed
+                ).components
+        old_components = [c for c in old_suite.components if c.name in changed]
+        rescraped = {component.name: component for component in new_components}
+        self._suites[suite] = Suite(
+            name=suite,
+            url=old_suite.url,
+            components=[
+                rescraped.pop(c.name, c)
+                for c in old_suite.components
+                if c.name not in changed or c.name in rescraped
+            ]
+            + list(rescraped.values()),
+            architectures=release_file["architectures"].split(),
+            date=release_file["date"],
+        )
+        return self._events(suite, old_components, new_components)
+
+    def poll(self) -> list[PackageChange]:
+        """
+        Check every suite once and return the changes since the last poll,
+        the first call only scrapes the initial snapshot
+        """
+        if not self._started:
+            self.start()
+            return []
+        events: list[PackageChange] = []
+        with phase("watch_poll", url=self.base_url), response_cache_scope():
+            for suite in list(self._states):
+                events.extend(self._poll_suite(suite))
+        if self.on_event is not None:
+            for event in events:
+                self.on_event(event)
+        return events
+
+    def run(self, stop: threading.Event | None = None, polls: int | None = None):
+        """
+        Poll every interval seconds and pass the events to on_event, until
+        stop is set or after polls polls
+        """
+        stop = stop or threading.Event()
+        count = 0
+        while not stop.is_set():
+            self.poll()
+            count += 1
+            if polls is not None and count >= polls:
+                break
+            stop.wait(self.interval)
+
+    async def events(self) -> t.AsyncIterator[PackageChange]:
+        """Poll every interval seconds in a thread and yield the events"""
+        # asyncio is only imported for async use
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        while True:
+            for event in await loop.run_in_executor(None, self.poll):
+                yield event
+            await asyncio.sleep(self.interval)
+
+    def __aiter__(self) -> t.AsyncIterator[PackageChange]:
+        return self.events()
+
+
+def watch(
+    repo_url: str | BaseNavigator,
+    on_event: t.Callable[[PackageChange], t.Any],
+    interval: float = 300.0,
+    stop: threading.Event | None = None,
+    **kwargs: t.Any,
+):
+    """
+    Watch a repository until stop is set and pass every change to on_event,
+    kwargs are passed to RepoWatcher
+    """
+    RepoWatcher(repo_url, interval=interval, on_event=on_event, **kwargs).run(stop)
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import typing as t
+from dataclasses import dataclass
+
+from synthetic import SyntheticRepoServer
+
+from debian_repo_scrape.instrumentation import observe, phase
+from debian_repo_scrape.keyring import Keyring
+from debian_repo_scrape.navigation import ApacheBrowseNavigator
+from debian_repo_scrape.scrape import scrape_repo
+from debian_repo_scrape.tracing import Tracer
+from debian_repo_scrape.utils import get_suites
+from debian_repo_scrape.verify import (
+    VerificationModes,
+    verify_hash_sums,
+    verify_release_signatures,
+)
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    name: str
+    requests: int
+    bytes: int
+    wall_time: float
+    peak_rss: int
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<40} {self.requests:>8} req {self.bytes / 2**20:>10.2f} MiB"
+            f" {self.wall_time:>9.3f} s {self.peak_rss / 1024:>9.1f} MiB RSS"
+        )
+
+
+@dataclass(frozen=True)
+class ParserResult:
+    name: str
+    stanzas: int
+    bytes: int
+    wall_time: float
+    peak_alloc: int
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<40} {self.stanzas:>8} stz"
+            f" {self.bytes / 2**20 / self.wall_time:>10.2f} MiB/s"
+            f" {self.wall_time:>9.3f} s {self.peak_alloc / 2**20:>9.1f} MiB alloc"
+        )
+
+
+@dataclass(frozen=True)
+class ImportResult:
+    module: str
+    wall_time: float
+    """Cumulative import time of the module"""
+    modules: dict[str, float]
+    """Cumulative import times of all imported modules"""
+
+    def __str__(self) -> str:
+        return (
+            f"{'import ' + self.module:<40} {len(self.modules):>8} mod"
+            f" {self.wall_time:>9.3f} s"
+        )
+
+
+def run_import_benchmark(module: str) -> ImportResult:
+    """Import module in a fresh interpreter with python -X importtime"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    modules: dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or not parts[1].strip().isdigit():
+            continue
+        modules[parts[2].strip()] = int(parts[1]) / 1e6
+    return ImportResult(module=module, wall_time=modules[module], modules=modules)
+
+
+def run_parser_benchmark(
+    name: str, func: t.Callable[[bytes], t.Iterable[t.Any]], content: bytes
+) -> ParserResult:
+    """
+    Time func over content, then measure its peak allocations separately
+    because tracemalloc slows it down.
+    """
+    start = time.perf_counter()
+    stanzas = len(list(func(content)))
+    wall_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        list(func(content))
+        _, peak_alloc = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return ParserResult(
+        name=name,
+        stanzas=stanzas,
+        bytes=len(content),
+        wall_time=wall_time,
+        peak_alloc=peak_alloc,
+    )
+
+
+def _measure(func: t.Callable[..., t.Any], args: tuple) -> tuple[float, int]:
+    start = time.perf_counter()
+    func(*args)
+    wall_time = time.perf_counter() - start
+    return wall_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_benchmark(
+    name: str,
+    server: SyntheticRepoServer,
+    func: t.Callable[..., t.Any],
+    *args: t.Any,
+) -> BenchmarkResult:
+    """
+    Run func in a fresh interpreter so that peak RSS only covers the benchmark
+    itself. Requests and bytes are counted by the server.
+    """
+
+    server.reset_stats()
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        wall_time, peak_rss = pool.apply(_measure, (func, args))
+    return BenchmarkResult(
+        name=name,
+        requests=server.requests,
+        bytes=server.bytes_sent,
+        wall_time=wall_time,
+        peak_rss=peak_rss,
+    )
+
+
+def discover(url: str):
+    get_suites(ApacheBrowseNavigator(url))
+
+
+def scrape(
+    url: str,
+    pub_key_file: str,
+    parse_workers: int = 1,
+    fields: t.Collection[str] | None = None,
+):
+    scrape_repo(
+        url, pub_key_file, verify=False, parse_workers=parse_workers, fields=fields
+    )
+
+
+def scrape_traced(url: str, pub_key_file: str):
+    with observe(Tracer()):
+        scrape_repo(url, pub_key_file, verify=False)
+
+
+def phase_overhead(iterations: int = 1_000_000) -> float:
+    """Seconds per phase() block, measured against an empty loop"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with phase("benchmark", suite="stable"):
+            pass
+    return (time.perf_counter() - start - baseline) / iterations
+
+
+def verify_signatures(
+    url: str,
+    pub_key_file: str,
+    workers: int = 1,
+    in_release_only: bool = False,
+    backend: str = "pgpy",
+):
+    keyring = Keyring.from_key_input(pub_key_file)
+    verify_release_signatures(
+        url,
+        keyring,
+        workers=workers,
+        in_release_only=in_release_only,
+        backend=backend,
+    )
+
+
+def verify_hashes(
+    url: str, mode: str = VerificationModes.STRICT.value, workers: int = 1
+):
+    verify_hash_sums(url, mode, workers=workers)
+
+
+def report(
+    results: t.Iterable[BenchmarkResult | ParserResult | ImportResult],
+) -> str:
+    return "\n".join(str(result) for result in results)
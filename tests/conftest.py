@@ -1,14 +1,68 @@
+from __future__ import annotations
+
+import re
+
 from flaskapp import create_app
-from pytest import fixture
+from pytest import TempPathFactory, fixture
 from pytest_flask.live_server import LiveServer
 from pytest_lazyfixture import lazy_fixture
+from synthetic import (
+    SyntheticRepoConfig,
+    SyntheticRepoServer,
+    generate_repo,
+    generate_signing_key,
+)
 
+from debian_repo_scrape.instrumentation import (
+    Observer,
+    RequestEvent,
+    add_observer,
+    remove_observer,
+)
 from debian_repo_scrape.navigation import (
     ApacheBrowseNavigator,
     PredefinedSuitesNavigator,
 )
 
 
+class RequestRecorder(Observer):
+    """Records the requests that weren't answered from the response cache"""
+
+    def __init__(self) -> None:
+        self.events: list[RequestEvent] = []
+
+    def __enter__(self):
+        self.events.clear()
+        add_observer(self)
+        return self
+
+    def __exit__(self, *_):
+        remove_observer(self)
+
+    def on_request(self, event: RequestEvent):
+        if not event.cache_hit:
+            self.events.append(event)
+
+    def select(
+        self, pattern: str = "", url_class: str | None = None
+    ) -> list[RequestEvent]:
+        return [
+            event
+            for event in self.events
+            if re.search(pattern, event.url)
+            and (url_class is None or event.url_class == url_class)
+        ]
+
+    def urls(self, pattern: str = "", url_class: str | None = None) -> list[str]:
+        return [event.url for event in self.select(pattern, url_class)]
+
+
+@fixture()
+def request_recorder():
+    """Records the requests of the with blocks it is used in"""
+    return RequestRecorder()
+
+
 @fixture(scope="session")
 def app():
     return create_app()
@@ -71,3 +125,43 @@ def navigator(request):
 )
 def flat_navigator(request):
     return request.param
+
+
+@fixture(scope="session")
+def signing_key():
+    return generate_signing_key()
+
+
+@fixture(scope="session")
+def synthetic_repo(tmp_path_factory: TempPathFactory, signing_key):
+    config = SyntheticRepoConfig(
+        suites=["stable", "testing/updates"],
+        components=["main", "contrib"],
+        architectures=["amd64", "arm64"],
+        packages_per_index=5,
+        compressions=["", "gz", "xz"],
+        by_hash=True,
+        arch_all_fraction=0.4,
+        contents=True,
+        sources=True,
+    )
+    return generate_repo(tmp_path_factory.mktemp("synthetic"), config, signing_key)
+
+
+@fixture(scope="session")
+def synthetic_server(synthetic_repo):
+    with SyntheticRepoServer(synthetic_repo.root) as server:
+        yield server
+
+
+@fixture()
+def scratch_repo(tmp_path, signing_key):
+    """Small synthetic repository that tests may modify"""
+    config = SyntheticRepoConfig(suites=["stable", "oldstable", "testing"])
+    return generate_repo(tmp_path / "repo", config, signing_key)
+
+
+@fixture()
+def scratch_server(scratch_repo):
+    with SyntheticRepoServer(scratch_repo.root) as server:
+        yield server
@@ -1,14 +1,11 @@
 from __future__ import annotations
 
-import hashlib
 import os
 from dataclasses import dataclass
 from datetime import datetime
-from pathlib import Path
 
 from flask import Flask, abort, render_template, send_file
-
-from debian_repo_scrape.verify import HASH_FUNCTION_MAP
+from synthetic import HashIndex
 
 
 @dataclass
@@ -25,6 +22,7 @@ class File(Directory):
 def create_app():
     app = Flask("testapp", template_folder=os.path.dirname(__file__))
     app.config
+    hash_indexes: dict[str, HashIndex] = {}
 
     def get_thingy(path: str, local_base_path: str):
         requested_thingy = os.path.join(
@@ -32,21 +30,17 @@ def create_app():
         )
 
         if "by-hash" in path:
-            hash_ = os.path.basename(path)
-            hash_type = path.split("/")[-2].lower()
-
-            for name, arg, _ in HASH_FUNCTION_MAP:
-                if name.lower() == hash_type:
-                    for path in Path("tests/repo").rglob("*"):
-                        try:
-                            with open(path, "rb") as f:
-                                if hashlib.new(arg, f.read()).hexdigest() == hash_:
-                                    return send_file(
-                                        path, mimetype="application/octet-stream"
-                                    )
-                        except IsADirectoryError:
-                            continue
-            abort(404)
+            hash_index = hash_indexes.get(local_base_path)
+            if hash_index is None:
+                hash_index = hash_indexes[local_base_path] = HashIndex(
+                    os.path.join(os.path.dirname(__file__), local_base_path)
+                )
+            by_hash_path = hash_index.lookup(
+                path.split("/")[-2].lower(), os.path.basename(path)
+            )
+            if by_hash_path is None:
+                abort(404)
+            return send_file(by_hash_path, mimetype="application/octet-stream")
 
         if path == "forbidden":
             abort(403)
@@ -68,6 +62,8 @@ def create_app():
             obj = os.listdir(requested_thingy)
         except NotADirectoryError:
             return send_file(requested_thingy, mimetype="application/octet-stream")
+        except FileNotFoundError:
+            abort(404)
 
         for obj in os.listdir(requested_thingy):
             obj_path = os.path.join(requested_thingy, obj)
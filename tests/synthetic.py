@@ -0,0 +1,659 @@
+from __future__ import annotations
+
+import bz2
+import difflib
+import gzip
+import hashlib
+import html
+import lzma
+import os
+import random
+import shutil
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+if t.TYPE_CHECKING:
+    from pgpy import PGPKey
+
+HASH_ALGORITHMS = (("MD5Sum", "md5"), ("SHA1", "sha1"), ("SHA256", "sha256"))
+COMPRESSORS: dict[str, t.Callable[[bytes], bytes]] = {
+    "": lambda data: data,
+    "gz": lambda data: gzip.compress(data, mtime=0),
+    "xz": lzma.compress,
+    "bz2": bz2.compress,
+}
+
+
+@dataclass
+class SyntheticRepoConfig:
+    """Shape of a generated repository"""
+
+    suites: t.Sequence[str] = ("stable",)
+    components: t.Sequence[str] = ("main",)
+    architectures: t.Sequence[str] = ("amd64",)
+    packages_per_index: int = 10
+    deb_size: int = 1024
+    compressions: t.Sequence[str] = ("", "gz")
+    by_hash: bool = False
+    arch_all_fraction: float = 0.0
+    contents: bool = False
+    sources: bool = False
+    pdiff_history: int = 0
+    """Number of former versions of every Packages file published as pdiffs"""
+    sparse_debs: bool = False
+    """Write debs and source files as sparse files of zeros, so that they can be
+    gigabytes large without taking disk space"""
+    seed: int = 0
+
+
+@dataclass
+class SyntheticRepo:
+    root: Path
+    config: SyntheticRepoConfig
+    debs: list[Path] = field(default_factory=list)
+    source_files: list[Path] = field(default_factory=list)
+    packages_history: dict[str, list[bytes]] = field(default_factory=dict)
+    """Former versions of Packages files by their path, oldest first"""
+
+
+def generate_signing_key(bits: int = 2048) -> PGPKey:
+    from pgpy import PGPUID, PGPKey
+    from pgpy.constants import HashAlgorithm, KeyFlags, PubKeyAlgorithm
+
+    key = PGPKey.new(PubKeyAlgorithm.RSAEncryptOrSign, bits)
+    key.add_uid(
+        PGPUID.new("Synthetic Repository", email="synthetic@localhost"),
+        usage={KeyFlags.Sign},
+        hashes=[HashAlgorithm.SHA256],
+    )
+    return key
+
+
+def _sign_release(suite_path: Path, release: bytes, key: PGPKey):
+    from pgpy import PGPMessage
+
+    (suite_path / "Release.gpg").write_text(str(key.sign(release)))
+    message = PGPMessage.new(release.decode(), cleartext=True)
+    message |= key.sign(message)
+    (suite_path / "InRelease").write_text(str(message))
+
+
+def _hashes(data: bytes) -> dict[str, str]:
+    return {name: hashlib.new(arg, data).hexdigest() for name, arg in HASH_ALGORITHMS}
+
+
+def _file_hashes(path: Path) -> tuple[int, dict[str, str]]:
+    hashes = [(name, hashlib.new(arg)) for name, arg in HASH_ALGORITHMS]
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            for _, hash_ in hashes:
+                hash_.update(chunk)
+            size += len(chunk)
+    return size, {name: hash_.hexdigest() for name, hash_ in hashes}
+
+
+def _write_deb(
+    path: Path, size: int, rng: random.Random, sparse: bool = False
+) -> tuple[int, dict[str, str]]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if sparse:
+        with open(path, "wb") as f:
+            f.truncate(size)
+        return _file_hashes(path)
+    content = rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+    path.write_bytes(content)
+    return size, _hashes(content)
+
+
+def _packages_stanza(
+    name: str,
+    arch: str,
+    filename: str,
+    deb: tuple[int, dict[str, str]],
+    component: str,
+) -> str:
+    size, hashes = deb
+    return (
+        f"Package: {name}\n"
+        "Version: 1.0\n"
+        f"Architecture: {arch}\n"
+        "Maintainer: Synthetic Maintainer <synthetic@localhost>\n"
+        f"Installed-Size: {size // 1024 + 1}\n"
+        f"Section: {component}\n"
+        "Priority: optional\n"
+        f"Filename: {filename}\n"
+        f"Size: {size}\n"
+        f"MD5sum: {hashes['MD5Sum']}\n"
+        f"SHA1: {hashes['SHA1']}\n"
+        f"SHA256: {hashes['SHA256']}\n"
+        f"Description: synthetic package {name}\n"
+        " This package was generated for benchmarking repository scraping.\n"
+        " .\n"
+        " It contains random bytes only.\n"
+        f"Description-md5: {hashlib.md5(name.encode()).hexdigest()}\n"
+    )
+
+
+def _sources_stanza(
+    name: str, component: str, files: dict[str, tuple[int, dict[str, str]]]
+) -> str:
+    hashed = [(file_name, size, hashes) for file_name, (size, hashes) in files.items()]
+    lines = [
+        f"Package: {name}",
+        f"Binary: {name}, {name}-doc",
+        "Version: 1.0",
+        "Maintainer: Synthetic Maintainer <synthetic@localhost>",
+        "Architecture: any",
+        "Format: 3.0 (quilt)",
+        f"Directory: pool/{component}/p/{name}",
+        "Priority: source",
+        f"Section: {component}",
+    ]
+    for field_name, key in (
+        ("Files", "MD5Sum"),
+        ("Checksums-Sha1", "SHA1"),
+        ("Checksums-Sha256", "SHA256"),
+    ):
+        lines.append(f"{field_name}:")
+        lines.extend(
+            f" {hashes[key]} {size} {file_name}" for file_name, size, hashes in hashed
+        )
+    return "\n".join(lines) + "\n"
+
+
+def ed_diff(old: bytes, new: bytes) -> bytes:
+    """The ed script that diff --ed writes to turn old into new"""
+    old_lines, new_lines = old.splitlines(), new.splitlines()
+
+    def text(lines: list[bytes]) -> list[bytes]:
+        # a line with a single dot would end the text, diff escapes it
+        escaped: list[bytes] = []
+        for line in lines:
+            escaped.extend([b"..", b".", b"s/.//", b"a"] if line == b"." else [line])
+        return [*escaped, b"."]
+
+    script: list[bytes] = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        lines = b"%d,%d" % (i1 + 1, i2) if i2 - i1 > 1 else b"%d" % (i1 + 1)
+        if tag == "delete":
+            script.append(lines + b"d")
+        elif tag == "insert":
+            script.extend([b"%da" % i1, *text(new_lines[j1:j2])])
+        elif tag == "replace":
+            script.extend([lines + b"c", *text(new_lines[j1:j2])])
+    return b"".join(line + b"\n" for line in script)
+
+
+def _pdiff_index(versions: list[bytes]) -> bytes:
+    current = versions[-1]
+    patches = [ed_diff(old, new) for old, new in zip(versions, versions[1:])]
+    lines = [f"SHA256-Current: {_hashes(current)['SHA256']} {len(current)}"]
+    for field_name, files in (
+        ("History", versions[:-1]),
+        ("Patches", patches),
+        ("Download", [COMPRESSORS["gz"](patch) for patch in patches]),
+    ):
+        suffix = ".gz" if field_name == "Download" else ""
+        lines.append(f"SHA256-{field_name}:")
+        lines.extend(
+            f" {_hashes(data)['SHA256']} {len(data)} T-{i}{suffix}"
+            for i, data in enumerate(files)
+        )
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _write_index(
+    suite_path: Path, rel_path: str, data: bytes, by_hash: bool
+) -> tuple[str, bytes]:
+    path = suite_path / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    if by_hash:
+        for name, digest in _hashes(data).items():
+            by_hash_path = path.parent / "by-hash" / name / digest
+            by_hash_path.parent.mkdir(parents=True, exist_ok=True)
+            if not by_hash_path.exists():
+                by_hash_path.write_bytes(data)
+    return rel_path, data
+
+
+def _release_content(
+    suite: str,
+    config: SyntheticRepoConfig,
+    indexes: list[tuple[str, bytes]],
+    date: str,
+) -> bytes:
+    lines = [
+        "Origin: Synthetic",
+        "Label: Synthetic repository",
+        f"Suite: {suite}",
+        f"Codename: {suite.split('/')[0]}",
+        f"Date: {date}",
+        f"Architectures: {' '.join(config.architectures)}",
+        f"Components: {' '.join(config.components)}",
+        "Description: Generated repository for benchmarks",
+    ]
+    if config.by_hash:
+        lines.append("Acquire-By-Hash: yes")
+    hashed = [(name, len(data), _hashes(data)) for name, data in indexes]
+    for key, _ in HASH_ALGORITHMS:
+        lines.append(f"{key}:")
+        lines.extend(
+            f" {hashes[key]} {size:>16} {name}" for name, size, hashes in hashed
+        )
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _old_packages(entries: list[str], age: int) -> bytes:
+    """A former version of a Packages file with fewer and older packages"""
+    old = [entry.replace("Version: 1.0", f"Version: 0.{age}") for entry in entries]
+    return "\n".join(old[: max(1, len(old) - age)]).encode()
+
+
+def generate_repo(
+    root: str | os.PathLike,
+    config: SyntheticRepoConfig | None = None,
+    signing_key: PGPKey | None = None,
+) -> SyntheticRepo:
+    """
+    Generate a debian repository below root.
+    Release files are signed if a signing key is supplied.
+    """
+
+    config = config or SyntheticRepoConfig()
+    repo = SyntheticRepo(root=Path(root), config=config)
+    rng = random.Random(config.seed)
+    date = time.strftime("%a, %d %b %Y %H:%M:%S UTC", time.gmtime())
+    all_count = int(config.packages_per_index * config.arch_all_fraction)
+
+    # the pool is shared between suites, like in a real archive
+    stanzas: dict[tuple[str, str], str] = {}
+    entries_by_index: dict[tuple[str, str], list[str]] = {}
+    contents: dict[tuple[str, str], bytes] = {}
+    for component in config.components:
+        for arch in config.architectures:
+            entries: list[str] = []
+            for i in range(config.packages_per_index):
+                pkg_arch = "all" if i < all_count else arch
+                name = f"pkg{i}"
+                filename = f"pool/{component}/p/{name}/{name}_1.0_{pkg_arch}.deb"
+                deb_path = repo.root / filename
+                if deb_path.exists():
+                    deb = _file_hashes(deb_path)
+                else:
+                    deb = _write_deb(deb_path, config.deb_size, rng, config.sparse_debs)
+                    repo.debs.append(deb_path)
+                entries.append(
+                    _packages_stanza(name, pkg_arch, filename, deb, component)
+                )
+            stanzas[(component, arch)] = "\n".join(entries)
+            entries_by_index[(component, arch)] = entries
+            names = [f"{component}/pkg{i}" for i in range(config.packages_per_index)]
+            contents[(component, arch)] = "".join(
+                [
+                    "usr/share/doc/synthetic/README" f" {','.join(names)}\n",
+                    *(f"usr/bin/{name.split('/')[1]} {name}\n" for name in names),
+                ]
+            ).encode()
+
+    sources: dict[str, str] = {}
+    for component in config.components if config.sources else ():
+        entries = []
+        for i in range(config.packages_per_index):
+            name = f"pkg{i}"
+            files: dict[str, tuple[int, dict[str, str]]] = {}
+            for file_name in (f"{name}_1.0.dsc", f"{name}_1.0.orig.tar.gz"):
+                path = repo.root / "pool" / component / "p" / name / file_name
+                files[file_name] = _write_deb(
+                    path, config.deb_size, rng, config.sparse_debs
+                )
+                repo.source_files.append(path)
+            entries.append(_sources_stanza(name, component, files))
+        sources[component] = "\n".join(entries)
+
+    for suite in config.suites:
+        suite_path = repo.root / "dists" / suite
+        indexes: list[tuple[str, bytes]] = []
+        for component in config.components:
+            for compression in config.compressions if config.sources else ():
+                rel_path = f"{component}/source/Sources"
+                if compression:
+                    rel_path += f".{compression}"
+                indexes.append(
+                    _write_index(
+                        suite_path,
+                        rel_path,
+                        COMPRESSORS[compression](sources[component].encode()),
+                        config.by_hash,
+                    )
+                )
+            for arch in config.architectures:
+                base = f"{component}/binary-{arch}"
+                packages = stanzas[(component, arch)].encode()
+                if config.pdiff_history:
+                    versions = [
+                        _old_packages(entries_by_index[(component, arch)], j)
+                        for j in range(config.pdiff_history, 0, -1)
+                    ]
+                    repo.packages_history[f"dists/{suite}/{base}/Packages"] = versions
+                    versions = [*versions, packages]
+                    for i, (old, new) in enumerate(zip(versions, versions[1:])):
+                        patch_path = suite_path / base / "Packages.diff" / f"T-{i}.gz"
+                        patch_path.parent.mkdir(parents=True, exist_ok=True)
+                        patch_path.write_bytes(COMPRESSORS["gz"](ed_diff(old, new)))
+                    indexes.append(
+                        _write_index(
+                            suite_path,
+                            f"{base}/Packages.diff/Index",
+                            _pdiff_index(versions),
+                            config.by_hash,
+                        )
+                    )
+                for compression in config.compressions:
+                    rel_path = f"{base}/Packages"
+                    if compression:
+                        rel_path += f".{compression}"
+                    indexes.append(
+                        _write_index(
+                            suite_path,
+                            rel_path,
+                            COMPRESSORS[compression](packages),
+                            config.by_hash,
+                        )
+                    )
+                if config.contents:
+                    indexes.append(
+                        _write_index(
+                            suite_path,
+                            f"{component}/Contents-{arch}.gz",
+                            COMPRESSORS["gz"](contents[(component, arch)]),
+                            config.by_hash,
+                        )
+                    )
+                component_release = (
+                    f"Archive: {suite}\nComponent: {component}\n"
+                    f"Architecture: {arch}\n"
+                ).encode()
+                indexes.append(
+                    _write_index(
+                        suite_path, f"{base}/Release", component_release, False
+                    )
+                )
+
+        release = _release_content(suite, config, indexes, date)
+        (suite_path / "Release").write_bytes(release)
+        if signing_key is not None:
+            _sign_release(suite_path, release, signing_key)
+
+    if signing_key is not None:
+        (repo.root / "public_key.asc").write_text(str(signing_key.pubkey))
+
+    return repo
+
+
+def update_index(
+    repo: SyntheticRepo,
+    suite: str,
+    rel_path: str,
+    data: bytes,
+    signing_key: PGPKey | None = None,
+):
+    """
+    Replace an index of a generated repository like an archive update does,
+    including its entries in the Release file
+    """
+    suite_path = repo.root / "dists" / suite
+    old_hashes = _hashes((suite_path / rel_path).read_bytes())
+    new_hashes = _hashes(data)
+    _write_index(suite_path, rel_path, data, repo.config.by_hash)
+    lines = []
+    for line in (suite_path / "Release").read_text().splitlines():
+        parts = line.split()
+        if line.startswith(" ") and len(parts) == 3 and parts[2] == rel_path:
+            key = next(key for key, value in old_hashes.items() if value == parts[0])
+            line = f" {new_hashes[key]} {len(data):>16} {rel_path}"
+        lines.append(line)
+    release = ("\n".join(lines) + "\n").encode()
+    (suite_path / "Release").write_bytes(release)
+    if signing_key is not None:
+        _sign_release(suite_path, release, signing_key)
+
+
+class HashIndex:
+    """
+    Maps the digests of all files below a directory to their paths.
+
+    The index is built on first use and only files whose size or modification
+    time changed are hashed again when a lookup misses or hits a stale entry.
+    """
+
+    def __init__(self, root: str | os.PathLike) -> None:
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._stats: dict[Path, tuple[int, int]] = {}
+        self._digests: dict[Path, dict[str, str]] = {}
+        self._paths: dict[tuple[str, str], Path] = {}
+
+    def _refresh(self):
+        seen: set[Path] = set()
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = Path(dirpath, filename)
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:  # pragma: no cover
+                    continue
+                seen.add(path)
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if self._stats.get(path) == signature:
+                    continue
+                self._stats[path] = signature
+                self._digests[path] = {
+                    dict(HASH_ALGORITHMS)[name]: digest
+                    for name, digest in _file_hashes(path)[1].items()
+                }
+
+        for path in set(self._stats) - seen:
+            del self._stats[path]
+            del self._digests[path]
+
+        self._paths = {
+            (arg, digest): path
+            for path, digests in self._digests.items()
+            for arg, digest in digests.items()
+        }
+
+    def _is_fresh(self, path: Path) -> bool:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+        return self._stats.get(path) == (stat.st_size, stat.st_mtime_ns)
+
+    def lookup(self, hash_type: str, digest: str) -> Path | None:
+        """Return the path of a file by a by-hash type (e.g. SHA256) and digest"""
+        args = [arg for name, arg in HASH_ALGORITHMS if name.lower() == hash_type]
+        if not args:
+            return None
+        key = (args[0], digest)
+        with self._lock:
+            path = self._paths.get(key)
+            if path is None or not self._is_fresh(path):
+                self._refresh()
+                path = self._paths.get(key)
+        return path
+
+
+class _RepoRequestHandler(BaseHTTPRequestHandler):
+    server: SyntheticRepoServer
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, which stalls kept-alive
+    # connections on delayed ACKs with Nagle's algorithm enabled
+    disable_nagle_algorithm = True
+
+    def log_message(self, *_):
+        pass
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _send(self, status: int, headers: dict[str, str], body: bytes, head: bool):
+        self.send_response(status)
+        headers.setdefault("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+        self.server._count(0 if head else len(body))
+
+    def _serve(self, head: bool):
+        rel_path = unquote(urlsplit(self.path).path).lstrip("/")
+        path = (self.server.root / rel_path).resolve()
+        if self.server.root not in path.parents and path != self.server.root:
+            return self._send(403, {}, b"", head)
+
+        if not path.exists() and "by-hash" in rel_path:
+            parts = rel_path.split("/")
+            by_hash_path = self.server.hash_index.lookup(parts[-2].lower(), parts[-1])
+            if by_hash_path is not None:
+                path = by_hash_path
+
+        if path.is_dir():
+            if not self.server.listings:
+                return self._send(403, {}, b"", head)
+            body = self._listing(path, rel_path).encode()
+            return self._send(
+                200, {"Content-Type": "text/html;charset=UTF-8"}, body, head
+            )
+        if not path.is_file():
+            return self._send(404, {}, b"", head)
+
+        stat = path.stat()
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "ETag": etag,
+            "Last-Modified": last_modified,
+        }
+        if self._not_modified(etag, stat.st_mtime):
+            headers["Content-Length"] = "0"
+            return self._send(304, headers, b"", head)
+
+        self.send_response(200)
+        headers["Content-Length"] = str(stat.st_size)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if head:
+            return self.server._count(0)
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, 1024 * 1024)
+        self.server._count(stat.st_size)
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in (tag.strip() for tag in if_none_match.split(","))
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):  # pragma: no cover
+                return False
+            return int(mtime) <= since
+        return False
+
+    @staticmethod
+    def _listing(path: Path, rel_path: str) -> str:
+        dirs, files = [], []
+        with os.scandir(path) as it:
+            for entry in sorted(it, key=lambda e: e.name):
+                stat = entry.stat()
+                date = datetime.fromtimestamp(stat.st_mtime).strftime("%d-%b-%Y %H:%M")
+                if entry.is_dir():
+                    name = f"{entry.name}/"
+                    dirs.append((name, date, "-"))
+                else:
+                    files.append((entry.name, date, str(stat.st_size)))
+
+        rows = "".join(
+            f'<a href="{html.escape(name)}">{html.escape(name)}</a>'
+            f"{' ' * (51 - len(name))}{date}{size:>20}\n"
+            for name, date, size in dirs + files
+        )
+        title = f"Index of /{html.escape(rel_path)}"
+        return (
+            f"<html>\n<head><title>{title}</title></head>\n<body>\n"
+            f'<h1>{title}</h1><hr><pre><a href="../">../</a>\n{rows}'
+            "</pre><hr></body>\n</html>\n"
+        )
+
+
+class SyntheticRepoServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server that serves a directory like an apache file browser.
+
+    Counts requests and transferred body bytes, resolves by-hash paths
+    through a HashIndex and answers conditional requests. Without listings
+    directories are forbidden like on servers without autoindex.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, root: str | os.PathLike, port: int = 0, listings: bool = True
+    ) -> None:
+        super().__init__(("127.0.0.1", port), _RepoRequestHandler)
+        self.root = Path(root).resolve()
+        self.listings = listings
+        self.hash_index = HashIndex(self.root)
+        self._stats_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def _count(self, size: int):
+        with self._stats_lock:
+            self.requests += 1
+            self.bytes_sent += size
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.requests = 0
+            self.bytes_sent = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+from synthetic import SyntheticRepoConfig, SyntheticRepoServer, generate_repo
+
+from debian_repo_scrape.batch import (
+    BatchResult,
+    RepoSpec,
+    format_report,
+    load_manifest,
+    main,
+    scrape_batch,
+)
+from debian_repo_scrape.exc import FileRequestError
+from debian_repo_scrape.fetch import FetchScheduler, get_scheduler, scheduler_scope
+from debian_repo_scrape.scrape import scrape_repo
+from debian_repo_scrape.utils import _get_response, response_cache_scope
+
+
+@pytest.fixture()
+def batch_servers(tmp_path, signing_key):
+    repos = [
+        generate_repo(
+            tmp_path / f"repo{i}",
+            SyntheticRepoConfig(suites=["stable"], packages_per_index=i + 3, seed=i),
+            signing_key,
+        )
+        for i in range(3)
+    ]
+    servers = [SyntheticRepoServer(repo.root) for repo in repos]
+    for server in servers:
+        server.start()
+    yield repos, servers
+    for server in servers:
+        server.stop()
+
+
+def test_scrape_batch(batch_servers, tmp_path):
+    repos, servers = batch_servers
+    specs = [
+        RepoSpec(servers[0].url, key=str(repos[0].root / "public_key.asc")),
+        RepoSpec(servers[1].url, mode=False, name="second"),
+        RepoSpec(f"{servers[2].url}missing", mode=False),
+    ]
+    scheduler = get_scheduler()
+    finished: list[BatchResult] = []
+    results = scrape_batch(
+        specs,
+        workers=2,
+        total_concurrency=3,
+        output_dir=str(tmp_path / "out"),
+        on_result=finished.append,
+    )
+    assert get_scheduler() is scheduler
+    assert [result.spec for result in results] == specs
+    assert sorted(finished, key=lambda r: specs.index(r.spec)) == results
+
+    first, second, missing = results
+    assert first.ok and second.ok
+    assert first.repository == scrape_repo(
+        servers[0].url, str(repos[0].root / "public_key.asc")
+    )
+    assert len(second.repository.packages) == 4
+    assert isinstance(missing.error, FileRequestError)
+    assert missing.repository is None
+    for result in (first, second):
+        assert result.requests > 0
+        assert result.bytes > 0
+        assert result.throughput > 0
+    # verification downloads the pool, scraping without it only the indexes
+    assert first.bytes > second.bytes
+
+    snapshot = json.loads((tmp_path / "out" / "second.json").read_text())
+    assert snapshot["ok"]
+    assert len(snapshot["repository"]["suites"][0]["components"][0]["packages"]) == 4
+    assert len(list((tmp_path / "out").glob("*.json"))) == 3
+    assert not list((tmp_path / "out").glob("*.tmp"))
+
+    report = format_report(results).splitlines()
+    assert len(report) == 4
+    assert "FAILED" in report[2]
+    assert report[3].startswith("3 repositories, 1 failed")
+
+
+def test_scrape_batch_scope(batch_servers, request_recorder):
+    repos, servers = batch_servers
+    release_url = f"{servers[0].url}dists/stable/Release"
+    with scheduler_scope(FetchScheduler()) as scheduler, response_cache_scope():
+        _get_response(release_url)
+        scrape_batch([RepoSpec(servers[0].url, mode=False)], bandwidth=2**30)
+        assert get_scheduler() is scheduler
+        # the responses of the caller stay cached
+        with request_recorder:
+            _get_response(release_url)
+        assert request_recorder.events == []
+
+
+def test_batch_cli(batch_servers, tmp_path, capsys):
+    repos, servers = batch_servers
+    (tmp_path / "keys").mkdir()
+    (tmp_path / "keys" / "repo.asc").write_bytes(
+        (repos[0].root / "public_key.asc").read_bytes()
+    )
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            {
+                "repositories": [
+                    {"url": servers[0].url, "key": "keys/repo.asc", "name": "one"},
+                    {
+                        "url": servers[1].url,
+                        "mode": "size_only",
+                        "key": "keys/repo.asc",
+                    },
+                ]
+            }
+        )
+    )
+    assert load_manifest(str(manifest))[0] == RepoSpec(
+        servers[0].url, key=str(tmp_path / "keys" / "repo.asc"), name="one"
+    )
+
+    out = tmp_path / "out"
+    assert main([str(manifest), "-o", str(out), "--bandwidth", "10M"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    assert lines[-1].startswith("2 repositories, 0 failed")
+    assert (out / "one.json").exists()
+
+    manifest.write_text(json.dumps([{"url": f"{servers[0].url}missing"}]))
+    assert main([str(manifest)]) == 1
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import os
+import shutil
+
+import benchmark
+import pytest
+from debian.deb822 import Packages
+from synthetic import (
+    SyntheticRepoConfig,
+    SyntheticRepoServer,
+    generate_repo,
+    generate_signing_key,
+)
+
+from debian_repo_scrape.instrumentation import observe
+from debian_repo_scrape.parsing import PACKAGE_FIELDS, _iter_packages
+from debian_repo_scrape.scrape import _stanza_fields
+from debian_repo_scrape.tracing import Tracer
+from debian_repo_scrape.verify import VerificationModes
+
+pytestmark = pytest.mark.skipif(
+    not os.getenv("PYTEST_BENCHMARKS", ""), reason="Benchmarks are opt-in"
+)
+
+SCALE = int(os.getenv("BENCHMARK_SCALE", "1"))
+PROJECTION = ("name", "version", "architecture", "sha256")
+
+
+@pytest.fixture(scope="module")
+def large_repo(tmp_path_factory: pytest.TempPathFactory, signing_key):
+    config = SyntheticRepoConfig(
+        suites=["stable", "testing", "unstable", "stable/updates"],
+        components=["main", "contrib"],
+        architectures=["amd64", "arm64"],
+        packages_per_index=250 * SCALE,
+        deb_size=4096,
+        compressions=["", "gz", "xz"],
+        by_hash=True,
+        arch_all_fraction=0.2,
+    )
+    return generate_repo(tmp_path_factory.mktemp("large"), config, signing_key)
+
+
+@pytest.fixture(scope="module")
+def large_server(large_repo):
+    with SyntheticRepoServer(large_repo.root) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def many_suites_server(tmp_path_factory: pytest.TempPathFactory):
+    config = SyntheticRepoConfig(
+        suites=[f"suite{i}" for i in range(200)], packages_per_index=1
+    )
+    repo = generate_repo(
+        tmp_path_factory.mktemp("many_suites"), config, generate_signing_key(4096)
+    )
+    with SyntheticRepoServer(repo.root) as server:
+        yield server
+
+
+@pytest.fixture()
+def print_results(capsys: pytest.CaptureFixture):
+    def _print(
+        *results: benchmark.BenchmarkResult
+        | benchmark.ParserResult
+        | benchmark.ImportResult,
+    ):
+        with capsys.disabled():
+            print()
+            print(benchmark.report(results))
+
+    return _print
+
+
+def test_benchmark_discovery(large_server: SyntheticRepoServer, print_results):
+    print_results(
+        benchmark.run_benchmark(
+            "discovery", large_server, benchmark.discover, large_server.url
+        )
+    )
+
+
+def test_benchmark_scrape(large_server: SyntheticRepoServer, large_repo, print_results):
+    key_file = str(large_repo.root / "public_key.asc")
+    workers = os.cpu_count() or 1
+    print_results(
+        benchmark.run_benchmark(
+            "scrape", large_server, benchmark.scrape, large_server.url, key_file
+        ),
+        benchmark.run_benchmark(
+            f"scrape, {workers} parse workers",
+            large_server,
+            benchmark.scrape,
+            large_server.url,
+            key_file,
+            workers,
+        ),
+    )
+
+
+def test_benchmark_verification(
+    large_server: SyntheticRepoServer, large_repo, print_results
+):
+    print_results(
+        benchmark.run_benchmark(
+            "verify signatures",
+            large_server,
+            benchmark.verify_signatures,
+            large_server.url,
+            str(large_repo.root / "public_key.asc"),
+        ),
+        benchmark.run_benchmark(
+            "verify hash sums",
+            large_server,
+            benchmark.verify_hashes,
+            large_server.url,
+        ),
+    )
+
+
+def test_benchmark_tracing_overhead(
+    large_server: SyntheticRepoServer, large_repo, print_results, capsys
+):
+    disabled = benchmark.phase_overhead()
+    with observe(Tracer()):
+        enabled = benchmark.phase_overhead(100_000)
+    key_file = str(large_repo.root / "public_key.asc")
+    print_results(
+        benchmark.run_benchmark(
+            "scrape", large_server, benchmark.scrape, large_server.url, key_file
+        ),
+        benchmark.run_benchmark(
+            "scrape traced",
+            large_server,
+            benchmark.scrape_traced,
+            large_server.url,
+            key_file,
+        ),
+    )
+    with capsys.disabled():
+        print(
+            f"phase() disabled: {disabled * 1e9:.1f} ns, traced: {enabled * 1e9:.1f} ns"
+        )
+
+
+def test_benchmark_parallel_signatures(
+    many_suites_server: SyntheticRepoServer, print_results
+):
+    url = many_suites_server.url
+    key_file = f"{many_suites_server.root}/public_key.asc"
+    workers = os.cpu_count() or 1
+    print_results(
+        benchmark.run_benchmark(
+            "signatures 200 suites",
+            many_suites_server,
+            benchmark.verify_signatures,
+            url,
+            key_file,
+        ),
+        benchmark.run_benchmark(
+            f"signatures 200 suites, {workers} workers",
+            many_suites_server,
+            benchmark.verify_signatures,
+            url,
+            key_file,
+            workers,
+        ),
+        benchmark.run_benchmark(
+            f"InRelease only, {workers} workers",
+            many_suites_server,
+            benchmark.verify_signatures,
+            url,
+            key_file,
+            workers,
+            True,
+        ),
+    )
+    if shutil.which("gpgv"):
+        print_results(
+            benchmark.run_benchmark(
+                f"gpgv, {workers} workers",
+                many_suites_server,
+                benchmark.verify_signatures,
+                url,
+                key_file,
+                workers,
+                False,
+                "gpgv",
+            ),
+        )
+
+
+def test_benchmark_local_mirror(
+    large_server: SyntheticRepoServer, large_repo, print_results
+):
+    workers = os.cpu_count() or 1
+    print_results(
+        benchmark.run_benchmark(
+            "verify hash sums http",
+            large_server,
+            benchmark.verify_hashes,
+            large_server.url,
+        ),
+        benchmark.run_benchmark(
+            "verify hash sums local",
+            large_server,
+            benchmark.verify_hashes,
+            large_repo.root.as_uri(),
+        ),
+        benchmark.run_benchmark(
+            f"verify hash sums local, {workers} workers",
+            large_server,
+            benchmark.verify_hashes,
+            large_repo.root.as_uri(),
+            VerificationModes.STRICT.value,
+            workers,
+        ),
+    )
+
+
+def test_benchmark_parsers(large_repo, print_results):
+    content = b"\n".join(
+        path.read_bytes() for path in sorted(large_repo.root.glob("dists/**/Packages"))
+    )
+    print_results(
+        benchmark.run_parser_benchmark(
+            "parse deb822",
+            lambda content: Packages.iter_paragraphs(
+                content.split(b"\n"), use_apt_pkg=False
+            ),
+            content,
+        ),
+        benchmark.run_parser_benchmark("parse native", _iter_packages, content),
+        benchmark.run_parser_benchmark(
+            "parse native, package fields",
+            lambda content: _iter_packages(content, PACKAGE_FIELDS),
+            content,
+        ),
+    )
+
+
+def test_benchmark_projection(
+    large_server: SyntheticRepoServer, large_repo, print_results
+):
+    key_file = str(large_repo.root / "public_key.asc")
+    content = b"\n".join(
+        path.read_bytes() for path in sorted(large_repo.root.glob("dists/**/Packages"))
+    )
+    projection = _stanza_fields(PROJECTION)
+    print_results(
+        benchmark.run_benchmark(
+            "scrape", large_server, benchmark.scrape, large_server.url, key_file
+        ),
+        benchmark.run_benchmark(
+            "scrape, name/version/arch/sha256",
+            large_server,
+            benchmark.scrape,
+            large_server.url,
+            key_file,
+            1,
+            PROJECTION,
+        ),
+        benchmark.run_parser_benchmark(
+            "parse native, package fields",
+            lambda content: _iter_packages(content, PACKAGE_FIELDS),
+            content,
+        ),
+        benchmark.run_parser_benchmark(
+            "parse native, name/version/arch/sha256",
+            lambda content: _iter_packages(content, projection),
+            content,
+        ),
+    )
+
+
+def test_benchmark_startup(print_results):
+    print_results(
+        *(
+            benchmark.run_import_benchmark(module)
+            for module in (
+                "debian_repo_scrape.utils",
+                "debian_repo_scrape.scrape",
+                "debian_repo_scrape.batch",
+                "pgpy",
+                "bs4",
+                "debian.deb822",
+            )
+        )
+    )
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import gzip
+import lzma
+
+import pytest
+from synthetic import SyntheticRepoConfig, SyntheticRepoServer, generate_repo
+
+from debian_repo_scrape.contents import (
+    ContentsIndex,
+    ContentsIndexBuilder,
+    build_contents_index,
+    iter_contents,
+)
+from debian_repo_scrape.exc import SHA256Invalid
+
+CONTENTS = (
+    b"usr/bin/sudo                                            admin/sudo\n"
+    b"usr/share/doc/a file with spaces\tdoc/a,net/b\n"
+    b"./etc/ssh/sshd_config     net/openssh-server\n"
+    b"usr/lib/libfoo.so.1 libs/libfoo1\n"
+)
+OLD_CONTENTS = (
+    b"This file maps each file available in the Debian GNU/Linux system to\n"
+    b"the package from which it originates.\n"
+    b"\n"
+    b"FILE                                                    LOCATION\n"
+) + CONTENTS
+
+
+def chunked(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]  # noqa: E203
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 2**16])
+@pytest.mark.parametrize(
+    "content,compression",
+    [
+        (CONTENTS, ""),
+        (OLD_CONTENTS, ""),
+        (gzip.compress(OLD_CONTENTS), ".gz"),
+        (lzma.compress(CONTENTS), ".xz"),
+    ],
+)
+def test_iter_contents(content: bytes, compression: str, chunk_size: int):
+    assert list(iter_contents(chunked(content, chunk_size), compression)) == [
+        (b"usr/bin/sudo", b"admin/sudo"),
+        (b"usr/share/doc/a file with spaces", b"doc/a,net/b"),
+        (b"etc/ssh/sshd_config", b"net/openssh-server"),
+        (b"usr/lib/libfoo.so.1", b"libs/libfoo1"),
+    ]
+
+
+@pytest.mark.parametrize("run_size", [1, 2, 1000])
+def test_contents_index(tmp_path, run_size: int):
+    path = tmp_path / "contents.idx"
+    with ContentsIndexBuilder(path, run_size) as builder:
+        builder.add_all(iter_contents([CONTENTS]))
+        builder.add(b"usr/bin/sudo", b"admin/sudo-ldap")
+        builder.add(b"usr/bin/sudo", b"admin/sudo")
+        index = builder.finish()
+    with index:
+        assert len(index) == 4
+        assert index.lookup("/usr/bin/sudo") == ["sudo", "sudo-ldap"]
+        assert index.locations("usr/share/doc/a file with spaces") == [
+            "doc/a",
+            "net/b",
+        ]
+        assert index.lookup("usr/bin") == []
+        assert index.lookup("zzz") == []
+        assert "etc/ssh/sshd_config" in index
+        assert [path for path, _ in index.search("usr/")] == [
+            "usr/bin/sudo",
+            "usr/lib/libfoo.so.1",
+            "usr/share/doc/a file with spaces",
+        ]
+        assert list(index.search("var/")) == []
+    assert not list(tmp_path.glob("*.tmp"))
+
+    with ContentsIndex(path) as index:
+        assert index.lookup("usr/lib/libfoo.so.1") == ["libfoo1"]
+
+
+def test_empty_contents_index(tmp_path):
+    with ContentsIndexBuilder(tmp_path / "empty.idx") as builder:
+        with builder.finish() as index:
+            assert len(index) == 0
+            assert index.lookup("usr/bin/sudo") == []
+
+
+def test_invalid_contents_index(tmp_path):
+    path = tmp_path / "invalid.idx"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        ContentsIndex(path)
+
+
+def test_build_contents_index(synthetic_server, synthetic_repo, tmp_path):
+    with build_contents_index(
+        synthetic_server.url, "stable", "amd64", tmp_path / "amd64.idx"
+    ) as index:
+        assert index.locations("/usr/bin/pkg1") == ["contrib/pkg1", "main/pkg1"]
+        assert index.lookup("usr/share/doc/synthetic/README") == [
+            f"pkg{i}" for i in range(5)
+        ]
+        assert len(index) == 6
+
+    local = synthetic_repo.root.as_uri()
+    with build_contents_index(
+        local, "testing/updates", "arm64", tmp_path / "arm64.idx", run_size=2
+    ) as index:
+        assert len(index) == 6
+
+
+def test_build_contents_index_hash_mismatch(tmp_path):
+    config = SyntheticRepoConfig(contents=True)
+    repo = generate_repo(tmp_path / "repo", config)
+    (repo.root / "dists/stable/main/Contents-amd64.gz").write_bytes(
+        gzip.compress(b"usr/bin/evil main/pkg0\n")
+    )
+    with SyntheticRepoServer(repo.root) as server:
+        with pytest.raises(SHA256Invalid):
+            build_contents_index(server.url, "stable", "amd64", tmp_path / "i.idx")
+    assert not (tmp_path / "i.idx").exists()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import dataclasses
+import tracemalloc
+
+import pytest
+from synthetic import (
+    SyntheticRepoConfig,
+    SyntheticRepoServer,
+    generate_repo,
+    update_index,
+)
+
+from debian_repo_scrape.diff import (
+    ChangeTypes,
+    diff_repositories,
+    diff_snapshots,
+    iter_snapshot,
+    save_snapshot,
+)
+from debian_repo_scrape.scrape import (
+    Component,
+    Package,
+    Repository,
+    Suite,
+    scrape_flat_repo,
+    scrape_repo,
+)
+from debian_repo_scrape.utils import clear_response_cache
+
+PACKAGES = "main/binary-amd64/Packages"
+
+
+def package(name: str, version: str = "1.0", sha256: str = "0" * 64) -> Package:
+    return Package(
+        name=name,
+        version=version,
+        url=f"http://localhost/pool/{name}_{version}_amd64.deb",
+        size=1024,
+        sha256=sha256,
+        sha1=None,
+        md5=None,
+        description=f"package {name}",
+        maintainer=None,
+        section=None,
+        priority=None,
+        date="Mon, 19 Oct 2026 00:00:00 UTC",
+        architecture="amd64",
+        description_md5=None,
+        phased_update_percentage=None,
+    )
+
+
+def repository(*components: tuple[str, list[Package]]) -> Repository[Suite]:
+    return Repository(
+        url="http://localhost/",
+        suites=[
+            Suite(
+                name="stable",
+                url="http://localhost/dists/stable",
+                architectures=["amd64"],
+                date="",
+                components=[
+                    Component(name=name, packages=packages, url="")
+                    for name, packages in components
+                ],
+            )
+        ],
+    )
+
+
+def changes(diff) -> set[tuple[str, str, str, str | None]]:
+    return {
+        (
+            change.type.value,
+            change.component,
+            f"{change.package.name} {change.package.version}",
+            change.previous and change.previous.version,
+        )
+        for change in diff
+    }
+
+
+def test_diff_repositories(tmp_path):
+    old = repository(
+        ("main", [package("a"), package("b"), package("c"), package("d", "1.0")]),
+        ("contrib", [package("e")]),
+    )
+    new = repository(
+        (
+            "main",
+            [
+                package("a"),
+                package("b", sha256="1" * 64),
+                package("d", "2.0"),
+                package("d", "2.1"),
+                package("f"),
+            ],
+        ),
+    )
+    expected = {
+        ("updated", "main", "b 1.0", "1.0"),
+        ("removed", "main", "c 1.0", None),
+        ("added", "main", "d 2.0", None),
+        ("added", "main", "d 2.1", None),
+        ("removed", "main", "d 1.0", None),
+        ("added", "main", "f 1.0", None),
+        ("removed", "contrib", "e 1.0", None),
+    }
+    assert changes(diff_repositories(old, new)) == expected
+    assert not list(diff_repositories(old, old))
+
+    save_snapshot(old, tmp_path / "old.jsonl")
+    save_snapshot(new, tmp_path / "new.jsonl")
+    records = list(iter_snapshot(tmp_path / "old.jsonl"))
+    assert [key for key, _ in records] == sorted(key for key, _ in records)
+    assert sorted(p.name for _, p in records) == sorted(p.name for p in old.packages)
+    assert changes(diff_snapshots(tmp_path / "old.jsonl", tmp_path / "new.jsonl")) == (
+        expected
+    )
+    assert not list(diff_snapshots(tmp_path / "new.jsonl", tmp_path / "new.jsonl"))
+
+    lines = (tmp_path / "new.jsonl").read_text().splitlines()
+    (tmp_path / "unsorted.jsonl").write_text("\n".join(lines[::-1]) + "\n")
+    with pytest.raises(ValueError):
+        list(diff_snapshots(tmp_path / "old.jsonl", tmp_path / "unsorted.jsonl"))
+
+
+def test_diff_scraped_repositories(tmp_path, signing_key, flat_navigator):
+    repo = generate_repo(
+        tmp_path / "repo",
+        SyntheticRepoConfig(components=["main", "contrib"], compressions=[""]),
+        signing_key,
+    )
+    with SyntheticRepoServer(repo.root) as server:
+        old = scrape_repo(server.url, b"", verify=False)
+        path = repo.root / "dists" / "stable" / PACKAGES
+        content = path.read_text().replace(
+            "Package: pkg3\nVersion: 1.0", "Package: pkg3\nVersion: 1.1"
+        )
+        update_index(repo, "stable", PACKAGES, content.encode(), signing_key)
+        clear_response_cache()
+        new = scrape_repo(server.url, b"", verify=False)
+    diff = list(diff_repositories(old, new))
+    assert [(c.type, c.suite, c.component, c.package.name) for c in diff] == [
+        (ChangeTypes.UPDATED, "stable", "main", "pkg3")
+    ]
+
+    flat = scrape_flat_repo(flat_navigator, b"", verify=False)
+    assert not list(diff_repositories(flat, flat))
+    assert len(list(diff_repositories(flat, Repository(flat.url, [])))) == len(
+        flat.packages
+    )
+
+
+def test_diff_snapshots_memory(tmp_path):
+    packages = [package(f"pkg{i:05}") for i in range(20000)]
+    updated = [
+        dataclasses.replace(p, version="2.0") if i % 2000 == 0 else p
+        for i, p in enumerate(packages)
+    ]
+    save_snapshot(repository(("main", packages)), tmp_path / "old.jsonl")
+    save_snapshot(repository(("main", updated)), tmp_path / "new.jsonl")
+    assert (tmp_path / "old.jsonl").stat().st_size > 5 * 2**20
+
+    tracemalloc.start()
+    try:
+        diff = list(diff_snapshots(tmp_path / "old.jsonl", tmp_path / "new.jsonl"))
+        _, peak_alloc = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(diff) == 10
+    assert all(change.type == ChangeTypes.UPDATED for change in diff)
+    # the snapshots are streamed, only the changes are kept
+    assert peak_alloc < 2**20
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from debian_repo_scrape.exc import FileRequestError
+from debian_repo_scrape.fetch import (
+    AdaptiveLimit,
+    Bandwidth,
+    FairShare,
+    FetchScheduler,
+    TokenBucket,
+    get_scheduler,
+    set_scheduler,
+)
+from debian_repo_scrape.utils import (
+    _get_file_abs,
+    _iter_file_abs,
+    clear_response_cache,
+)
+
+
+class FakeAdapter(BaseAdapter):
+    """Answers requests with the given status codes, the last one repeating"""
+
+    def __init__(self, status_codes: list[int | type[Exception]], delay=0.0) -> None:
+        super().__init__()
+        self.status_codes = status_codes
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            status = self.status_codes[min(self.calls, len(self.status_codes) - 1)]
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        if not isinstance(status, int):
+            raise status("fake")
+        resp = requests.Response()
+        resp.status_code = status
+        if kwargs.get("stream"):
+            resp.raw = io.BytesIO(b"content")
+        else:
+            resp._content = b"content"
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+def fake_scheduler(adapter: FakeAdapter, **kwargs) -> FetchScheduler:
+    session = requests.Session()
+    session.mount("http://", adapter)
+    kwargs.setdefault("backoff", 0)
+    return FetchScheduler(session=session, **kwargs)
+
+
+def test_retry():
+    adapter = FakeAdapter([503, requests.ConnectionError, 200])
+    resp = fake_scheduler(adapter).get("http://mirror/dists/stable/Release")
+    assert resp.status_code == 200
+    assert adapter.calls == 3
+
+
+def test_retry_exhausted():
+    adapter = FakeAdapter([503])
+    resp = fake_scheduler(adapter, retries=2).get("http://mirror/Release")
+    assert resp.status_code == 503
+    assert adapter.calls == 3
+
+    adapter = FakeAdapter([requests.ConnectionError])
+    with pytest.raises(requests.ConnectionError):
+        fake_scheduler(adapter, retries=1).get("http://mirror/Release")
+    assert adapter.calls == 2
+
+
+def test_no_retry_for_client_errors():
+    adapter = FakeAdapter([404, 200])
+    assert fake_scheduler(adapter).get("http://mirror/Release").status_code == 404
+    assert adapter.calls == 1
+
+
+def test_adaptive_limit():
+    limit = AdaptiveLimit(initial=2, maximum=4)
+    for _ in range(20):
+        limit.acquire()
+        limit.release(0.01)
+    assert limit.limit == 4
+
+    limit.acquire()
+    limit.release(overloaded=True)
+    assert limit.limit == 2
+
+    for _ in range(10):
+        limit.acquire()
+        limit.release(1.0)
+    assert limit.limit == 1
+
+
+def test_overload_halves_concurrency():
+    adapter = FakeAdapter([429, 200])
+    scheduler = fake_scheduler(adapter, initial_concurrency=4)
+    scheduler.get("http://mirror/Release")
+    assert scheduler.limit("mirror").limit == 2
+    assert scheduler.limit("other").limit == 4
+
+
+def test_concurrency_limit():
+    adapter = FakeAdapter([200], delay=0.02)
+    scheduler = fake_scheduler(adapter, initial_concurrency=2, max_concurrency=2)
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(scheduler.get, [f"http://mirror/{i}" for i in range(16)]))
+    assert adapter.max_in_flight == 2
+
+
+def test_total_concurrency():
+    adapter = FakeAdapter([200], delay=0.02)
+    scheduler = fake_scheduler(
+        adapter, initial_concurrency=2, max_concurrency=2, total_concurrency=3
+    )
+    urls = [f"http://mirror{i % 3}/{i}" for i in range(24)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(scheduler.get, urls))
+    assert adapter.max_in_flight == 3
+
+
+def test_streamed_slots():
+    adapter = FakeAdapter([200])
+    scheduler = fake_scheduler(adapter, initial_concurrency=1, max_concurrency=1)
+    limit = scheduler.limit("mirror")
+
+    first = scheduler.get("http://mirror/0", stream=True)
+    assert limit.in_flight == 1
+    with ThreadPoolExecutor(1) as executor:
+        # the next request waits until the first body is read
+        second = executor.submit(scheduler.get, "http://mirror/1", stream=True)
+        time.sleep(0.05)
+        assert not second.done()
+        assert first.content == b"content"
+        second.result(5).close()
+    assert limit.in_flight == 0
+    first.close()
+    assert limit.in_flight == 0
+
+
+def test_streamed_total_concurrency():
+    scheduler = fake_scheduler(FakeAdapter([200]), total_concurrency=1)
+    share = scheduler._share
+    assert share is not None
+
+    first = scheduler.get("http://mirror0/Packages", stream=True)
+    with ThreadPoolExecutor(2) as executor:
+        others = [
+            executor.submit(scheduler.get, f"http://mirror{i}/Packages", stream=True)
+            for i in (1, 2)
+        ]
+        time.sleep(0.05)
+        assert share.in_flight == 1
+        assert not any(other.done() for other in others)
+        first.close()
+        for other in others:
+            assert other.result(5).content == b"content"
+    assert share.in_flight == 0
+
+
+def test_iter_file_slots():
+    scheduler = fake_scheduler(FakeAdapter([200]), max_concurrency=1)
+    limit = scheduler.limit("mirror")
+    set_scheduler(scheduler)
+    try:
+        chunks = _iter_file_abs("http://mirror/Packages", chunk_size=3)
+        assert next(chunks) == b"con"
+        # the download is throttled while it streams
+        assert limit.in_flight == 1
+        chunks.close()
+        assert limit.in_flight == 0
+        assert b"".join(_iter_file_abs("http://mirror/Packages")) == b"content"
+        assert limit.in_flight == 0
+    finally:
+        set_scheduler(None)
+
+
+def test_fair_share():
+    share = FairShare(1)
+    share.acquire("a")
+    granted: list[str] = []
+
+    def request(host: str):
+        share.acquire(host)
+        granted.append(host)
+        time.sleep(0.01)
+        share.release()
+
+    threads = [threading.Thread(target=request, args=(h,)) for h in "aaab"]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    share.release()
+    for thread in threads:
+        thread.join()
+    # b doesn't wait for all requests to a that were queued before it
+    assert granted == ["a", "b", "a", "a"]
+    assert share.in_flight == 0
+
+
+def test_bandwidth():
+    bandwidth = Bandwidth(rate=1000, burst=0)
+    start = time.monotonic()
+    bandwidth.consume(100)
+    bandwidth.wait()
+    assert time.monotonic() - start >= 0.09
+
+    adapter = FakeAdapter([200])
+    scheduler = fake_scheduler(adapter, bandwidth=70)
+    start = time.monotonic()
+    for i in range(12):
+        scheduler.get(f"http://mirror/{i}")
+    # the burst covers 10 responses of 7 bytes, the others wait
+    assert time.monotonic() - start >= 0.09
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_retry_after():
+    resp = requests.Response()
+    resp.headers["Retry-After"] = "2"
+    scheduler = FetchScheduler(max_backoff=1)
+    assert scheduler._delay(0, resp) == 1
+    scheduler = FetchScheduler(backoff=0)
+    assert scheduler._delay(0, resp) == 2
+
+
+def test_get_file_retries():
+    adapter = FakeAdapter([503, 200])
+    clear_response_cache()
+    set_scheduler(fake_scheduler(adapter))
+    try:
+        assert _get_file_abs("http://mirror/retry/Release") == b"content"
+        set_scheduler(fake_scheduler(FakeAdapter([503]), retries=1))
+        with pytest.raises(FileRequestError):
+            _get_file_abs("http://mirror/fail/Release")
+    finally:
+        set_scheduler(None)
+        clear_response_cache()
+    assert isinstance(get_scheduler(), FetchScheduler)
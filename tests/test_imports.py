@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import benchmark
+import pytest
+
+# only imported once they are needed
+LAZY_MODULES = {"pgpy", "cryptography", "bs4", "debian.deb822", "multiprocessing"}
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "debian_repo_scrape.scrape",
+        "debian_repo_scrape.verify",
+        "debian_repo_scrape.batch",
+        "debian_repo_scrape.contents",
+    ],
+)
+def test_lazy_imports(module: str):
+    result = benchmark.run_import_benchmark(module)
+    assert result.wall_time > 0
+    assert "requests" in result.modules
+    assert not LAZY_MODULES & set(result.modules)
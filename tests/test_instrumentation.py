@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import io
+
+import pytest
+
+from debian_repo_scrape.instrumentation import (
+    MetricsAggregator,
+    Observer,
+    PhaseEvent,
+    RequestEvent,
+    classify_url,
+    observe,
+    observed,
+    phase,
+)
+from debian_repo_scrape.scrape import scrape_repo
+from debian_repo_scrape.utils import clear_response_cache
+from debian_repo_scrape.verify import verify_repo_integrity
+
+
+@pytest.mark.parametrize(
+    ["url", "url_class"],
+    [
+        ("http://localhost/debian/dists", "listing"),
+        ("http://localhost/debian/dists/focal/", "listing"),
+        ("http://localhost/debian/dists/focal/InRelease", "release"),
+        ("http://localhost/debian/dists/focal/Release", "release"),
+        ("http://localhost/debian/dists/focal/Release.gpg", "signature"),
+        (
+            "http://localhost/debian/dists/focal/main/binary-i386/Packages.xz",
+            "packages",
+        ),
+        ("http://localhost/debian/dists/focal/main/source/Sources.gz", "sources"),
+        ("http://localhost/debian/dists/focal/main/Contents-amd64.gz", "contents"),
+        ("http://localhost/debian/dists/focal/main/by-hash/SHA256/abc", "by-hash"),
+        ("http://localhost/debian/pool/main/p/poem/poem_1.0_all.deb", "deb"),
+        ("http://localhost/debian/public_key.asc", "other"),
+    ],
+)
+def test_classify_url(url: str, url_class: str):
+    assert classify_url(url) == url_class
+
+
+def test_phase_without_observers():
+    assert not observed()
+    assert phase("a") is phase("b", suite="c")
+
+
+class Recorder(Observer):
+    def __init__(self) -> None:
+        self.requests: list[RequestEvent] = []
+        self.phases: list[PhaseEvent] = []
+
+    def on_request(self, event: RequestEvent):
+        self.requests.append(event)
+
+    def on_phase(self, event: PhaseEvent):
+        self.phases.append(event)
+
+
+def test_observe(synthetic_server, synthetic_repo):
+    clear_response_cache()
+    with observe(Recorder()) as recorder:
+        assert observed()
+        scrape_repo(synthetic_server.url, pub_key_file=b"", verify=False)
+    assert not observed()
+
+    assert {e.url_class for e in recorder.requests} >= {
+        "listing",
+        "release",
+        "packages",
+    }
+    assert any(e.cache_hit for e in recorder.requests)
+    assert all(e.latency >= 0 for e in recorder.requests)
+    assert all(e.status_code == 200 for e in recorder.requests if not e.cache_hit)
+    names = [e.name for e in recorder.phases]
+    assert names[-1] == "scrape"
+    assert {"discovery", "release", "packages", "parse"} <= set(names)
+    assert {
+        e.attributes["suite"] for e in recorder.phases if e.name == "packages"
+    } == set(synthetic_repo.config.suites)
+
+
+def test_metrics_aggregator(synthetic_server, synthetic_repo):
+    aggregator = MetricsAggregator()
+    with observe(aggregator):
+        verify_repo_integrity(
+            synthetic_server.url, str(synthetic_repo.root / "public_key.asc")
+        )
+
+    assert aggregator.requests["deb"].bytes > 0
+    assert aggregator.requests["signature"].status_codes == {
+        200: len(synthetic_repo.config.suites)
+    }
+    assert aggregator.phases["pgp"].runs == 2 * len(synthetic_repo.config.suites)
+    assert aggregator.phases["verify_hashes"].runs == 1
+    assert aggregator.phases["hashing"].duration > 0
+
+    summary = io.StringIO()
+    aggregator.print_summary(summary)
+    assert "deb" in summary.getvalue()
+    assert "verify_signatures" in summary.getvalue()
+
+    prometheus = aggregator.to_prometheus()
+    assert "# TYPE debian_repo_scrape_requests_total counter" in prometheus
+    assert 'debian_repo_scrape_phase_runs_total{phase="verify_hashes"} 1' in (
+        prometheus
+    )
+    assert 'debian_repo_scrape_responses_total{url_class="deb",status_code="200"}' in (
+        prometheus
+    )
+
+    aggregator.reset()
+    assert not aggregator.requests
+    assert not aggregator.phases
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import pickle
+
+import pytest
+from synthetic import generate_signing_key
+
+from debian_repo_scrape.exc import FileRequestError, SignatureInvalid
+from debian_repo_scrape.instrumentation import MetricsAggregator, observe
+from debian_repo_scrape.keyring import Keyring
+from debian_repo_scrape.verify import verify_release_signatures
+
+keyfile = "tests/public_key.gpg"
+
+
+def test_keyring_inputs(synthetic_repo):
+    with open(keyfile, "rb") as f:
+        blob = f.read()
+    with open(keyfile, "rb") as f:
+        keyrings = [
+            Keyring.from_key_input(keyfile),
+            Keyring.from_key_input(f),
+            Keyring.from_key_input(blob),
+        ]
+    assert len({k.keys[0].fingerprint for k in keyrings}) == 1
+    assert Keyring.from_key_input(keyrings[0]) is keyrings[0]
+
+    with pytest.raises(TypeError):
+        Keyring.from_key_input([])
+
+    synthetic_key = (synthetic_repo.root / "public_key.asc").read_bytes()
+    keyring = Keyring.from_key_input(keyfile, synthetic_key)
+    assert len(keyring) == 2
+    other_key = str(generate_signing_key(1024).pubkey).encode()
+    assert len(Keyring.from_key_input(synthetic_key + other_key)) == 2
+
+
+def test_keyring_verify(scratch_repo):
+    keyring = Keyring.from_key_input(str(scratch_repo.root / "public_key.asc"))
+    suite_path = scratch_repo.root / "dists" / "stable"
+    release = (suite_path / "Release").read_bytes()
+    signature = (suite_path / "Release.gpg").read_bytes()
+    in_release = (suite_path / "InRelease").read_bytes()
+
+    keyring.verify(release, signature)
+    keyring.verify(in_release)
+
+    with pytest.raises(SignatureInvalid):
+        keyring.verify(release + b"Tampered: yes\n", signature, "Release")
+    with pytest.raises(SignatureInvalid):
+        keyring.verify(in_release.replace(b"Origin: Synthetic", b"Origin: Evil"))
+    with pytest.raises(SignatureInvalid):
+        keyring.verify(release, b"no signature")
+
+    other = Keyring([generate_signing_key(1024).pubkey])
+    with pytest.raises(SignatureInvalid) as e:
+        other.verify(release, signature, "Release.gpg")
+    assert "no key" in str(e.value)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_verify_tampered_release(scratch_repo, scratch_server, workers: int):
+    keyring = Keyring.from_key_input(str(scratch_repo.root / "public_key.asc"))
+    verify_release_signatures(scratch_server.url, keyring, workers=workers)
+
+    release = scratch_repo.root / "dists" / "oldstable" / "Release"
+    release.write_bytes(release.read_bytes() + b"Tampered: yes\n")
+    with pytest.raises(SignatureInvalid) as e:
+        verify_release_signatures(scratch_server.url, keyring, workers=workers)
+    assert e.value.file.endswith("dists/oldstable/Release.gpg")
+
+
+def test_verify_in_release_only(scratch_repo, scratch_server):
+    key_file = str(scratch_repo.root / "public_key.asc")
+    with observe(MetricsAggregator()) as metrics:
+        verify_release_signatures(scratch_server.url, key_file, in_release_only=True)
+    assert metrics.requests["release"].requests == 3
+    assert "signature" not in metrics.requests
+
+    (scratch_repo.root / "dists" / "testing" / "InRelease").unlink()
+    with pytest.raises(FileRequestError):
+        verify_release_signatures(scratch_server.url, key_file)
+
+    with observe(MetricsAggregator()) as metrics:
+        verify_release_signatures(
+            scratch_server.url, key_file, workers=2, in_release_only=True
+        )
+    assert metrics.requests["signature"].requests == 1
+
+
+def test_keyring_verify_expired():
+    suite_path = "tests/repo/dists/mx/"
+    with open(f"{suite_path}Release", "rb") as f:
+        release = f.read()
+    with open(f"{suite_path}Release.gpg", "rb") as f:
+        signature = f.read()
+    with open(f"{suite_path}InRelease", "rb") as f:
+        in_release = f.read()
+
+    keyring = Keyring.from_key_input(keyfile)
+    keyring.verify(release, signature, "Release")
+    keyring.verify(in_release)
+
+    strict = Keyring.from_key_input(keyring, reject_expired=True)
+    assert Keyring.from_key_input(strict) is strict
+    assert pickle.loads(pickle.dumps(strict)).reject_expired
+    with pytest.raises(SignatureInvalid) as e:
+        strict.verify(release, signature, "Release")
+    assert e.value.reason == "Expired"
+    for keyring in (keyring, strict):
+        with pytest.raises(SignatureInvalid) as e:
+            keyring.verify(release + b"Evil: yes\n", signature, "Release")
+        assert e.value.reason == "WrongSig"
+        with pytest.raises(SignatureInvalid) as e:
+            keyring.verify(in_release.replace(b"Origin: ", b"Origin: Evil "))
+        assert e.value.reason == "WrongSig"
@@ -1,8 +1,22 @@
 from __future__ import annotations
 
 import pytest
+from synthetic import SyntheticRepoConfig, SyntheticRepoServer, generate_repo
 
-from debian_repo_scrape.navigation import BaseNavigator
+from debian_repo_scrape.navigation import (
+    ApacheBrowseNavigator,
+    BaseNavigator,
+    FileSystemNavigator,
+    ProbingNavigator,
+    get_navigator,
+)
+from debian_repo_scrape.scrape import scrape_repo
+from debian_repo_scrape.utils import (
+    clear_response_cache,
+    get_suites,
+    probe_suites,
+    response_cache_scope,
+)
 
 
 def test_navigation(navigator: BaseNavigator, repo_url: str):
@@ -77,3 +91,91 @@ def test_directions(navigator: BaseNavigator):
     navigator.base_url = "http://localhost:5000"
     navigator.reset()
     assert ".." not in navigator.directions
+
+
+def test_file_system_navigation(synthetic_repo):
+    root = synthetic_repo.root.resolve()
+    navigator = FileSystemNavigator(str(root))
+    assert navigator.base_url == f"{root.as_uri()}/"
+    assert {"dists", "pool", "public_key.asc"} <= navigator.directions
+    navigator["dists/stable"]
+    assert "Release" in navigator
+    navigator[".."]
+    assert "testing" in navigator
+    navigator.reset()
+    navigator["public_key.asc"]
+    assert navigator.content.startswith("-----BEGIN PGP PUBLIC KEY BLOCK-----")
+    assert not navigator.directions - {".."}
+    with pytest.raises(ValueError):
+        navigator["ehrguerzzuge"]
+
+
+def test_get_navigator(synthetic_repo, repo_url: str):
+    root = synthetic_repo.root.resolve()
+    assert isinstance(get_navigator(str(root)), FileSystemNavigator)
+    assert get_navigator(root.as_uri()).base_url == f"{root.as_uri()}/"
+    assert isinstance(get_navigator(repo_url), ApacheBrowseNavigator)
+    navigator = FileSystemNavigator(str(root))
+    assert get_navigator(navigator) is navigator
+
+
+def test_navigation_requests(synthetic_server, synthetic_repo, request_recorder):
+    with request_recorder, response_cache_scope():
+        navigator = get_navigator(synthetic_server.url)
+        navigator["dists/stable"]
+        navigator.reset()
+        navigator["dists/stable"]
+    # one listing per directory, navigating again is answered from the cache
+    base_url = synthetic_server.url.rstrip("/")
+    assert request_recorder.urls() == [
+        base_url,
+        f"{base_url}/dists",
+        f"{base_url}/dists/stable",
+    ]
+
+    with request_recorder:
+        navigator = get_navigator(str(synthetic_repo.root))
+        navigator["dists/stable/Release"]
+        assert request_recorder.events == []
+        assert navigator.content
+    assert len(request_recorder.events) == 1
+
+
+def test_probing_navigator(tmp_path, request_recorder):
+    config = SyntheticRepoConfig(
+        suites=["bookworm", "bookworm-updates", "stable/updates"]
+    )
+    repo = generate_repo(tmp_path / "repo", config)
+    with SyntheticRepoServer(repo.root, listings=False) as server:
+        assert get_suites(ApacheBrowseNavigator(server.url)) == []
+        assert probe_suites(
+            server.url, ["bookworm", "bullseye"], ["", "-backports"]
+        ) == ["bookworm"]
+
+        with request_recorder:
+            assert probe_suites(server.url) == [
+                "stable/updates",
+                "bookworm",
+                "bookworm-updates",
+            ]
+        # HEAD requests only
+        assert request_recorder.events
+        assert all(event.bytes == 0 for event in request_recorder.events)
+
+        clear_response_cache()
+        with request_recorder:
+            navigator = ProbingNavigator(server.url)
+            assert sorted(get_suites(navigator)) == sorted(navigator.suites)
+            repository = scrape_repo(navigator, b"", verify=False)
+        assert len(repository.packages) == 30
+        # probing only costs HEAD requests, every index is fetched once by scraping
+        fetched = [
+            event.url.rsplit("/dists/", 1)[-1]
+            for event in request_recorder.events
+            if event.method == "GET"
+        ]
+        assert sorted(fetched) == sorted(
+            f"{suite}/{name}"
+            for suite in config.suites
+            for name in ("Release", "main/binary-amd64/Packages")
+        )
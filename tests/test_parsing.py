@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import pickle
+from pathlib import Path
+
+import pytest
+from debian.deb822 import Packages, Release
+
+from debian_repo_scrape.parsing import (
+    PACKAGE_FIELDS,
+    PackagesParser,
+    Stanza,
+    _iter_packages,
+    _parse_native,
+    iter_stanzas,
+    parse_release,
+    source_files,
+    split_stanzas,
+)
+from debian_repo_scrape.scrape import scrape_repo
+from debian_repo_scrape.utils import get_packages_files
+
+PACKAGES = b"".join(
+    b"Package: pkg%d\nVersion: 1.0\nDescription: package %d\n long\n .\n text\n\n"
+    % (i, i)
+    for i in range(100)
+)
+
+
+REPO = Path(__file__).parent / "repo"
+
+
+def deb822_packages(content: bytes) -> list[dict[str, str]]:
+    return [
+        {key.lower(): value for key, value in packages.items()}
+        for packages in Packages.iter_paragraphs(
+            content.split(b"\n"), use_apt_pkg=False
+        )
+    ]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        PACKAGES,
+        b"Package: a\nDepends:  b,\n  c  \nSHA256:\n 00 1 x\n 11 2 y\n\n\n\nPackage: b\n",
+        b"Package:a\nEmpty:\n",
+        b"",
+    ],
+)
+def test_native_parser(content: bytes):
+    assert _parse_native(content) == deb822_packages(content)
+
+
+def test_native_parser_repo(synthetic_repo):
+    paths = [
+        *REPO.glob("dists/**/Packages"),
+        *synthetic_repo.root.glob("dists/**/Packages"),
+    ]
+    assert paths
+    for path in paths:
+        content = path.read_bytes()
+        assert _parse_native(content) == deb822_packages(content)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"Package: a\r\nVersion: 1\r\n",
+        b"# comment\nPackage: a\n",
+        b"Package: a\n \nPackage: b\n",
+        b"Package: a\nno field\n",
+        b"Package: \xff\n",
+    ],
+)
+def test_exotic_input_falls_back(content: bytes):
+    packages = list(_iter_packages(content))
+    assert packages and all(isinstance(p, Packages) for p in packages)
+
+
+def test_stanza():
+    stanza = _parse_native(b"Package: a\nPhased-Update-Percentage: 10\n")[0]
+    assert isinstance(stanza, Stanza)
+    assert stanza["Package"] == stanza["package"] == "a"
+    assert "PHASED-UPDATE-PERCENTAGE" in stanza
+    assert stanza.get("Phased-Update-Percentage") == "10"
+    assert stanza.get("Section") is None
+    assert pickle.loads(pickle.dumps(stanza)) == stanza
+
+
+def test_fields():
+    packages = list(_iter_packages(PACKAGES, PACKAGE_FIELDS))
+    assert packages[0] == {
+        "package": "pkg0",
+        "version": "1.0",
+        "description": "package 0\n long\n .\n text",
+    }
+    assert list(_iter_packages(PACKAGES, {"package"}))[1] == {"package": "pkg1"}
+    exotic = list(_iter_packages(b"Package: a\r\nVersion: 1\r\n", {"package"}))
+    assert [dict(p) for p in exotic] == [{"Package": "a"}]
+
+
+def test_parse_release():
+    for path in REPO.glob("dists/*/Release"):
+        content = path.read_bytes()
+        native, release = parse_release(content), Release(content.split(b"\n"))
+        assert isinstance(native, Stanza)
+        assert set(native) == {key.lower() for key in release}
+        for key in release:
+            assert native[key] == release[key]
+    assert isinstance(parse_release(b"Origin: a\r\n"), Release)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 50, 2**16])
+def test_iter_stanzas(chunk_size: int):
+    chunks = [
+        PACKAGES[i : i + chunk_size]  # noqa: E203
+        for i in range(0, len(PACKAGES), chunk_size)
+    ]
+    assert list(iter_stanzas(chunks)) == list(_iter_packages(PACKAGES))
+    assert list(iter_stanzas([b"Package: a", b"\n"])) == [{"package": "a"}]
+
+
+def test_source_files():
+    stanza = _parse_native(
+        b"Package: a\n"
+        b"Files:\n 00 10 a.dsc\n 11 20 a.tar.xz\n"
+        b"Checksums-Sha256:\n aa 10 a.dsc\n bb 20 a.tar.xz\n"
+    )[0]
+    assert source_files(stanza) == {
+        "a.dsc": {"size": "10", "md5sum": "00", "sha256": "aa"},
+        "a.tar.xz": {"size": "20", "md5sum": "11", "sha256": "bb"},
+    }
+    assert source_files(Stanza()) == {}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100, 1000, len(PACKAGES)])
+def test_split_stanzas(chunk_size: int):
+    chunks = split_stanzas(PACKAGES, chunk_size)
+    assert b"\n".join(chunks).rstrip(b"\n") == PACKAGES.rstrip(b"\n")
+    for chunk in chunks:
+        assert chunk.startswith(b"Package: ")
+        assert chunk.endswith(b"\n")
+    if chunk_size == 1:
+        assert len(chunks) == 100
+    assert split_stanzas(b"", chunk_size) == []
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_packages_parser(workers: int):
+    files = [PACKAGES, PACKAGES.replace(b"Version: ", b"Version: 1:")]
+    with PackagesParser(workers, chunk_size=512) as parser:
+        parsed = parser.parse(files)
+    assert len(parsed) == 2
+    for packages in parsed:
+        assert [p["package"] for p in packages] == [f"pkg{i}" for i in range(100)]
+        assert packages[0]["description"] == "package 0\n long\n .\n text"
+
+    with PackagesParser(workers, chunk_size=512, fields={"package"}) as parser:
+        assert parser.parse([PACKAGES])[0][1] == {"package": "pkg1"}
+
+
+def test_get_packages_files_parser(synthetic_server):
+    with PackagesParser(2, chunk_size=256) as parser:
+        assert get_packages_files(
+            synthetic_server.url, "stable", parser=parser
+        ) == get_packages_files(synthetic_server.url, "stable")
+
+
+def test_scrape_parse_workers(synthetic_server):
+    assert scrape_repo(
+        synthetic_server.url, b"", verify=False, parse_workers=2
+    ) == scrape_repo(synthetic_server.url, b"", verify=False)
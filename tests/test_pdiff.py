@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import shutil
+import subprocess
+
+import pytest
+from synthetic import SyntheticRepoConfig, SyntheticRepoServer, ed_diff, generate_repo
+
+from debian_repo_scrape.exc import SHA256Invalid
+from debian_repo_scrape.pdiff import (
+    IndexCache,
+    PDiffIndex,
+    PDiffUnavailable,
+    apply_ed_patch,
+    apply_pdiffs,
+    update_index,
+)
+from debian_repo_scrape.scrape import scrape_repo
+from debian_repo_scrape.utils import clear_response_cache
+
+OLD = b"".join(b"line %d\n" % i for i in range(20))
+NEW = b"inserted at the start\n" + OLD.replace(b"line 3\n", b"").replace(
+    b"line 7\n", b"changed 7\n.\n"
+).replace(b"line 19\n", b"line 19\nappended\n")
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.skipif(shutil.which("diff") is None, reason="diff is not installed")
+def test_apply_diff_ed_output(tmp_path):
+    (tmp_path / "old").write_bytes(OLD)
+    (tmp_path / "new").write_bytes(NEW)
+    patch = subprocess.run(
+        ["diff", "--ed", "old", "new"], cwd=tmp_path, stdout=subprocess.PIPE
+    ).stdout
+    assert b"s/.//" in patch
+    assert apply_ed_patch(OLD, patch) == NEW
+
+
+def test_apply_ed_patch():
+    assert apply_ed_patch(OLD, ed_diff(OLD, NEW)) == NEW
+    assert apply_ed_patch(NEW, ed_diff(NEW, OLD)) == OLD
+    assert apply_ed_patch(b"", b"0a\nfirst\n.\n") == b"first\n"
+    assert apply_ed_patch(b"a\nb\nc\n", b"1,2d\n") == b"c\n"
+    with pytest.raises(PDiffUnavailable):
+        apply_ed_patch(OLD, b"1,$d\n")
+
+
+def pdiff_index(versions: list[bytes], merged: bool = False) -> tuple[PDiffIndex, dict]:
+    if merged:
+        patches = {
+            f"T-{i}": ed_diff(old, versions[-1]) for i, old in enumerate(versions[:-1])
+        }
+    else:
+        patches = {
+            f"T-{i}": ed_diff(old, new)
+            for i, (old, new) in enumerate(zip(versions, versions[1:]))
+        }
+    downloads = {f"{name}.gz": gzip.compress(patch) for name, patch in patches.items()}
+    index = PDiffIndex(
+        hash_type="SHA256",
+        current=(sha256(versions[-1]), len(versions[-1])),
+        history=[
+            (sha256(version), len(version), f"T-{i}")
+            for i, version in enumerate(versions[:-1])
+        ],
+        patches={name: (sha256(patch), len(patch)) for name, patch in patches.items()},
+        downloads={
+            name: (sha256(download), len(download))
+            for name, download in downloads.items()
+        },
+        merged=merged,
+    )
+    return index, downloads
+
+
+@pytest.mark.parametrize("merged", [False, True])
+def test_apply_pdiffs(merged: bool):
+    versions = [OLD, NEW, NEW + b"newest\n"]
+    index, downloads = pdiff_index(versions, merged)
+    fetched: list[str] = []
+
+    def fetch_patch(name: str) -> bytes:
+        fetched.append(name)
+        return downloads[name]
+
+    assert apply_pdiffs(OLD, index, fetch_patch) == versions[-1]
+    assert fetched == (["T-0.gz"] if merged else ["T-0.gz", "T-1.gz"])
+    assert apply_pdiffs(versions[-1], index, fetch_patch) == versions[-1]
+    with pytest.raises(PDiffUnavailable):
+        apply_pdiffs(b"unknown\n", index, fetch_patch)
+
+    downloads["T-1.gz"] = gzip.compress(b"1d\n")
+    with pytest.raises(SHA256Invalid):
+        apply_pdiffs(NEW, index, fetch_patch)
+
+
+def test_parse_pdiff_index():
+    index = PDiffIndex.parse(
+        b"SHA1-Current: aa 10\n"
+        b"SHA1-History:\n 00 5 T-0\n 11 6 T-1\n"
+        b"SHA1-Patches:\n 22 1 T-0\n 33 1 T-1\n"
+        b"X-Patch-Precedence: merged\n"
+    )
+    assert index.hash_type == "SHA1"
+    assert index.current == ("aa", 10)
+    assert index.history == [("00", 5, "T-0"), ("11", 6, "T-1")]
+    assert index.patches == {"T-0": ("22", 1), "T-1": ("33", 1)}
+    assert index.merged
+    with pytest.raises(PDiffUnavailable):
+        PDiffIndex.parse(b"MD5Sum-Current: aa 10\n")
+
+
+@pytest.fixture()
+def pdiff_repo(tmp_path):
+    config = SyntheticRepoConfig(pdiff_history=2, packages_per_index=20)
+    repo = generate_repo(tmp_path / "repo", config)
+    with SyntheticRepoServer(repo.root) as server:
+        yield repo, server
+
+
+def index_files(recorder) -> list[str]:
+    return [url.rsplit("/", 1)[-1] for url in recorder.urls("binary-")]
+
+
+def test_update_index(pdiff_repo):
+    repo, server = pdiff_repo
+    path = "dists/stable/main/binary-amd64/Packages"
+    current = (repo.root / path).read_bytes()
+    url = f"{server.url.rstrip('/')}/{path}"
+    for version in repo.packages_history[path]:
+        assert update_index(url, version) == current
+    with pytest.raises(PDiffUnavailable):
+        update_index(url, b"Package: unknown\n")
+    with pytest.raises(PDiffUnavailable):
+        update_index(f"{server.url.rstrip('/')}/dists/missing/Packages", current)
+
+
+def test_scrape_with_index_cache(pdiff_repo, tmp_path, request_recorder):
+    repo, server = pdiff_repo
+    path = "dists/stable/main/binary-amd64/Packages"
+    url = f"{server.url.rstrip('/')}/{path}"
+    cache = IndexCache(tmp_path / "cache")
+    expected = scrape_repo(server.url, b"", verify=False)
+
+    cache.put(url, repo.packages_history[path][0])
+    clear_response_cache()
+    with request_recorder:
+        assert scrape_repo(server.url, b"", verify=False, index_cache=cache) == expected
+    assert index_files(request_recorder) == ["Index", "T-0.gz", "T-1.gz"]
+    assert cache.get(url) == (repo.root / path).read_bytes()
+
+    clear_response_cache()
+    with request_recorder:
+        assert scrape_repo(server.url, b"", verify=False, index_cache=cache) == expected
+    assert index_files(request_recorder) == []
+
+    cache.put(url, b"Package: unknown\n")
+    clear_response_cache()
+    with request_recorder:
+        assert scrape_repo(server.url, b"", verify=False, index_cache=cache) == expected
+    assert index_files(request_recorder) == ["Index", "Packages"]
+
+    # a corrupt patch chain falls back to the complete download
+    cache.put(url, repo.packages_history[path][0])
+    (repo.root / f"{path}.diff" / "T-0.gz").write_bytes(b"corrupt")
+    clear_response_cache()
+    with request_recorder:
+        assert scrape_repo(server.url, b"", verify=False, index_cache=cache) == expected
+    assert index_files(request_recorder) == ["Index", "T-0.gz", "Packages"]
+    assert cache.get(url) == (repo.root / path).read_bytes()
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from debian_repo_scrape.sampling import Sample, SampleHistory, clopper_pearson
+from debian_repo_scrape.verify import VerificationModes, verify_hash_sums
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{}, {"fraction": 0.1, "count": 1}, {"fraction": 0}, {"count": 0}],
+)
+def test_invalid_sample(kwargs):
+    with pytest.raises(ValueError):
+        Sample(**kwargs)
+    with pytest.raises(ValueError):
+        Sample(fraction=0.5, confidence=1)
+
+
+def test_sample_size():
+    assert Sample(fraction=0.1).size(25) == 3
+    assert Sample(count=10).size(4) == 4
+
+
+def test_clopper_pearson():
+    assert clopper_pearson(0, 0, 0.95) == (0, 1)
+    lower, upper = clopper_pearson(0, 100, 0.95)
+    assert lower == 0
+    assert upper == pytest.approx(1 - 0.025 ** (1 / 100))
+    lower, upper = clopper_pearson(10, 10, 0.95)
+    assert upper == 1
+    assert lower == pytest.approx(0.025 ** (1 / 10))
+    lower, upper = clopper_pearson(5, 100, 0.95)
+    assert 0 < lower < 0.05 < upper < 1
+
+
+def test_sampled_verification(synthetic_server, synthetic_repo):
+    sample = Sample(count=1, seed=42)
+    report = verify_hash_sums(synthetic_server.url, sample=sample)
+    assert report.sampling is not None
+    assert report.sampling.population == len(synthetic_repo.debs) + len(
+        synthetic_repo.source_files
+    )
+    assert 0 < report.sampling.sampled < report.sampling.population
+    assert report.sampling.failures == 0
+    assert report.sampling.lower == 0
+    assert 0 < report.sampling.upper < 1
+    listed = [url for url in report.hashed if "/pool/" in url]
+    assert len(listed) == report.sampling.sampled
+
+    assert verify_hash_sums(synthetic_server.url, sample=sample) == report
+    assert verify_hash_sums(synthetic_server.url).sampling is None
+
+
+def test_sampling_history(scratch_server, tmp_path):
+    history = str(tmp_path / "history.json")
+    sample = Sample(count=1, history=history)
+    first = verify_hash_sums(scratch_server.url, sample=sample)
+    assert first.sampling.sampled == 3
+    assert len(SampleHistory.load(history).verified) == first.sampling.sampled
+
+    second = verify_hash_sums(scratch_server.url, sample=sample)
+    first_debs = {url for url in first.hashed if url.endswith(".deb")}
+    second_debs = {url for url in second.hashed if url.endswith(".deb")}
+    assert second_debs and not first_debs & second_debs
+
+
+def test_sampling_failures(scratch_server, scratch_repo):
+    os.remove(scratch_repo.debs[0])
+    report = verify_hash_sums(
+        scratch_server.url, VerificationModes.IGNORE_MISSING, sample=Sample(fraction=1)
+    )
+    assert report.sampling.sampled == report.sampling.population
+    assert report.sampling.failures == 1
+    assert 0 < report.sampling.lower < report.sampling.upper
+    assert report.sampling.max_corrupt >= 1
@@ -1,10 +1,15 @@
 import os
+import re
+import shutil
 
 import pytest
 import requests
+from synthetic import SyntheticRepoConfig, SyntheticRepoServer, generate_repo
 
+from debian_repo_scrape.exc import SHA256Invalid, SignatureInvalid
 from debian_repo_scrape.scrape import scrape_flat_repo, scrape_repo
-from debian_repo_scrape.verify import VerificationModes
+from debian_repo_scrape.utils import clear_response_cache
+from debian_repo_scrape.verify import VerificationModes, verify_repo_integrity
 
 
 def test_server_active(repo_url: str):
@@ -31,6 +36,179 @@ def test_scrape_flat_test_repo(flat_navigator):
     assert len(repo.packages) == 3
 
 
+def test_scrape_flat_empty_packages(tmp_path, caplog):
+    shutil.copytree("tests/repo_flat", tmp_path / "repo_flat")
+    (tmp_path / "repo_flat" / "wheezy" / "Packages").write_bytes(b"")
+    repo = scrape_flat_repo(str(tmp_path / "repo_flat"), b"", verify=False)
+    assert sorted(suite.name for suite in repo.suites) == ["", "bullseye/stable"]
+    assert "The Packages file of wheezy is empty" in caplog.text
+
+
+def test_scrape_synthetic_repo(synthetic_server, synthetic_repo):
+    key_file = str(synthetic_repo.root / "public_key.asc")
+    verify_repo_integrity(synthetic_server.url, key_file)
+    repo = scrape_repo(synthetic_server.url, pub_key_file=key_file)
+    assert sorted(s.name for s in repo.suites) == ["stable", "testing/updates"]
+    config = synthetic_repo.config
+    assert (
+        len(repo.packages)
+        == len(config.suites)
+        * len(config.components)
+        * len(config.architectures)
+        * config.packages_per_index
+    )
+
+
+def test_scrape_sources(synthetic_server, synthetic_repo):
+    repo = scrape_repo(synthetic_server.url, b"", verify=False, sources=True)
+    config = synthetic_repo.config
+    assert len(repo.sources) == (
+        len(config.suites) * len(config.components) * config.packages_per_index
+    )
+    source = repo.suites[0].components[0].sources[0]
+    assert source.name == "pkg0"
+    assert source.binaries == ["pkg0", "pkg0-doc"]
+    assert source.format == "3.0 (quilt)"
+    assert [file.name for file in source.files] == [
+        "pkg0_1.0.dsc",
+        "pkg0_1.0.orig.tar.gz",
+    ]
+    file = source.files[0]
+    assert file.url == f"{source.url}/pkg0_1.0.dsc"
+    assert file.md5 and file.sha1 and file.sha256
+    assert len(requests.get(file.url).content) == file.size
+
+    assert not scrape_repo(synthetic_server.url, b"", verify=False).sources
+
+
+def test_scrape_sources_invalid(tmp_path, signing_key):
+    config = SyntheticRepoConfig(sources=True, compressions=[""])
+    repo = generate_repo(tmp_path / "repo", config, signing_key)
+    sources = repo.root / "dists" / "stable" / "main" / "source" / "Sources"
+    content = sources.read_bytes()
+    with SyntheticRepoServer(repo.root) as server:
+        assert scrape_repo(server.url, b"", verify=False, sources=True).sources
+
+        sources.write_bytes(content.replace(b"Package: pkg0", b"Package: pkgX"))
+        with pytest.raises(SHA256Invalid):
+            scrape_repo(server.url, b"", verify=False, sources=True)
+
+        sources.write_bytes(content[: content.rindex(b"\n\nPackage: ")])
+        with pytest.raises(SHA256Invalid):
+            scrape_repo(server.url, b"", verify=False, sources=True)
+
+
+def test_scrape_in_release_first(scratch_server, scratch_repo, request_recorder):
+    key_file = str(scratch_repo.root / "public_key.asc")
+    with request_recorder:
+        repo = scrape_repo(scratch_server.url, key_file, in_release_first=True)
+    assert repo == scrape_repo(scratch_server.url, key_file)
+
+    base_url = scratch_server.url.rstrip("/")
+    release_urls = request_recorder.urls(
+        rf"^{base_url}/dists/[^/]+/(In)?Release(\.gpg)?$"
+    )
+    assert sorted(release_urls) == sorted(
+        f"{base_url}/dists/{suite}/InRelease" for suite in scratch_repo.config.suites
+    )
+
+
+def test_scrape_in_release_first_fallback(
+    scratch_server, scratch_repo, request_recorder
+):
+    os.remove(scratch_repo.root / "dists" / "oldstable" / "InRelease")
+    key_file = str(scratch_repo.root / "public_key.asc")
+    with request_recorder:
+        repo = scrape_repo(scratch_server.url, key_file, in_release_first=True)
+    assert len(repo.suites) == 3
+    base_url = scratch_server.url.rstrip("/")
+    assert f"{base_url}/dists/oldstable/Release.gpg" in request_recorder.urls()
+    assert f"{base_url}/dists/stable/Release.gpg" not in request_recorder.urls()
+
+
+def test_scrape_in_release_first_tampered(scratch_server, scratch_repo):
+    in_release = scratch_repo.root / "dists" / "stable" / "InRelease"
+    in_release.write_bytes(in_release.read_bytes().replace(b"Suite: ", b"Suite: x"))
+    key_file = str(scratch_repo.root / "public_key.asc")
+    with pytest.raises(SignatureInvalid):
+        scrape_repo(scratch_server.url, key_file, in_release_first=True)
+
+
+def test_scrape_local_mirror(synthetic_server, synthetic_repo):
+    key_file = str(synthetic_repo.root / "public_key.asc")
+    local_repo = scrape_repo(str(synthetic_repo.root), key_file, workers=2)
+    remote_repo = scrape_repo(synthetic_server.url, key_file, verify=False)
+    assert local_repo.url == f"{synthetic_repo.root.resolve().as_uri()}/"
+    assert sorted(
+        package.url.replace(local_repo.url, "") for package in local_repo.packages
+    ) == sorted(
+        package.url.replace(remote_repo.url, "") for package in remote_repo.packages
+    )
+
+
+def test_scrape_fields(synthetic_server, flat_navigator):
+    full = scrape_repo(synthetic_server.url, b"", verify=False)
+    repo = scrape_repo(synthetic_server.url, b"", verify=False, fields=["sha256"])
+    assert [
+        (p.name, p.version, p.architecture, p.date, p.sha256) for p in repo.packages
+    ] == [(p.name, p.version, p.architecture, p.date, p.sha256) for p in full.packages]
+    for package in repo.packages:
+        assert package.url is package.size is package.description is None
+        assert package.md5 is package.maintainer is None
+
+    flat = scrape_flat_repo(flat_navigator, b"", verify=False, fields=["url", "size"])
+    assert all(p.url and p.size and p.sha256 is None for p in flat.packages)
+    assert [p.url for p in flat.packages] == [
+        p.url for p in scrape_flat_repo(flat_navigator, b"", verify=False).packages
+    ]
+    with pytest.raises(ValueError):
+        scrape_repo(synthetic_server.url, b"", verify=False, fields=["filename"])
+
+
+INDEXES_RE = r"/(Packages|Sources)[^/]*$"
+
+
+def test_scrape_filtered(synthetic_server, synthetic_repo, request_recorder):
+    clear_response_cache()
+    with request_recorder:
+        full = scrape_repo(synthetic_server.url, b"", verify=False, sources=True)
+    full_bytes = sum(event.bytes for event in request_recorder.select(INDEXES_RE))
+
+    clear_response_cache()
+    with request_recorder:
+        repo = scrape_repo(
+            synthetic_server.url,
+            b"",
+            verify=False,
+            sources=True,
+            suites=["stable"],
+            components=["main"],
+            architectures=["arm64"],
+        )
+    urls = request_recorder.urls(INDEXES_RE)
+    assert urls
+    assert not [url for url in urls if re.search("testing|contrib|amd64", url)]
+    assert sum(event.bytes for event in request_recorder.select(INDEXES_RE)) < (
+        full_bytes / 4
+    )
+
+    assert [suite.name for suite in repo.suites] == ["stable"]
+    assert [component.name for component in repo.suites[0].components] == ["main"]
+    assert repo.packages
+    assert {package.architecture for package in repo.packages} <= {"arm64", "all"}
+    # arch all packages are listed in the indexes of all architectures
+    assert {package.url for package in repo.packages} == {
+        package.url
+        for suite in full.suites
+        if suite.name == "stable"
+        for component in suite.components
+        if component.name == "main"
+        for package in component.packages
+        if package.architecture in ("arm64", "all")
+    }
+    assert repo.sources == full.suites[0].components[0].sources
+
+
 skip_long = not os.getenv("PYTEST_LONGTESTS", "")
 
 
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import pytest
+from synthetic import generate_signing_key
+
+from debian_repo_scrape.exc import SignatureInvalid
+from debian_repo_scrape.keyring import Keyring
+from debian_repo_scrape.signatures import (
+    GPGVBackend,
+    PGPyBackend,
+    SignedFile,
+    get_backend,
+    set_default_backend,
+)
+from debian_repo_scrape.verify import verify_release_signatures
+
+backends = [
+    "pgpy",
+    pytest.param(
+        "gpgv",
+        marks=pytest.mark.skipif(not shutil.which("gpgv"), reason="gpgv missing"),
+    ),
+]
+
+
+def test_get_backend():
+    assert get_backend("pgpy") is PGPyBackend
+    assert get_backend("gpgv") is GPGVBackend
+    assert get_backend(GPGVBackend) is GPGVBackend
+    assert get_backend() is PGPyBackend
+    with pytest.raises(ValueError):
+        get_backend("gpg2")
+
+    set_default_backend("gpgv")
+    try:
+        assert get_backend() is GPGVBackend
+    finally:
+        set_default_backend(PGPyBackend)
+
+
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("workers", [1, 2])
+def test_backend_verify(scratch_repo, backend: str, workers: int):
+    keyring = Keyring.from_key_input(str(scratch_repo.root / "public_key.asc"))
+    suite_path = scratch_repo.root / "dists" / "stable"
+    release = (suite_path / "Release").read_bytes()
+    signature = (suite_path / "Release.gpg").read_bytes()
+    in_release = (suite_path / "InRelease").read_bytes()
+
+    with get_backend(backend)(keyring, workers) as signature_backend:
+        good = signature_backend.submit(
+            [("Release.gpg", release, signature), ("InRelease", in_release, None)]
+        )
+        bad = signature_backend.submit(
+            [
+                ("Release.gpg", release + b"Tampered: yes\n", signature),
+                ("InRelease", in_release.replace(b"Synthetic", b"Evil"), None),
+            ]
+        )
+        garbage = signature_backend.submit([("Release.gpg", release, b"garbage")])
+        assert good.result() == []
+        assert [(file, reason) for file, reason in bad.result()] == [
+            ("Release.gpg", "WrongSig"),
+            ("InRelease", "WrongSig"),
+        ]
+        assert [file for file, _ in garbage.result()] == ["Release.gpg"]
+
+    other = Keyring([generate_signing_key(1024).pubkey])
+    with get_backend(backend)(other, workers) as signature_backend:
+        (error,) = signature_backend.submit(
+            [("Release.gpg", release, signature)]
+        ).result()
+        assert error[1].startswith("no key for signer")
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_verify_with_backend(
+    navigator, scratch_repo, scratch_server, backend: str, caplog
+):
+    verify_release_signatures(navigator, "tests/public_key.gpg", backend=backend)
+    assert any("expired key" in r.message for r in caplog.records)
+    strict = Keyring.from_key_input("tests/public_key.gpg", reject_expired=True)
+    with pytest.raises(SignatureInvalid) as e:
+        verify_release_signatures(navigator, strict, backend=backend)
+    assert e.value.reason == "Expired"
+
+    key_file = str(scratch_repo.root / "public_key.asc")
+    verify_release_signatures(scratch_server.url, key_file, workers=2, backend=backend)
+    release = scratch_repo.root / "dists" / "testing" / "Release"
+    release.write_bytes(release.read_bytes() + b"Tampered: yes\n")
+    with pytest.raises(SignatureInvalid) as e:
+        verify_release_signatures(scratch_server.url, key_file, backend=backend)
+    assert e.value.file.endswith("dists/testing/Release.gpg")
+    assert e.value.reason == "WrongSig"
+
+
+def tampered(signed_files: list[SignedFile]) -> list[SignedFile]:
+    return [
+        (file, data.replace(b"Origin: ", b"Origin: Evil "), signature)
+        for file, data, signature in signed_files
+    ]
+
+
+@pytest.mark.skipif(not shutil.which("gpgv"), reason="gpgv missing")
+@pytest.mark.parametrize(
+    ["suite", "keyring", "expected"],
+    [
+        ("stable", "fresh", []),
+        ("mx", "expired", []),
+        ("mx", "reject_expired", ["Expired", "Expired"]),
+    ],
+)
+@pytest.mark.parametrize("tamper", [False, True])
+def test_backend_parity(
+    scratch_repo,
+    suite: str,
+    keyring: str,
+    expected: list[str],
+    tamper: bool,
+):
+    if suite == "mx":
+        suite_path = Path("tests/repo/dists/mx")
+    else:
+        suite_path = scratch_repo.root / "dists" / suite
+    release = (suite_path / "Release").read_bytes()
+    signed_files: list[SignedFile] = [
+        ("Release.gpg", release, (suite_path / "Release.gpg").read_bytes()),
+        ("InRelease", (suite_path / "InRelease").read_bytes(), None),
+    ]
+    if tamper:
+        signed_files = tampered(signed_files)
+        expected = ["WrongSig", "WrongSig"]
+    keyrings = {
+        "fresh": Keyring.from_key_input(str(scratch_repo.root / "public_key.asc")),
+        "expired": Keyring.from_key_input("tests/public_key.gpg"),
+        "reject_expired": Keyring.from_key_input(
+            "tests/public_key.gpg", reject_expired=True
+        ),
+    }
+
+    results = []
+    for backend in (PGPyBackend, GPGVBackend):
+        with backend(keyrings[keyring]) as signature_backend:
+            results.append(signature_backend.verify(signed_files))
+    assert results[0] == results[1]
+    assert [reason for _, reason in results[0]] == expected
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import io
+import json
+
+from debian_repo_scrape.instrumentation import observe
+from debian_repo_scrape.scrape import scrape_repo
+from debian_repo_scrape.tracing import Tracer
+from debian_repo_scrape.verify import (
+    ByHashModes,
+    verify_hash_sums,
+    verify_repo_integrity,
+)
+
+
+def test_verification_spans(synthetic_server, synthetic_repo):
+    with observe(Tracer()) as tracer:
+        verify_repo_integrity(
+            synthetic_server.url, str(synthetic_repo.root / "public_key.asc")
+        )
+
+    spans = {span.id: span for span in tracer.spans}
+    roots = [span for span in tracer.spans if span.parent_id is None]
+    assert [span.name for span in roots] == [
+        "GET listing",
+        "verify_signatures",
+        "verify_hashes",
+    ]
+
+    suite_spans = tracer.children(roots[2])
+    assert "discovery" in [span.name for span in suite_spans]
+    assert {
+        span.attributes["suite"]
+        for span in suite_spans
+        if span.name == "verify_suite_hashes"
+    } == set(synthetic_repo.config.suites)
+
+    file_spans = [span for span in tracer.spans if span.name == "verify_file"]
+    assert file_spans
+    for span in file_spans:
+        assert spans[span.parent_id].name in (
+            "verify_suite_hashes",
+            "verify_listed_files",
+        )
+        assert span.attributes["url"].startswith(synthetic_server.url)
+        assert span.attributes["bytes"] >= 0
+        assert span.start >= spans[span.parent_id].start
+
+    assert any(
+        child.name == "pgp"
+        for span in tracer.spans
+        if span.name == "verify_suite_signatures"
+        for child in tracer.children(span)
+    )
+
+
+def test_chrome_trace(synthetic_server):
+    with observe(Tracer()) as tracer:
+        scrape_repo(synthetic_server.url, pub_key_file=b"", verify=False)
+
+    file = io.StringIO()
+    tracer.write_chrome_trace(file)
+    trace = json.loads(file.getvalue())
+    events = trace["traceEvents"]
+    assert len(events) == len(tracer.spans)
+    assert {event["ph"] for event in events} == {"X"}
+    assert {event["cat"] for event in events} == {"phase", "request"}
+    names = {event["name"] for event in events}
+    assert {"scrape", "navigate", "packages", "packages_file", "GET packages"} <= names
+    packages_file = next(e for e in events if e["name"] == "packages_file")
+    assert {"suite", "component", "url", "bytes"} <= set(packages_file["args"])
+    assert all(event["dur"] >= 0 for event in events)
+
+
+def test_head_request_spans(synthetic_server):
+    with observe(Tracer()) as tracer:
+        verify_hash_sums(synthetic_server.url, by_hash=ByHashModes.HEAD)
+
+    head_spans = [span for span in tracer.spans if span.name.startswith("HEAD ")]
+    assert {span.name for span in head_spans} == {"HEAD by-hash"}
+    assert all(span.category == "request" for span in head_spans)
+    assert all(span.attributes["bytes"] == 0 for span in head_spans)
+    assert "GET by-hash" not in {span.name for span in tracer.spans}
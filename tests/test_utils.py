@@ -1,4 +1,15 @@
-from debian_repo_scrape.utils import _get_file, get_packages_files, get_suites
+import hashlib
+
+import pytest
+
+from debian_repo_scrape.exc import FileRequestError, SignatureInvalid
+from debian_repo_scrape.utils import (
+    _extract_signed_text,
+    _get_file,
+    _hash_file_abs,
+    get_packages_files,
+    get_suites,
+)
 
 
 def test_get_suites(navigator):
@@ -17,3 +28,41 @@ def test_get_file(repo_url):
     assert _get_file(repo_url.strip("/"), "public_key.asc") == _get_file(
         repo_url, "public_key.asc"
     )
+
+
+def test_extract_signed_text():
+    message = (
+        b"-----BEGIN PGP SIGNED MESSAGE-----\n"
+        b"Hash: SHA512\n"
+        b"\n"
+        b"Origin: test\n"
+        b"- -Description: dash escaped\n"
+        b"-----BEGIN PGP SIGNATURE-----\n"
+        b"\n"
+        b"abc\n"
+        b"-----END PGP SIGNATURE-----\n"
+    )
+    assert (
+        _extract_signed_text(message) == b"Origin: test\n-Description: dash escaped\n"
+    )
+    with pytest.raises(SignatureInvalid):
+        _extract_signed_text(b"Origin: test\n", "InRelease")
+
+
+def test_hash_local_file(tmp_path):
+    empty = tmp_path / "empty"
+    empty.write_bytes(b"")
+    assert _hash_file_abs(empty.as_uri(), ["sha256"]) == (
+        0,
+        [hashlib.sha256().hexdigest()],
+    )
+    file = tmp_path / "file"
+    file.write_bytes(b"content")
+    assert _hash_file_abs(file.as_uri(), ["md5", "sha1"]) == (
+        7,
+        [hashlib.md5(b"content").hexdigest(), hashlib.sha1(b"content").hexdigest()],
+    )
+    with pytest.raises(FileRequestError):
+        _hash_file_abs((tmp_path / "missing").as_uri(), ["md5"])
+    with pytest.raises(FileRequestError):
+        _get_file(tmp_path.as_uri(), "missing")
@@ -2,10 +2,19 @@ from __future__ import annotations
 
 import os
 
+import benchmark
 import pytest
 from pytest_lazyfixture import lazy_fixture
-
-from debian_repo_scrape.exc import FileRequestError, HashInvalid
+from synthetic import SyntheticRepoConfig, SyntheticRepoServer, generate_repo
+
+from debian_repo_scrape.exc import (
+    FileRequestError,
+    HashInvalid,
+    SHA256Invalid,
+    SignatureInvalid,
+    SizeInvalid,
+)
+from debian_repo_scrape.keyring import Keyring
 from debian_repo_scrape.navigation import (
     ApacheBrowseNavigator,
     BaseNavigator,
@@ -17,6 +26,7 @@ from debian_repo_scrape.verify import (
     RAISE_EXCEPTION,
     RAISE_EXCEPTION_IMPORTANT_FILE,
     VERIFY_IMPORTANT_ONLY,
+    ByHashModes,
     VerificationModes,
     verify_hash_sums,
     verify_release_signatures,
@@ -101,7 +111,7 @@ def test_hash_any_file(
 ):
     if (
         file not in IMPORTANT_FILES + IMPORTANT_FILES_FLAT
-        and mode == VerificationModes.VERIFY_IMPORTANT_ONLY
+        and mode in VERIFY_IMPORTANT_ONLY
     ):
         with RemoveFile(file):
             verify_hash_sums(test_navigator, mode, flat_repo=flat)
@@ -177,7 +187,7 @@ def test_hash_any_file_ignore_missing(
 def test_hash_important_file(
     test_navigator: BaseNavigator, file: str, mode: VerificationModes, flat: bool
 ):
-    if mode == VerificationModes.VERIFY_IMPORTANT_ONLY_IGNORE_MISSING:
+    if mode in IGNORE_MISSING and mode in VERIFY_IMPORTANT_ONLY:
         with RemoveFile(file):
             verify_hash_sums(test_navigator, mode, flat_repo=flat)
 
@@ -284,6 +294,13 @@ def test_verify_signatures(test_navigator: BaseNavigator, path: str, flat: bool)
     with open(keyfile, "rb") as f:
         verify_release_signatures(test_navigator, f.read(), flat)
 
+    # the key of the test repositories has expired
+    with pytest.raises(SignatureInvalid) as e:
+        verify_release_signatures(
+            test_navigator, Keyring.from_key_input(keyfile, reject_expired=True), flat
+        )
+    assert e.value.reason == "Expired"
+
     with pytest.raises(TypeError):
         verify_release_signatures(test_navigator, [], flat)
 
@@ -313,3 +330,188 @@ def test_verify_signatures(test_navigator: BaseNavigator, path: str, flat: bool)
 )
 def test_verify_both(test_navigator: BaseNavigator, flat: bool):
     verify_repo_integrity(test_navigator, keyfile, flat_repo=flat)
+
+
+@pytest.fixture()
+def by_hash_repo(tmp_path, signing_key):
+    config = SyntheticRepoConfig(suites=["stable"], by_hash=True)
+    repo = generate_repo(tmp_path / "repo", config, signing_key)
+    with SyntheticRepoServer(repo.root) as server:
+        yield repo, server
+
+
+@pytest.mark.parametrize("by_hash", [ByHashModes.HASH, ByHashModes.HEAD.value])
+def test_hash_sums_by_hash(by_hash_repo, request_recorder, by_hash):
+    repo, server = by_hash_repo
+    with request_recorder:
+        verify_hash_sums(server.url, by_hash=by_hash)
+    urls = request_recorder.urls(url_class="by-hash")
+    assert urls
+    assert all("/by-hash/SHA256/" in url for url in urls)
+    assert len(set(urls)) == len(urls)
+
+    with pytest.raises(ValueError):
+        verify_hash_sums(server.url, by_hash="dawd34")
+
+
+def test_hash_sums_by_hash_invalid(by_hash_repo):
+    repo, server = by_hash_repo
+    by_hash_file = next((repo.root / "dists").glob("**/by-hash/SHA256/*"))
+    content = by_hash_file.read_bytes()
+
+    by_hash_file.write_bytes(bytes(len(content)))
+    with pytest.raises(SHA256Invalid):
+        verify_hash_sums(server.url)
+    verify_hash_sums(server.url, by_hash=ByHashModes.HEAD)
+
+    by_hash_file.write_bytes(content[:-1])
+    with pytest.raises(SizeInvalid):
+        verify_hash_sums(server.url, by_hash=ByHashModes.HEAD)
+
+
+def test_hash_sums_by_hash_without_hashes(tmp_path):
+    suite_path = tmp_path / "dists" / "stable"
+    suite_path.mkdir(parents=True)
+    (suite_path / "Release").write_text(
+        "Suite: stable\n"
+        "Date: Mon, 19 Oct 2026 00:00:00 UTC\n"
+        "Architectures: amd64\n"
+        "Components: main\n"
+        "Acquire-By-Hash: yes\n"
+    )
+    # like without Acquire-By-Hash, the missing hash sums are reported
+    with pytest.raises(KeyError):
+        verify_hash_sums(str(tmp_path))
+
+
+def test_hash_sums_size_only_report(synthetic_server, synthetic_repo, request_recorder):
+    debs, source_files = (
+        {
+            f"{synthetic_server.url.rstrip('/')}/{path.relative_to(synthetic_repo.root)}"
+            for path in paths
+        }
+        for paths in (synthetic_repo.debs, synthetic_repo.source_files)
+    )
+    report = verify_hash_sums(synthetic_server.url)
+    assert debs | source_files <= set(report.hashed)
+    assert not report.size_only
+
+    with request_recorder:
+        report = verify_hash_sums(synthetic_server.url, VerificationModes.SIZE_ONLY)
+    assert set(report.size_only) == debs | source_files
+    assert not debs & set(report.hashed)
+    assert not report.existence_only
+    deb_requests = request_recorder.select(url_class="deb")
+    assert sum(event.bytes for event in deb_requests) == 0
+    assert len(deb_requests) == len(debs)
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_verify_local_mirror(scratch_repo, workers: int):
+    key_file = str(scratch_repo.root / "public_key.asc")
+    report = verify_repo_integrity(str(scratch_repo.root), key_file, workers=workers)
+    assert len([url for url in report.hashed if url.endswith(".deb")]) == len(
+        scratch_repo.debs
+    )
+
+    deb = scratch_repo.debs[0]
+    content = deb.read_bytes()
+    deb.write_bytes(bytes(len(content)))
+    with pytest.raises(HashInvalid):
+        verify_hash_sums(scratch_repo.root.as_uri(), workers=workers)
+    os.remove(deb)
+    with pytest.raises(FileRequestError):
+        verify_hash_sums(scratch_repo.root.as_uri(), workers=workers)
+    verify_hash_sums(
+        scratch_repo.root.as_uri(), VerificationModes.IGNORE_MISSING, workers=workers
+    )
+
+
+def test_verify_source_files(tmp_path):
+    repo = generate_repo(tmp_path / "repo", SyntheticRepoConfig(sources=True))
+    with SyntheticRepoServer(repo.root) as server:
+        report = verify_hash_sums(server.url)
+        assert {
+            f"{server.url.rstrip('/')}/{path.relative_to(repo.root)}"
+            for path in repo.source_files
+        } <= set(report.hashed)
+
+        source_file = repo.source_files[1]
+        source_file.write_bytes(bytes(source_file.stat().st_size))
+        with pytest.raises(HashInvalid):
+            verify_hash_sums(server.url)
+        verify_hash_sums(server.url, VerificationModes.SIZE_ONLY)
+        verify_hash_sums(server.url, VerificationModes.VERIFY_IMPORTANT_ONLY)
+
+        source_file.unlink()
+        with pytest.raises(FileRequestError):
+            verify_hash_sums(server.url, VerificationModes.SIZE_ONLY)
+
+
+def test_listed_files_verified_once(synthetic_server, synthetic_repo, request_recorder):
+    with request_recorder:
+        verify_hash_sums(synthetic_server.url)
+    urls = request_recorder.urls("/pool/")
+    assert len(urls) == len(set(urls))
+    assert len(urls) == len(synthetic_repo.debs) + len(synthetic_repo.source_files)
+
+
+def test_hash_sums_filtered(synthetic_server, synthetic_repo, request_recorder):
+    base_url = synthetic_server.url.rstrip("/")
+    with request_recorder:
+        report = verify_hash_sums(
+            synthetic_server.url, suites=["stable"], architectures=["amd64"]
+        )
+    debs = set(request_recorder.urls(r"/pool/.*\.deb$"))
+    assert debs
+    assert {url.rsplit("_", 1)[1] for url in debs} == {"amd64.deb", "all.deb"}
+    assert not [url for url in report.hashed if "/dists/testing/" in url]
+    assert not [url for url in report.hashed if "binary-arm64" in url]
+    assert f"{base_url}/dists/stable/contrib/binary-amd64/Packages" in report.hashed
+
+    deb = next(deb for deb in synthetic_repo.debs if deb.name.endswith("_arm64.deb"))
+    content = deb.read_bytes()
+    deb.write_bytes(bytes(len(content)))
+    try:
+        clear_response_cache()
+        verify_hash_sums(synthetic_server.url, architectures=["amd64"])
+        with pytest.raises(HashInvalid):
+            verify_hash_sums(synthetic_server.url, architectures=["arm64"])
+    finally:
+        deb.write_bytes(content)
+        clear_response_cache()
+
+
+def test_mismatch_lists_every_index(tmp_path):
+    config = SyntheticRepoConfig(
+        suites=["stable", "testing"],
+        architectures=["amd64", "arm64"],
+        arch_all_fraction=0.5,
+    )
+    repo = generate_repo(tmp_path / "repo", config)
+    deb = next(deb for deb in repo.debs if deb.name.endswith("_all.deb"))
+    deb.write_bytes(bytes(deb.stat().st_size))
+    with SyntheticRepoServer(repo.root) as server:
+        with pytest.raises(HashInvalid) as exc_info:
+            verify_hash_sums(server.url)
+    references = exc_info.value.file_mentioned_by.split(", ")
+    assert sorted(reference.split("/dists/")[1] for reference in references) == [
+        f"{suite}/main/binary-{arch}/Packages"
+        for suite in ("stable", "testing")
+        for arch in ("amd64", "arm64")
+    ]
+
+
+def test_verify_large_artifact_in_constant_memory(tmp_path):
+    # a multi-GB deb with PYTEST_LONGTESTS, still far above the RSS cap without
+    deb_size = 4 * 2**30 if os.getenv("PYTEST_LONGTESTS", "") else 256 * 2**20
+    config = SyntheticRepoConfig(
+        packages_per_index=1, deb_size=deb_size, sparse_debs=True
+    )
+    repo = generate_repo(tmp_path / "repo", config)
+    with SyntheticRepoServer(repo.root) as server:
+        result = benchmark.run_benchmark(
+            "large artifact", server, benchmark.verify_hashes, server.url
+        )
+    assert result.bytes >= deb_size
+    assert result.peak_rss < 150 * 1024
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+import os
+
+import pytest
+from synthetic import (
+    SyntheticRepoConfig,
+    SyntheticRepoServer,
+    generate_repo,
+    update_index,
+)
+
+from debian_repo_scrape.diff import ChangeTypes, PackageChange
+from debian_repo_scrape.exc import SHA256Invalid, SignatureInvalid
+from debian_repo_scrape.scrape import scrape_repo
+from debian_repo_scrape.watch import RepoWatcher
+
+PACKAGES = "main/binary-amd64/Packages"
+
+
+@pytest.fixture()
+def watched_repo(tmp_path, signing_key):
+    config = SyntheticRepoConfig(
+        suites=["stable", "testing"],
+        components=["main", "contrib"],
+        packages_per_index=3,
+        compressions=[""],
+    )
+    repo = generate_repo(tmp_path / "repo", config, signing_key)
+    with SyntheticRepoServer(repo.root) as server:
+        yield repo, server
+
+
+def upload(repo, signing_key, suite: str = "stable"):
+    """Update pkg0, remove pkg1 and add pkg3 to main/binary-amd64"""
+    path = repo.root / "dists" / suite / PACKAGES
+    stanzas = path.read_text().rstrip("\n").split("\n\n")
+    stanzas = [
+        stanzas[0].replace("Version: 1.0", "Version: 1.1"),
+        stanzas[2],
+        stanzas[2].replace("pkg2", "pkg3"),
+    ]
+    update_index(repo, suite, PACKAGES, "\n\n".join(stanzas).encode(), signing_key)
+
+
+@pytest.mark.parametrize("in_release_first", [False, True])
+def test_watch(watched_repo, signing_key, request_recorder, in_release_first: bool):
+    repo, server = watched_repo
+    events: list[PackageChange] = []
+    watcher = RepoWatcher(
+        server.url,
+        str(repo.root / "public_key.asc"),
+        in_release_first=in_release_first,
+        on_event=events.append,
+    )
+    assert watcher.poll() == []
+    assert watcher.repository == scrape_repo(server.url, b"", verify=False)
+
+    with request_recorder:
+        for _ in range(3):
+            assert watcher.poll() == []
+    # steady state polling costs one conditional request per suite
+    assert [event.status_code for event in request_recorder.events] == [304] * 6
+
+    upload(repo, signing_key)
+    with request_recorder:
+        assert watcher.poll() == events
+    assert request_recorder.urls("/Packages$") == [
+        f"{server.url}dists/stable/{PACKAGES}"
+    ]
+    # the polled Release file is scraped, it isn't fetched again
+    release = "InRelease" if in_release_first else "Release"
+    assert sorted(request_recorder.urls(f"/{release}$")) == [
+        f"{server.url.rstrip('/')}/dists/{suite}/{release}"
+        for suite in ("stable", "testing")
+    ]
+    assert {(event.type, event.package.name) for event in events} == {
+        (ChangeTypes.UPDATED, "pkg0"),
+        (ChangeTypes.REMOVED, "pkg1"),
+        (ChangeTypes.ADDED, "pkg3"),
+    }
+    assert {(event.suite, event.component) for event in events} == {("stable", "main")}
+    updated = next(event for event in events if event.type == ChangeTypes.UPDATED)
+    assert updated.package.version == "1.1"
+    assert updated.previous is not None and updated.previous.version == "1.0"
+    assert watcher.repository == scrape_repo(server.url, b"", verify=False)
+    assert watcher.poll() == []
+
+
+def test_watch_in_release_fallback(watched_repo, signing_key, request_recorder):
+    repo, server = watched_repo
+    os.remove(repo.root / "dists" / "testing" / "InRelease")
+    watcher = RepoWatcher(
+        server.url, str(repo.root / "public_key.asc"), in_release_first=True
+    )
+    watcher.start()
+    assert watcher.repository == scrape_repo(server.url, b"", verify=False)
+
+    upload(repo, signing_key, "testing")
+    os.remove(repo.root / "dists" / "testing" / "InRelease")
+    with request_recorder:
+        events = watcher.poll()
+    assert {(event.suite, event.package.name) for event in events} == {
+        ("testing", "pkg0"),
+        ("testing", "pkg1"),
+        ("testing", "pkg3"),
+    }
+    assert sorted(request_recorder.urls(r"/(In)?Release(\.gpg)?$")) == [
+        f"{server.url.rstrip('/')}/dists/{path}"
+        for path in ("stable/InRelease", "testing/Release", "testing/Release.gpg")
+    ]
+
+
+def test_watch_signature(watched_repo):
+    repo, server = watched_repo
+    watcher = RepoWatcher(server.url, str(repo.root / "public_key.asc"))
+    watcher.start()
+    update_index(repo, "stable", PACKAGES, b"Package: unsigned\n")
+    with pytest.raises(SignatureInvalid):
+        watcher.poll()
+
+
+def test_watch_hash_sums(watched_repo, signing_key):
+    repo, server = watched_repo
+    watcher = RepoWatcher(server.url, str(repo.root / "public_key.asc"))
+    watcher.start()
+    upload(repo, signing_key)
+    # the Packages file changes after the Release file was signed
+    (repo.root / "dists" / "stable" / PACKAGES).write_bytes(b"Package: evil\n")
+    with pytest.raises(SHA256Invalid):
+        watcher.poll()
+
+
+def test_watch_async(watched_repo, signing_key):
+    repo, server = watched_repo
+    watcher = RepoWatcher(server.url, interval=0.01, components=["main"])
+    watcher.start()
+    upload(repo, signing_key, "testing")
+
+    async def collect() -> list[PackageChange]:
+        events: list[PackageChange] = []
+        async for event in watcher:
+            events.append(event)
+            if len(events) == 3:
+                return events
+        return events  # pragma: no cover
+
+    events = asyncio.run(asyncio.wait_for(collect(), 30))
+    assert {(event.suite, event.type) for event in events} == {
+        ("testing", ChangeTypes.UPDATED),
+        ("testing", ChangeTypes.REMOVED),
+        ("testing", ChangeTypes.ADDED),
+    }
+    assert {suite.name for suite in watcher.repository.suites} == {
+        "stable",
+        "testing",
+    }
+    assert {
+        component.name
+        for suite in watcher.repository.suites
+        for component in suite.components
+    } == {"main"}